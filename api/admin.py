@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.gis.admin import OSMGeoAdmin
 from .models import (
     Barber, WorkingHours, Appointment, Review, 
-    BarberPortfolio, Service, BarberService
+    BarberPortfolio, Service, BarberService, SlowQuery
 )
 
 # Register your models here.
@@ -58,3 +58,25 @@ class BarberServiceAdmin(admin.ModelAdmin):
     list_display = ('barber', 'service', 'price_adjustment', 'is_active')
     list_filter = ('is_active', 'created_at')
     search_fields = ('barber__user__username', 'service__name')
+
+
+@admin.register(SlowQuery)
+class SlowQueryAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'duration_ms', 'database', 'view', 'short_sql', 'has_plan')
+    list_filter = ('database', 'created_at')
+    search_fields = ('sql', 'view')
+    readonly_fields = ('created_at', 'database', 'duration_ms', 'view', 'sql', 'params_shape', 'stack', 'plan')
+
+    @admin.display(description='SQL')
+    def short_sql(self, obj):
+        return obj.sql[:120]
+
+    @admin.display(boolean=True, description='EXPLAIN')
+    def has_plan(self, obj):
+        return bool(obj.plan)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
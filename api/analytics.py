@@ -0,0 +1,135 @@
+"""
+Barber analytics from daily rollups.
+
+BarberDailyStats holds one row per barber and day with the day's bookings,
+completed and cancelled counts, estimated revenue and bookings per start hour.
+Appointment writes refresh the rows of the days they touch after the
+transaction commits, and rebuild_barber_stats recomputes everything in
+batches. Dashboard reads only touch the rollup rows of the requested range.
+
+Revenue is estimated from the barber's current price (price_adjustment) of the
+appointment's service; cancelled appointments don't count.
+"""
+from collections import Counter
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, DecimalField, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, ExtractHour
+
+from .models import Appointment, BarberDailyStats, BarberService
+
+NOT_CANCELLED = ~Q(status='cancelled')
+
+
+def _compute(barber_id, dates=None, date_range=None):
+    """Rollup rows for the given dates (or date range) computed from Appointment"""
+    appointments = Appointment.objects.filter(barber_id=barber_id)
+    if dates is not None:
+        appointments = appointments.filter(date__in=dates)
+    if date_range is not None:
+        appointments = appointments.filter(date__range=date_range)
+
+    price = BarberService.objects.filter(
+        barber_id=OuterRef('barber_id'), service__name=OuterRef('service')
+    ).values('price_adjustment')[:1]
+    days = appointments.order_by().values('date').annotate(
+        total=Count('id'),
+        done=Count('id', filter=Q(status='completed')),
+        cancelled_count=Count('id', filter=Q(status='cancelled')),
+        revenue=Coalesce(
+            Sum(Subquery(price), filter=NOT_CANCELLED),
+            Value(Decimal('0')),
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+    )
+    hours = (
+        appointments.filter(NOT_CANCELLED).order_by()
+        .values('date', hour=ExtractHour('start_time')).annotate(total=Count('id'))
+    )
+
+    hourly = {}
+    for row in hours:
+        hourly.setdefault(row['date'], {})[str(row['hour'])] = row['total']
+    return [
+        BarberDailyStats(
+            barber_id=barber_id,
+            date=row['date'],
+            bookings=row['total'],
+            completed=row['done'],
+            cancelled=row['cancelled_count'],
+            revenue_estimate=row['revenue'],
+            hourly_bookings=hourly.get(row['date'], {}),
+        )
+        for row in days
+    ]
+
+
+def _store(barber_id, rows, stale):
+    """Upsert the computed rows and drop the stale days that no longer have appointments"""
+    with transaction.atomic():
+        BarberDailyStats.objects.filter(barber_id=barber_id).filter(stale).exclude(
+            date__in=[row.date for row in rows]
+        ).delete()
+        BarberDailyStats.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['barber', 'date'],
+            update_fields=['bookings', 'completed', 'cancelled', 'revenue_estimate', 'hourly_bookings', 'updated_at'],
+        )
+
+
+def refresh_days(barber_id, dates):
+    """Recompute the barber's rollups for the given dates"""
+    dates = set(dates)
+    if dates:
+        _store(barber_id, _compute(barber_id, dates=dates), Q(date__in=dates))
+
+
+def rebuild(barber_id, batch_days=90):
+    """Recompute all of a barber's rollups, batch_days at a time"""
+    bounds = Appointment.objects.filter(barber_id=barber_id).order_by('date').values_list('date', flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        BarberDailyStats.objects.filter(barber_id=barber_id).delete()
+        return
+    BarberDailyStats.objects.filter(barber_id=barber_id).exclude(date__range=(first, last)).delete()
+    start = first
+    while start <= last:
+        end = min(start + timedelta(days=batch_days - 1), last)
+        _store(barber_id, _compute(barber_id, date_range=(start, end)), Q(date__range=(start, end)))
+        start = end + timedelta(days=1)
+
+
+def summary(barber_id, start, end):
+    """Dashboard figures for start..end (inclusive), read from the rollups only"""
+    rows = {row.date: row for row in BarberDailyStats.objects.filter(barber_id=barber_id, date__range=(start, end))}
+    daily = []
+    hourly = Counter()
+    totals = {'bookings': 0, 'completed': 0, 'cancelled': 0, 'revenue_estimate': Decimal('0')}
+    date = start
+    while date <= end:
+        row = rows.get(date)
+        day = {
+            'date': date.isoformat(),
+            'bookings': row.bookings if row else 0,
+            'completed': row.completed if row else 0,
+            'cancelled': row.cancelled if row else 0,
+            'revenue_estimate': row.revenue_estimate if row else Decimal('0'),
+        }
+        daily.append(day)
+        for key in totals:
+            totals[key] += day[key]
+        if row:
+            hourly.update({int(hour): count for hour, count in row.hourly_bookings.items()})
+        date += timedelta(days=1)
+
+    totals['cancellation_rate'] = round(totals['cancelled'] / totals['bookings'], 4) if totals['bookings'] else 0
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'totals': totals,
+        'daily': daily,
+        'busiest_hours': [{'hour': hour, 'bookings': count} for hour, count in hourly.most_common()],
+    }
@@ -2,24 +2,31 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.backends import ModelBackend
 from django.db.models import Q
 
+
+def get_login_user(identifier):
+    """
+    Fetch the account for a login identifier (username or email, any case).
+
+    The UPPER() comparisons generated for __iexact are served by the functional
+    indexes from migration 0017, and the barber profile and category are joined
+    in so the token response needs no further queries. Emails are not unique,
+    so the oldest matching account wins. Returns None if nothing matches.
+    """
+    UserModel = get_user_model()
+    return UserModel.objects.filter(
+        Q(username__iexact=identifier) | Q(email__iexact=identifier)
+    ).select_related('barber_profile__category').order_by('pk').first()
+
+
 class EmailOrUsernameModelBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
         if username is None or password is None:
             return None
             
-        UserModel = get_user_model()
-        
-        try:
-            # Try to fetch the user by username or email
-            user = UserModel.objects.get(
-                Q(username__iexact=username) | Q(email__iexact=username)
-            )
-            
-            if user.check_password(password):
-                return user
-                
-        except UserModel.DoesNotExist:
-            return None
+        # Try to fetch the user by username or email
+        user = get_login_user(username)
+        if user is not None and user.check_password(password):
+            return user
             
         return None
 
@@ -28,4 +35,4 @@ class EmailOrUsernameModelBackend(ModelBackend):
         try:
             return UserModel.objects.get(pk=user_id)
         except UserModel.DoesNotExist:
-            return None 
\ No newline at end of file
+            return None 
@@ -0,0 +1,116 @@
+"""
+Helpers shared by the bench_* management commands.
+
+Benchmarks run against the configured database. Anything they seed is
+created inside rolled_back(), so no benchmark data is left behind.
+"""
+import gc
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+@contextmanager
+def rolled_back():
+    """Run the block in a transaction that is always rolled back"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@contextmanager
+def measure():
+    """Wall-clock and process CPU (user + system) seconds spent in the block"""
+    result = {}
+    start_usage = resource.getrusage(resource.RUSAGE_SELF)
+    start = time.perf_counter()
+    yield result
+    result['wall'] = time.perf_counter() - start
+    end_usage = resource.getrusage(resource.RUSAGE_SELF)
+    result['cpu'] = (
+        (end_usage.ru_utime - start_usage.ru_utime)
+        + (end_usage.ru_stime - start_usage.ru_stime)
+    )
+
+
+@contextmanager
+def traced_memory():
+    """
+    Bytes allocated by Python in the block: the peak, and what is still
+    allocated after a garbage collection once it finishes. tracemalloc must be
+    tracing, and the block must drop its own references to what it built.
+    """
+    result = {}
+    gc.collect()
+    start = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    yield result
+    result['peak'] = tracemalloc.get_traced_memory()[1] - start
+    gc.collect()
+    result['retained'] = tracemalloc.get_traced_memory()[0] - start
+
+
+def write_table(stdout, headers, rows):
+    """Write rows as a left-aligned text table"""
+    rows = [[str(value) for value in row] for row in rows]
+    widths = [max(len(str(header)), *(len(row[i]) for row in rows)) for i, header in enumerate(headers)]
+    stdout.write('  '.join(str(header).ljust(width) for header, width in zip(headers, widths)))
+    stdout.write('  '.join('-' * width for width in widths))
+    for row in rows:
+        stdout.write('  '.join(value.ljust(width) for value, width in zip(row, widths)))
+
+
+def seed_barbers(count, prefix='bench'):
+    """
+    Create `count` located barbers with a category, three services and a full
+    week of working hours each. Call inside rolled_back().
+    """
+    import random
+    from datetime import time
+    from decimal import Decimal
+
+    from django.contrib.auth.models import User
+    from django.contrib.gis.geos import Point
+
+    from .models import Barber, BarberService, ProfessionalCategory, Service, WorkingHours
+
+    rng = random.Random(count)
+    category, _ = ProfessionalCategory.objects.get_or_create(
+        slug=f'{prefix}-category',
+        defaults={'name': 'Benchmark', 'description': 'Benchmark category'},
+    )
+    services = Service.objects.bulk_create([
+        Service(name=f'{prefix} service {i}', base_price=Decimal('20.00') + i * 5, duration_minutes=30 + i * 15)
+        for i in range(3)
+    ])
+    users = User.objects.bulk_create([
+        User(username=f'{prefix}_barber_{i}', first_name='Bench', last_name=f'Barber {i}', email=f'{prefix}_{i}@example.com')
+        for i in range(count)
+    ])
+    barbers = Barber.objects.bulk_create([
+        Barber(
+            user=user,
+            category=category,
+            bio='Benchmark barber',
+            years_of_experience=rng.randint(0, 30),
+            location=Point(-73.9 + rng.uniform(-0.5, 0.5), 40.7 + rng.uniform(-0.5, 0.5), srid=4326),
+            address=f'{i} Benchmark Street',
+            price_range_min=Decimal('15.00'),
+            price_range_max=Decimal('60.00'),
+        )
+        for i, user in enumerate(users)
+    ])
+    BarberService.objects.bulk_create([
+        BarberService(barber=barber, service=service, price_adjustment=Decimal(rng.randint(0, 1000)) / 100)
+        for barber in barbers
+        for service in services
+    ])
+    WorkingHours.objects.bulk_create([
+        WorkingHours(barber=barber, day=day, start_time=time(9), end_time=time(17))
+        for barber in barbers
+        for day, _ in WorkingHours.DAYS_OF_WEEK
+    ])
+    return barbers
@@ -0,0 +1,173 @@
+"""
+The customer-facing booking page of a barber, built as one payload.
+
+The profile, active services, weekly hours, first portfolio page, rating
+summary and the next BOOKING_PAGE_DAYS days of open slots come from a fixed
+set of queries, independent of how many services, posts, reviews or
+appointments the barber has. The payload is cached per barber and version
+(see api/cache.py) for BOOKING_PAGE_CACHE_SECONDS, when the cache is shared by
+the workers.
+"""
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+from django.utils import timezone
+
+from .cache import barber_key, shared_cache
+from .metrics import record_cache
+from .models import Appointment, Barber, BarberPortfolio, BarberService, Review, WorkingHours
+from .serializers import BarberPortfolioSerializer, BarberServiceSerializer, WorkingHoursSerializer
+
+SLOT_MINUTES = 30
+
+# Appointments in these states block their time slot
+BLOCKING_STATUSES = ('scheduled', 'confirmed')
+
+WEEKDAYS = [day for day, _ in WorkingHours.DAYS_OF_WEEK]
+
+
+def available_slots(date, hours, appointments, slot_minutes=SLOT_MINUTES):
+    """
+    Open slots of a working day as (start_time, end_time) pairs; `appointments`
+    are the (start_time, end_time) pairs already booked on that date
+    """
+    slots = []
+    current = datetime.combine(date, hours.start_time)
+    day_end = datetime.combine(date, hours.end_time)
+    step = timedelta(minutes=slot_minutes)
+    while current + step <= day_end:
+        slot_start, slot_end = current.time(), (current + step).time()
+        if not any(slot_start < end and slot_end > start for start, end in appointments):
+            slots.append((slot_start, slot_end))
+        current += step
+    return slots
+
+
+def working_hours_for(date, working_hours):
+    """The selected working hours covering a date's weekday, or None"""
+    day = WEEKDAYS[date.weekday()]
+    for hours in working_hours:
+        if hours.day == day and hours.is_selected:
+            return hours
+    return None
+
+
+def _rating_summary(barber):
+    distribution = {rating: 0 for rating in range(1, 6)}
+    for rating, count in Review.objects.filter(barber=barber).values_list('rating').annotate(count=Count('id')).order_by():
+        distribution[rating] = count
+    total = sum(distribution.values())
+    average = sum(rating * count for rating, count in distribution.items()) / total if total else 0
+    return {
+        'average_rating': round(average, 2),
+        'total_reviews': total,
+        'distribution': {str(rating): count for rating, count in distribution.items()},
+    }
+
+
+def _availability(barber, working_hours, today):
+    days = [today + timedelta(days=offset) for offset in range(settings.BOOKING_PAGE_DAYS)]
+    booked = {}
+    for date, start_time, end_time in Appointment.objects.filter(
+        barber=barber,
+        date__range=(days[0], days[-1]),
+        status__in=BLOCKING_STATUSES,
+    ).values_list('date', 'start_time', 'end_time'):
+        booked.setdefault(date, []).append((start_time, end_time))
+
+    accepting = barber.is_available and not barber.is_paused
+    availability = []
+    for date in days:
+        hours = working_hours_for(date, working_hours) if accepting else None
+        slots = available_slots(date, hours, booked.get(date, [])) if hours else []
+        availability.append({
+            'date': date.isoformat(),
+            'slots': [
+                {'start_time': start.strftime('%H:%M'), 'end_time': end.strftime('%H:%M')}
+                for start, end in slots
+            ],
+        })
+    return availability
+
+
+def build_booking_page(barber_id, request=None):
+    """The booking page payload, or None when the barber does not exist"""
+    barber = Barber.objects.select_related('user', 'category').filter(pk=barber_id).first()
+    if barber is None:
+        return None
+
+    context = {'request': request}
+    services = BarberService.objects.filter(barber=barber, is_active=True).select_related('service')
+    working_hours = list(WorkingHours.objects.filter(barber=barber))
+    portfolio = (
+        BarberPortfolio.objects.filter(barber=barber, parent__isnull=True)
+        .prefetch_related('group_images')[:settings.REST_FRAMEWORK['PAGE_SIZE']]
+    )
+    today = timezone.localdate()
+
+    profile_image = None
+    if barber.profile_image:
+        profile_image = request.build_absolute_uri(barber.profile_image.url) if request else barber.profile_image.url
+
+    return {
+        'generated_for': today.isoformat(),
+        'profile': {
+            'id': barber.id,
+            'name': barber.full_name,
+            'profile_image': profile_image,
+            'bio': barber.bio,
+            'years_of_experience': barber.years_of_experience,
+            'address': barber.address,
+            'latitude': barber.latitude,
+            'longitude': barber.longitude,
+            'price_range_min': barber.price_range_min,
+            'price_range_max': barber.price_range_max,
+            'category': {
+                'id': barber.category.id,
+                'name': barber.category.name,
+                'slug': barber.category.slug,
+            } if barber.category else None,
+            'is_available': barber.is_available,
+            'is_paused': barber.is_paused,
+        },
+        'services': BarberServiceSerializer(services, many=True, context=context).data,
+        'working_hours': WorkingHoursSerializer(working_hours, many=True, context=context).data,
+        'portfolio': BarberPortfolioSerializer(portfolio, many=True, context=context).data,
+        'rating': _rating_summary(barber),
+        'availability': _availability(barber, working_hours, today),
+    }
+
+
+def _drop_elapsed_slots(page):
+    """Remove today's slots that have already started from a cached page"""
+    now = timezone.localtime()
+    today, current_time = now.date().isoformat(), now.strftime('%H:%M')
+    availability = []
+    for day in page['availability']:
+        if day['date'] < today:
+            continue
+        if day['date'] == today:
+            day = {**day, 'slots': [slot for slot in day['slots'] if slot['start_time'] > current_time]}
+        availability.append(day)
+    return {**page, 'availability': availability}
+
+
+def booking_page(barber_id, request=None):
+    """The booking page payload, from the cache when possible"""
+    if not shared_cache():
+        # Other workers wouldn't see the version bumps, and would serve stale slots
+        page = build_booking_page(barber_id, request)
+        return _drop_elapsed_slots(page) if page is not None else None
+
+    key = barber_key('booking_page', barber_id, request.get_host() if request else '')
+    page = cache.get(key)
+    hit = page is not None and page['generated_for'] == timezone.localdate().isoformat()
+    record_cache('booking_page', hit)
+    if not hit:
+        page = build_booking_page(barber_id, request)
+        if page is None:
+            return None
+        cache.set(key, page, settings.BOOKING_PAGE_CACHE_SECONDS)
+    return _drop_elapsed_slots(page)
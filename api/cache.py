@@ -0,0 +1,86 @@
+"""
+Cached API payloads.
+
+Per-barber payloads are stored under keys that include a version number kept
+in the cache. Any change to the barber's data bumps the version (after the
+transaction commits), so stale entries are never read again and simply expire.
+That only works when every worker sees the bump, so per-barber payloads are
+only cached in a cache shared by the workers (Redis, see REDIS_URL); with the
+per-process default they are built on every request.
+
+The catalogue shared by everyone (active professional categories, service
+template durations) is cached whole and dropped when it changes. Workers get
+it primed at boot by api.warmup.
+"""
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+from .metrics import record_cache
+
+CATEGORIES_KEY = 'catalog:active_categories'
+SERVICE_DURATIONS_KEY = 'catalog:service_durations'
+
+
+def shared_cache():
+    """Whether the default cache is shared by all workers, rather than kept per process"""
+    return not isinstance(caches['default'], (LocMemCache, DummyCache))
+
+
+def _version_key(barber_id):
+    return f'barber_cache_version:{barber_id}'
+
+
+def barber_cache_version(barber_id):
+    return cache.get_or_set(_version_key(barber_id), 1, None)
+
+
+def bump_barber_cache_version(barber_id):
+    """Invalidate every cached payload of the barber"""
+    try:
+        cache.incr(_version_key(barber_id))
+    except ValueError:
+        # No version stored yet, so nothing was cached under it either
+        cache.set(_version_key(barber_id), 1, None)
+
+
+def barber_key(prefix, barber_id, *parts):
+    """Cache key of a per-barber payload at the barber's current version"""
+    return ':'.join(str(part) for part in (prefix, barber_id, barber_cache_version(barber_id), *parts))
+
+
+def _get_or_load(name, key, load):
+    """A catalogue entry, loaded and cached on a miss"""
+    value = cache.get(key)
+    record_cache(name, value is not None)
+    if value is None:
+        value = load()
+        cache.set(key, value, settings.CATALOG_CACHE_SECONDS)
+    return value
+
+
+def active_categories():
+    """Serialized active professional categories"""
+    def load():
+        from .models import ProfessionalCategory
+        from .serializers import ProfessionalCategorySerializer
+        return list(ProfessionalCategorySerializer(ProfessionalCategory.objects.filter(is_active=True), many=True).data)
+
+    return _get_or_load('categories', CATEGORIES_KEY, load)
+
+
+def service_durations():
+    """Default duration in minutes of every service template, by name"""
+    def load():
+        from .models import Service
+        durations = {}
+        for name, minutes in Service.objects.order_by('id').values_list('name', 'duration_minutes'):
+            durations.setdefault(name, minutes)
+        return durations
+
+    return _get_or_load('service_durations', SERVICE_DURATIONS_KEY, load)
+
+
+def invalidate_catalog():
+    cache.delete_many([CATEGORIES_KEY, SERVICE_DURATIONS_KEY])
@@ -0,0 +1,151 @@
+"""
+Grid-based clustering of barber locations for zoomed-out map views.
+
+Every zoom level between BARBER_CLUSTER_MIN_ZOOM and BARBER_CLUSTER_MAX_ZOOM
+splits the map into square cells (BARBER_CLUSTER_CELLS_PER_TILE cells across
+each map tile). The count, centroid and category mix of the discoverable
+barbers in every non-empty cell are aggregated in PostGIS and stored in
+BarberCluster, so a map request only reads the handful of cells inside its
+bounding box. When a barber moves, pauses or resumes only the cells they left
+and entered are recomputed.
+"""
+import math
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.gis.geos import Point
+from django.db import connection, transaction
+from django.db.models import Q
+
+from .models import Barber, BarberCluster
+
+
+_AGGREGATE_SQL = """
+    SELECT FLOOR(ST_X(b.location::geometry) / %s)::integer AS cell_x,
+           FLOOR(ST_Y(b.location::geometry) / %s)::integer AS cell_y,
+           b.category_id,
+           COUNT(*),
+           SUM(ST_X(b.location::geometry)),
+           SUM(ST_Y(b.location::geometry))
+    FROM {table} b
+    WHERE b.location IS NOT NULL
+      AND b.is_paused = false
+      AND b.is_available = true{extra}
+    GROUP BY 1, 2, 3
+"""
+
+
+def cluster_zooms():
+    """Zoom levels that have precomputed clusters"""
+    return range(settings.BARBER_CLUSTER_MIN_ZOOM, settings.BARBER_CLUSTER_MAX_ZOOM + 1)
+
+
+def cell_size(zoom):
+    """Width of a grid cell in degrees at the given zoom level"""
+    return 360.0 / (2 ** zoom * settings.BARBER_CLUSTER_CELLS_PER_TILE)
+
+
+def cell_for(zoom, lng, lat):
+    """Grid cell containing a coordinate; matches the FLOOR() used in PostGIS"""
+    size = cell_size(zoom)
+    return math.floor(lng / size), math.floor(lat / size)
+
+
+def cluster_state(barber):
+    """
+    The parts of a barber that decide which cluster cells they count towards,
+    or None when they are not discoverable. Reads the instance dict directly
+    so deferred fields are never loaded.
+    """
+    fields = barber.__dict__
+    location = fields.get('location')
+    if location is None or fields.get('is_paused') or not fields.get('is_available', True):
+        return None
+    return (location.x, location.y, fields.get('category_id'))
+
+
+def cells_for_state(state):
+    """All (zoom, cell_x, cell_y) cells a barber in the given state belongs to"""
+    if state is None:
+        return set()
+    lng, lat, _ = state
+    return {(zoom, *cell_for(zoom, lng, lat)) for zoom in cluster_zooms()}
+
+
+def _aggregate(zoom, extra='', params=()):
+    """Run the cell aggregate for one zoom level, keyed by (cell_x, cell_y)"""
+    size = cell_size(zoom)
+    sql = _AGGREGATE_SQL.format(table=Barber._meta.db_table, extra=extra)
+    cells = defaultdict(lambda: {'count': 0, 'sum_x': 0.0, 'sum_y': 0.0, 'categories': {}})
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [size, size, *params])
+        for cell_x, cell_y, category_id, count, sum_x, sum_y in cursor.fetchall():
+            cell = cells[(cell_x, cell_y)]
+            cell['count'] += count
+            cell['sum_x'] += sum_x
+            cell['sum_y'] += sum_y
+            key = str(category_id) if category_id is not None else 'none'
+            cell['categories'][key] = cell['categories'].get(key, 0) + count
+    return cells
+
+
+def _build_clusters(zoom, cells):
+    return [
+        BarberCluster(
+            zoom=zoom,
+            cell_x=cell_x,
+            cell_y=cell_y,
+            count=cell['count'],
+            centroid=Point(cell['sum_x'] / cell['count'], cell['sum_y'] / cell['count'], srid=4326),
+            category_counts=cell['categories'],
+        )
+        for (cell_x, cell_y), cell in cells.items()
+    ]
+
+
+def refresh_cells(cells):
+    """Recompute the given (zoom, cell_x, cell_y) cells from the barber table"""
+    by_zoom = defaultdict(set)
+    for zoom, cell_x, cell_y in cells:
+        by_zoom[zoom].add((cell_x, cell_y))
+
+    with transaction.atomic():
+        for zoom, coords in by_zoom.items():
+            size = cell_size(zoom)
+            envelopes = []
+            params = []
+            for cell_x, cell_y in coords:
+                # Bounding-box prefilter so the location index is used; the exact
+                # cell membership is decided by the FLOOR() grouping
+                envelopes.append('b.location && ST_MakeEnvelope(%s, %s, %s, %s, 4326)::geography')
+                params.extend([cell_x * size, cell_y * size, (cell_x + 1) * size, (cell_y + 1) * size])
+            extra = ' AND (' + ' OR '.join(envelopes) + ')'
+            aggregated = {
+                key: cell for key, cell in _aggregate(zoom, extra, params).items()
+                if key in coords
+            }
+
+            stale = Q()
+            for cell_x, cell_y in coords:
+                stale |= Q(cell_x=cell_x, cell_y=cell_y)
+            BarberCluster.objects.filter(stale, zoom=zoom).delete()
+            BarberCluster.objects.bulk_create(_build_clusters(zoom, aggregated))
+
+
+def rebuild_clusters(zooms=None):
+    """Recompute every cluster cell for the given zoom levels (all by default)"""
+    for zoom in zooms or cluster_zooms():
+        with transaction.atomic():
+            BarberCluster.objects.filter(zoom=zoom).delete()
+            BarberCluster.objects.bulk_create(_build_clusters(zoom, _aggregate(zoom)), batch_size=1000)
+
+
+def clusters_in_bbox(zoom, min_lng, min_lat, max_lng, max_lat):
+    """Precomputed clusters whose cell overlaps the bounding box"""
+    min_x, min_y = cell_for(zoom, min_lng, min_lat)
+    max_x, max_y = cell_for(zoom, max_lng, max_lat)
+    return BarberCluster.objects.filter(
+        zoom=zoom,
+        cell_x__range=(min_x, max_x),
+        cell_y__range=(min_y, max_y),
+    )
@@ -0,0 +1,173 @@
+"""
+Read-replica routing for API GET traffic.
+
+ReplicaRoutingMiddleware decides per request which database reads go to, and
+ReplicaRouter applies that decision. Reads go to a replica only when:
+
+- the request is a safe-method (GET/HEAD/OPTIONS) request under /api/ that
+  isn't excluded in REPLICA_EXCLUDED_PATHS;
+- the client hasn't written anything in the last REPLICA_STICKY_SECONDS, so
+  they always read their own writes. Clients are identified by their
+  Authorization header or session cookie. Anonymous writes (login,
+  registration) mark the client IP instead, because the credentials they
+  hand out aren't known yet;
+- the replica is less than REPLICA_MAX_LAG_SECONDS behind the primary.
+  Lag is measured at most every REPLICA_LAG_CHECK_SECONDS per process, and
+  a replica that can't be reached counts as lagging.
+- the default cache is shared by the workers (REDIS_URL). The recent-write
+  markers live there; in a per-process cache another worker wouldn't see
+  them and would serve the client stale rows, so every read stays on the
+  primary.
+
+Everything else, including every write, uses the default (primary) database.
+
+The decision only lasts while the view runs. Querysets evaluated later, as
+the body of a streamed response is generated, must be pinned with
+.using(read_alias()) first.
+"""
+import contextvars
+import hashlib
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DatabaseError, connections
+from rest_framework.throttling import BaseThrottle
+
+from .cache import shared_cache
+
+DEFAULT_DB = 'default'
+
+_read_alias = contextvars.ContextVar('db_read_alias', default=None)
+
+# Replica alias -> (measured at, lag in seconds or None when unreachable)
+_lag_cache = {}
+
+_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+
+def read_alias():
+    """The database reads of the current request go to"""
+    return _read_alias.get() or DEFAULT_DB
+
+
+def replica_lag(alias):
+    """Seconds the replica is behind the primary, or None when it can't be reached"""
+    measured_at, lag = _lag_cache.get(alias, (None, None))
+    now = time.monotonic()
+    if measured_at is None or now - measured_at > settings.REPLICA_LAG_CHECK_SECONDS:
+        try:
+            with connections[alias].cursor() as cursor:
+                cursor.execute(_LAG_SQL)
+                lag = float(cursor.fetchone()[0])
+        except DatabaseError:
+            lag = None
+        _lag_cache[alias] = (now, lag)
+    return lag
+
+
+def healthy_replica():
+    """A random replica within the lag limit, or None"""
+    replicas = list(settings.DATABASE_REPLICAS)
+    random.shuffle(replicas)
+    for alias in replicas:
+        lag = replica_lag(alias)
+        if lag is not None and lag <= settings.REPLICA_MAX_LAG_SECONDS:
+            return alias
+    return None
+
+
+def _sticky_keys(request):
+    """Cache keys marking recent writes: the client's credentials, and their IP when anonymous"""
+    credentials = request.META.get('HTTP_AUTHORIZATION') or request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    ip_key = 'db_sticky_ip:' + BaseThrottle().get_ident(request)
+    if not credentials:
+        return None, ip_key
+    return 'db_sticky:' + hashlib.sha256(credentials.encode()).hexdigest(), ip_key
+
+
+def is_replica_eligible(request):
+    return (
+        request.method in ('GET', 'HEAD', 'OPTIONS')
+        and request.path.startswith('/api/')
+        and not any(request.path.startswith(path) for path in settings.REPLICA_EXCLUDED_PATHS)
+    )
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _choose_alias(self, request):
+        credentials_key, ip_key = _sticky_keys(request)
+        if not is_replica_eligible(request) or not shared_cache():
+            return None
+        if cache.get_many([key for key in (credentials_key, ip_key) if key]):
+            return None
+        return healthy_replica()
+
+    def _mark_write(self, request):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS'):
+            credentials_key, ip_key = _sticky_keys(request)
+            cache.set(credentials_key or ip_key, True, settings.REPLICA_STICKY_SECONDS)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        token = _read_alias.set(self._choose_alias(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        self._mark_write(request)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        # The cache and the replica lag check may block
+        token = _read_alias.set(await sync_to_async(self._choose_alias)(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            _read_alias.reset(token)
+        await sync_to_async(self._mark_write)(request)
+        return response
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            # Related objects are read from where their instance came from
+            return instance._state.db
+        return read_alias()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB
@@ -0,0 +1,201 @@
+"""
+Appointment change events for the barber dashboard's server-sent events feed.
+
+Every appointment write appends an AppointmentEvent row and sends a Postgres
+NOTIFY on CHANNEL whose payload is the barber id. NOTIFY is transactional, so
+nothing is announced for writes that roll back. Each worker process holds a
+single LISTEN connection in a background thread and wakes the open feeds of
+the barbers it hears about. The feeds then read the events from the table, so a
+client that reconnects with Last-Event-ID gets everything it missed.
+
+EventSource can't send headers, so browsers open the feed with a short-lived
+signed stream token in the URL rather than their API token, which would end up
+in access logs.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core import signing
+from django.db import connection, connections
+
+from .models import AppointmentEvent
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'appointment_events'
+
+# Most events sent to a feed in one read
+BATCH_SIZE = 200
+
+STREAM_TOKEN_SALT = 'api.events.stream'
+
+
+def appointment_payload(appointment):
+    return {
+        'id': appointment.pk,
+        'customer': appointment.customer,
+        'service': appointment.service,
+        'date': str(appointment.date),
+        'start_time': str(appointment.start_time),
+        'end_time': str(appointment.end_time),
+        'status': appointment.status,
+        'contact_number': appointment.contact_number,
+        'notes': appointment.notes,
+    }
+
+
+def record_event(appointment, event_type):
+    """Log an appointment change and notify the listening workers"""
+    event = AppointmentEvent.objects.create(
+        barber_id=appointment.barber_id,
+        appointment_id=appointment.pk,
+        event_type=event_type,
+        payload=appointment_payload(appointment),
+    )
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, str(event.barber_id)])
+    return event
+
+
+def record_events(appointments, event_type):
+    """record_event for many appointments (e.g. after bulk_create): batched INSERTs, one NOTIFY per barber"""
+    created = AppointmentEvent.objects.bulk_create([
+        AppointmentEvent(
+            barber_id=appointment.barber_id,
+            appointment_id=appointment.pk,
+            event_type=event_type,
+            payload=appointment_payload(appointment),
+        )
+        for appointment in appointments
+    ], batch_size=BATCH_SIZE)
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            for barber_id in {event.barber_id for event in created}:
+                cursor.execute('SELECT pg_notify(%s, %s)', [CHANNEL, str(barber_id)])
+    return created
+
+
+def make_stream_token(barber_id):
+    """A signed token that only opens the feed of this barber, until it expires"""
+    return signing.dumps(barber_id, salt=STREAM_TOKEN_SALT)
+
+
+def read_stream_token(token):
+    """The barber id of a stream token; raises signing.BadSignature if invalid or expired"""
+    return signing.loads(token, salt=STREAM_TOKEN_SALT, max_age=settings.APPOINTMENT_EVENTS_TOKEN_SECONDS)
+
+
+def latest_event_id():
+    """
+    The newest event id of any barber: where a feed without Last-Event-ID
+    starts. A barber's own latest event may be old enough to look pruned.
+    """
+    event_id = AppointmentEvent.objects.order_by('-id').values_list('id', flat=True).first()
+    return event_id or 0
+
+
+def events_since(barber_id, last_event_id):
+    """The barber's events after last_event_id, oldest first, at most BATCH_SIZE"""
+    return list(
+        AppointmentEvent.objects.filter(barber_id=barber_id, id__gt=last_event_id)
+        .order_by('id')[:BATCH_SIZE]
+    )
+
+
+def history_pruned_after(last_event_id):
+    """
+    Whether events newer than last_event_id may already have been pruned, in
+    which case the client has to reload instead of catching up
+    """
+    oldest = AppointmentEvent.objects.order_by('id').values_list('id', flat=True).first()
+    return oldest is not None and oldest > last_event_id + 1
+
+
+def format_event(event):
+    """Encode an event in the text/event-stream format"""
+    data = json.dumps({
+        'event_id': event.id,
+        'type': event.event_type,
+        'appointment_id': event.appointment_id,
+        'appointment': event.payload,
+        'created_at': event.created_at.isoformat(),
+    })
+    return f"id: {event.id}\nevent: {event.event_type}\ndata: {data}\n\n"
+
+
+class NotificationListener:
+    """One LISTEN connection per process, fanning notifications out to open feeds"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._thread = None
+
+    def subscribe(self, barber_id):
+        """An asyncio.Event that is set whenever the barber has new events"""
+        wake = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._subscribers[barber_id].add((loop, wake))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='appointment-events-listener', daemon=True)
+                self._thread.start()
+        return wake
+
+    def unsubscribe(self, barber_id, wake):
+        with self._lock:
+            self._subscribers[barber_id] = {
+                subscriber for subscriber in self._subscribers[barber_id] if subscriber[1] is not wake
+            }
+            if not self._subscribers[barber_id]:
+                del self._subscribers[barber_id]
+
+    def _wake(self, barber_ids=None):
+        with self._lock:
+            if barber_ids is None:
+                subscribers = [s for group in self._subscribers.values() for s in group]
+            else:
+                subscribers = [s for barber_id in barber_ids for s in self._subscribers.get(barber_id, ())]
+        for loop, wake in subscribers:
+            loop.call_soon_threadsafe(wake.set)
+
+    def _connect(self):
+        # LISTEN needs a session of its own, so never through a transaction pooler
+        database = connections[settings.DIRECT_DATABASE]
+        raw = database.get_new_connection(database.get_connection_params())
+        raw.autocommit = True
+        with raw.cursor() as cursor:
+            cursor.execute(f'LISTEN {CHANNEL}')
+        return raw
+
+    def _run(self):
+        while True:
+            raw = None
+            try:
+                raw = self._connect()
+                # Notifications sent while we were disconnected are lost, so let
+                # every feed check the table once
+                self._wake()
+                while True:
+                    if select.select([raw], [], [], 60) == ([], [], []):
+                        continue
+                    raw.poll()
+                    barber_ids = set()
+                    while raw.notifies:
+                        barber_ids.add(int(raw.notifies.pop(0).payload))
+                    self._wake(barber_ids)
+            except Exception:
+                logger.exception('Appointment event listener lost its connection; reconnecting')
+                if raw is not None:
+                    raw.close()
+                time.sleep(1)
+
+
+listener = NotificationListener()
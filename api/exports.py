@@ -0,0 +1,173 @@
+"""
+Appointment exports: a CSV download and a per-barber iCalendar feed.
+
+Both are generated while the response is sent. Rows come from a server-side
+cursor (QuerySet.iterator) and are written STREAMING_CHUNK_SIZE at a time, so
+the full history is never held in memory.
+
+Calendar apps poll the feed every few minutes. Its ETag and Last-Modified are
+computed from one aggregate over the feed's rows plus the latest appointment
+deletion, so unchanged feeds are answered with 304 without reading any rows.
+"""
+import csv
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import Count, Max
+
+from .models import Appointment, SyncTombstone
+
+CSV_COLUMNS = [
+    ('id', 'id'),
+    ('date', 'date'),
+    ('start_time', 'start_time'),
+    ('end_time', 'end_time'),
+    ('customer', 'customer'),
+    ('service', 'service'),
+    ('status', 'status'),
+    ('contact_number', 'contact_number'),
+    ('notes', 'notes'),
+    ('created_at', 'created_at'),
+    ('updated_at', 'updated_at'),
+]
+
+# Free text typed by customers. A spreadsheet would run a value starting with
+# one of FORMULA_PREFIXES as a formula, so such values are quoted with a '.
+CSV_CUSTOMER_TEXT = ('customer', 'notes')
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+ICS_STATUS = {
+    'scheduled': 'TENTATIVE',
+    'confirmed': 'CONFIRMED',
+    'cancelled': 'CANCELLED',
+    'completed': 'CONFIRMED',
+}
+
+
+def parse_date_range(params):
+    """(start, end) dates from ?start=&end= (YYYY-MM-DD, both optional); ValueError if malformed"""
+    start, end = params.get('start'), params.get('end')
+    start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+    end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+    return start, end
+
+
+def appointments_for_export(barber, start=None, end=None):
+    queryset = Appointment.objects.filter(barber=barber)
+    if start:
+        queryset = queryset.filter(date__gte=start)
+    if end:
+        queryset = queryset.filter(date__lte=end)
+    return queryset.order_by('date', 'start_time', 'id')
+
+
+def _batched(lines):
+    """Join the lines of a generator into chunks of STREAMING_CHUNK_SIZE"""
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) == settings.STREAMING_CHUNK_SIZE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+
+class _Echo:
+    """File-like object whose write() returns the line instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_text(value):
+    """A customer-supplied value that spreadsheets won't evaluate as a formula"""
+    if value and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_chunks(queryset):
+    writer = csv.writer(_Echo())
+    fields = [field for _, field in CSV_COLUMNS]
+    text_columns = [fields.index(field) for field in CSV_CUSTOMER_TEXT]
+
+    def lines():
+        yield writer.writerow([header for header, _ in CSV_COLUMNS])
+        for row in queryset.values_list(*fields).iterator(chunk_size=settings.STREAMING_CHUNK_SIZE):
+            row = list(row)
+            for index in text_columns:
+                row[index] = _csv_text(row[index])
+            yield writer.writerow(row)
+
+    return _batched(lines())
+
+
+def _ics_text(value):
+    """Escape a TEXT value (RFC 5545, 3.3.11)"""
+    return (
+        value.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+        .replace('\r\n', '\\n').replace('\n', '\\n')
+    )
+
+
+def _ics_line(line):
+    """Fold a content line at 75 octets (RFC 5545, 3.1)"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while encoded:
+        limit = 75 if not parts else 74
+        cut = min(limit, len(encoded))
+        # Don't split a multi-byte character
+        while cut < len(encoded) and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _ics_utc(moment):
+    return moment.astimezone(dt_timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def ics_chunks(barber, queryset, host):
+    # Appointment times are wall-clock times at the shop, so they are written
+    # as floating times and shown as booked on the subscriber's calendar
+    def lines():
+        yield _ics_line('BEGIN:VCALENDAR')
+        yield _ics_line('VERSION:2.0')
+        yield _ics_line('PRODID:-//SoloApp//Appointments//EN')
+        yield _ics_line('CALSCALE:GREGORIAN')
+        yield _ics_line(f'X-WR-CALNAME:{_ics_text(barber.full_name)} appointments')
+        for appointment in queryset.iterator(chunk_size=settings.STREAMING_CHUNK_SIZE):
+            description = '\n'.join(filter(None, [appointment.contact_number, appointment.notes]))
+            yield _ics_line('BEGIN:VEVENT')
+            yield _ics_line(f'UID:appointment-{appointment.id}@{host}')
+            yield _ics_line(f'DTSTAMP:{_ics_utc(appointment.updated_at)}')
+            yield _ics_line(f'LAST-MODIFIED:{_ics_utc(appointment.updated_at)}')
+            yield _ics_line(f"DTSTART:{datetime.combine(appointment.date, appointment.start_time):%Y%m%dT%H%M%S}")
+            yield _ics_line(f"DTEND:{datetime.combine(appointment.date, appointment.end_time):%Y%m%dT%H%M%S}")
+            yield _ics_line(f'SUMMARY:{_ics_text(f"{appointment.service} - {appointment.customer}")}')
+            if description:
+                yield _ics_line(f'DESCRIPTION:{_ics_text(description)}')
+            yield _ics_line(f'STATUS:{ICS_STATUS.get(appointment.status, "CONFIRMED")}')
+            yield _ics_line('END:VEVENT')
+        yield _ics_line('END:VCALENDAR')
+
+    return _batched(lines())
+
+
+def feed_validators(barber, queryset):
+    """(etag, last_modified) of an export; changes whenever a row is added, edited or deleted"""
+    summary = queryset.order_by().aggregate(count=Count('id'), last_updated=Max('updated_at'))
+    last_deleted = (
+        SyncTombstone.objects.filter(barber=barber, collection='appointments')
+        .aggregate(last=Max('deleted_at'))['last']
+    )
+    state = f"{summary['count']}:{summary['last_updated']}:{last_deleted}"
+    etag = '"%s"' % hashlib.md5(state.encode(), usedforsecurity=False).hexdigest()
+    last_modified = max(filter(None, [summary['last_updated'], last_deleted]), default=None)
+    return etag, last_modified
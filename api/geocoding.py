@@ -0,0 +1,179 @@
+"""
+Address suggestions from public geocoding services.
+
+The lookups are async so that, when served over ASGI, a worker keeps handling
+other requests while it waits on the upstream service. httpx (and the TLS
+stack it pulls in) is imported on the first lookup rather than at worker boot,
+since only the address suggestions endpoint needs it.
+"""
+import math
+import time
+
+from .metrics import GEOCODER_FAILURES, GEOCODER_LATENCY
+
+# Seconds to wait on each geocoding service before trying the next one
+REQUEST_TIMEOUT = 5
+
+# Radius of the location bias around the user's coordinates
+BIAS_RADIUS_KM = 50
+
+
+def _services(query, lat=None, lon=None):
+    """Geocoding services to try in order, with location bias when coordinates are given"""
+    services = [
+        {
+            'name': 'Nominatim',
+            'url': "https://nominatim.openstreetmap.org/search",
+            'params': {
+                'q': query,
+                'format': 'json',
+                'limit': 5,
+                'addressdetails': 1
+            },
+            'headers': {
+                'User-Agent': 'SoloApp/1.0 (https://github.com/your-repo)'
+            }
+        },
+        {
+            'name': 'Photon',
+            'url': "https://photon.komoot.io/api/",
+            'params': {
+                'q': query,
+                'limit': 5
+            },
+            'headers': {}
+        }
+    ]
+
+    if lat and lon:
+        # Add location bias to Nominatim (using viewbox instead of lat/lon for better results)
+        # Calculate a bounding box around the user's location
+        lat_delta = BIAS_RADIUS_KM / 111.32  # Approximate km per degree latitude
+        lon_delta = BIAS_RADIUS_KM / (111.32 * math.cos(math.radians(float(lat))))
+
+        viewbox = [
+            float(lon) - lon_delta,  # min_lon
+            float(lat) - lat_delta,  # min_lat
+            float(lon) + lon_delta,  # max_lon
+            float(lat) + lat_delta   # max_lat
+        ]
+
+        services[0]['params']['viewbox'] = ','.join(map(str, viewbox))
+        services[0]['params']['bounded'] = 1
+
+        # Add location bias to Photon
+        services[1]['params']['lat'] = lat
+        services[1]['params']['lon'] = lon
+        services[1]['params']['radius'] = BIAS_RADIUS_KM * 1000
+
+    return services
+
+
+def _nominatim_suggestions(data):
+    suggestions = []
+    for item in data:
+        address = item.get('address', {})
+
+        # Build clean address components
+        street_number = address.get('house_number', '')
+        street_name = address.get('road', '')
+        city = address.get('city', address.get('town', ''))
+        state = address.get('state', '')
+        zip_code = address.get('postcode', '')
+
+        # Create clean display name
+        clean_address = []
+
+        # Add street address if available
+        if street_number and street_name:
+            clean_address.append(f"{street_number} {street_name}")
+        elif street_name:
+            clean_address.append(street_name)
+
+        # Add city, state and zip code if available
+        if city:
+            clean_address.append(city)
+        if state:
+            clean_address.append(state)
+        if zip_code:
+            clean_address.append(zip_code)
+
+        # If we have a meaningful address, add it
+        if len(clean_address) >= 2:  # At least city and state
+            display_name = ', '.join(clean_address)
+            suggestions.append({
+                'place_id': item.get('place_id'),
+                'display_name': display_name,
+                'lat': float(item.get('lat', 0)),
+                'lon': float(item.get('lon', 0))
+            })
+        # If it's just a city/place name, include it too
+        elif city and state:
+            display_name = f"{city}, {state}"
+            if zip_code:
+                display_name += f", {zip_code}"
+            suggestions.append({
+                'place_id': item.get('place_id'),
+                'display_name': display_name,
+                'lat': float(item.get('lat', 0)),
+                'lon': float(item.get('lon', 0))
+            })
+    return suggestions
+
+
+def _photon_suggestions(data):
+    # Transform Photon format to match Nominatim
+    return [
+        {
+            'place_id': f"photon_{i}",
+            'display_name': feature.get('properties', {}).get('name', ''),
+            'lat': feature.get('geometry', {}).get('coordinates', [0, 0])[1],
+            'lon': feature.get('geometry', {}).get('coordinates', [0, 0])[0]
+        }
+        for i, feature in enumerate(data.get('features', []))
+    ]
+
+
+_TRANSFORMS = {
+    'Nominatim': _nominatim_suggestions,
+    'Photon': _photon_suggestions,
+}
+
+
+async def address_suggestions(query, lat=None, lon=None):
+    """
+    Suggestions from the first geocoding service that answers, or an empty
+    list if every service fails.
+    """
+    import httpx
+
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT) as client:
+        for service in _services(query, lat, lon):
+            started = time.perf_counter()
+            try:
+                response = await client.get(
+                    service['url'],
+                    params=service['params'],
+                    headers=service['headers']
+                )
+            except httpx.HTTPError as exc:
+                GEOCODER_FAILURES.labels(
+                    service=service['name'],
+                    reason='timeout' if isinstance(exc, httpx.TimeoutException) else 'error',
+                ).inc()
+                continue  # Try next service
+            finally:
+                GEOCODER_LATENCY.labels(service=service['name']).observe(time.perf_counter() - started)
+
+            if response.status_code != 200:
+                GEOCODER_FAILURES.labels(service=service['name'], reason=f'http_{response.status_code}').inc()
+                continue
+            try:
+                data = response.json()
+            except ValueError:
+                # e.g. an HTML error page served with a 200
+                GEOCODER_FAILURES.labels(service=service['name'], reason='invalid_json').inc()
+                continue
+            return _TRANSFORMS[service['name']](data)
+
+    return []
@@ -0,0 +1,160 @@
+"""
+Bulk import of existing appointments for shops moving onto the platform.
+
+Rows (CSV or JSON) are validated one by one, but everything that needs the
+database is done per batch: service durations come from one BarberService
+lookup (plus the cached service templates), existing bookings for the imported
+dates from one query, and the new rows are inserted with bulk_create,
+IMPORT_BATCH_SIZE at a time. Overlaps with existing or earlier imported
+appointments are checked in memory. Rows with errors are skipped and reported
+with their row number; the others are imported.
+
+Each batch is committed on its own. Its rows' updated_at is set when the batch
+is inserted, and delta sync (api/sync.py) only looks SYNC_OVERLAP_SECONDS back,
+so one transaction over a large import would commit rows that sync tokens
+issued meanwhile have already passed.
+"""
+import csv
+import io
+import json
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+
+from . import analytics, events
+from .booking import BLOCKING_STATUSES
+from .cache import bump_barber_cache_version, service_durations
+from .metrics import BOOKING_CONFLICTS
+from .models import Appointment, BarberService
+from .serializers import AppointmentImportRowSerializer
+
+# Minutes used when a row has no end time and its service is unknown, as in
+# AppointmentSerializer.create
+DEFAULT_DURATION = 30
+
+
+class ImportFormatError(ValueError):
+    """The upload can't be read as rows at all"""
+
+
+def read_rows(content, fmt):
+    """Rows of an upload as dicts; `content` is str or bytes in 'csv' or 'json'"""
+    if isinstance(content, bytes):
+        try:
+            content = content.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            # e.g. a cp1252 spreadsheet export
+            raise ImportFormatError(f'File must be UTF-8 encoded {fmt.upper()}')
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(content)))
+    if fmt == 'json':
+        try:
+            data = json.loads(content)
+        except ValueError as exc:
+            raise ImportFormatError(f'Invalid JSON: {exc}')
+        return rows_from_data(data)
+    raise ImportFormatError(f'Unsupported format "{fmt}". Use csv or json.')
+
+
+def rows_from_data(data):
+    """Rows from parsed JSON: a list of objects, or {"appointments": [...]}"""
+    if isinstance(data, dict):
+        data = data.get('appointments')
+    if not isinstance(data, list) or not all(isinstance(row, dict) for row in data):
+        raise ImportFormatError('Expected a list of appointment objects.')
+    return data
+
+
+def _durations(barber, service_names):
+    """Minutes per service name, from the barber's services then the templates"""
+    durations = {
+        barber_service.service.name: barber_service.duration
+        for barber_service in BarberService.objects.filter(
+            barber=barber, service__name__in=service_names
+        ).select_related('service')
+    }
+    templates = service_durations()
+    for name in set(service_names) - set(durations):
+        if name in templates:
+            durations[name] = templates[name]
+    return durations
+
+
+def _overlaps(bookings, start_time, end_time):
+    return any(start_time < end and end_time > start for start, end in bookings)
+
+
+def import_appointments(barber, rows, dry_run=False):
+    """
+    Import rows for a barber. Returns {'created': n, 'errors': [{'row': i,
+    'errors': {...}}]}, with rows numbered from 1 in upload order. A dry run
+    creates nothing and reports the rows it would import as 'would_create'.
+    """
+    errors = []
+    valid = []
+    for number, row in enumerate(rows, 1):
+        # Blank CSV cells mean "not given"
+        data = {key: value for key, value in row.items() if key and value not in (None, '')}
+        serializer = AppointmentImportRowSerializer(data=data)
+        if serializer.is_valid():
+            valid.append((number, serializer.validated_data))
+        else:
+            errors.append({'row': number, 'errors': serializer.errors})
+
+    durations = _durations(barber, {data['service'] for _, data in valid if not data.get('end_time')})
+
+    booked = defaultdict(list)
+    dates = {data['date'] for _, data in valid}
+    if dates:
+        for date, start, end in Appointment.objects.filter(
+            barber=barber, date__in=dates, status__in=BLOCKING_STATUSES
+        ).values_list('date', 'start_time', 'end_time'):
+            booked[date].append((start, end))
+
+    appointments = []
+    for number, data in valid:
+        end_time = data.get('end_time')
+        if not end_time:
+            minutes = durations.get(data['service'], DEFAULT_DURATION)
+            end = datetime.combine(data['date'], data['start_time']) + timedelta(minutes=minutes)
+            if end.date() != data['date']:
+                errors.append({'row': number, 'errors': {'start_time': ['Appointment would end after midnight.']}})
+                continue
+            end_time = end.time()
+
+        if data['status'] in BLOCKING_STATUSES:
+            if _overlaps(booked[data['date']], data['start_time'], end_time):
+                errors.append({'row': number, 'errors': {'start_time': ['Overlaps another appointment.']}})
+                if not dry_run:
+                    BOOKING_CONFLICTS.labels(source='import').inc()
+                continue
+            booked[data['date']].append((data['start_time'], end_time))
+
+        appointments.append(Appointment(
+            barber=barber,
+            customer=data['customer'],
+            date=data['date'],
+            start_time=data['start_time'],
+            end_time=end_time,
+            service=data['service'],
+            status=data['status'],
+            contact_number=data['contact_number'],
+            notes=data['notes'],
+        ))
+
+    errors.sort(key=lambda error: error['row'])
+    if dry_run:
+        return {'created': 0, 'would_create': len(appointments), 'errors': errors}
+
+    for start in range(0, len(appointments), settings.IMPORT_BATCH_SIZE):
+        batch = appointments[start:start + settings.IMPORT_BATCH_SIZE]
+        with transaction.atomic():
+            # bulk_create skips the model signals, so their work is done here
+            created = Appointment.objects.bulk_create(batch)
+            events.record_events(created, 'created')
+            transaction.on_commit(lambda: bump_barber_cache_version(barber.pk))
+            imported_dates = {appointment.date for appointment in created}
+            transaction.on_commit(lambda dates=imported_dates: analytics.refresh_days(barber.pk, dates))
+    return {'created': len(appointments), 'errors': errors}
@@ -0,0 +1,173 @@
+"""
+Structured, non-blocking logging.
+
+- RequestIdMiddleware gives every request an id, taken from a valid incoming
+  X-Request-ID header or generated, and returns it in the response.
+  RequestIdFilter stamps it on every record logged while the request is
+  handled.
+- SamplingFilter keeps LOG_DEBUG_SAMPLE_RATE of DEBUG records, decided per
+  request so a sampled request keeps all of its debug records. INFO and
+  above are always kept.
+- JsonFormatter writes one JSON object per line, including any `extra`
+  fields passed to the logging call.
+- QueueHandler only puts records on an in-memory queue. A background thread
+  formats them and writes them to stdout, so requests never wait on log
+  I/O. When the queue is full, records are dropped rather than blocking.
+
+This module is loaded by LOGGING before the apps are, so it must not import
+Django models.
+"""
+import atexit
+import contextvars
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import sys
+import uuid
+import zlib
+from datetime import datetime, timezone
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+_request_id = contextvars.ContextVar('request_id', default=None)
+
+# Accepted from clients and proxies; anything else is replaced
+_REQUEST_ID_RE = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+# Attributes of every LogRecord; anything else on a record came from `extra`
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'request_id'}
+
+
+def current_request_id():
+    return _request_id.get()
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        record.request_id = _request_id.get() or '-'
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate=1.0):
+        super().__init__()
+        self.rate = float(rate)
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1:
+            return True
+        request_id = _request_id.get()
+        if request_id:
+            return zlib.crc32(request_id.encode()) % 10000 < self.rate * 10000
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRS})
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str)
+
+
+class QueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a listener thread that writes them to `stream` (stdout by
+    default) with this handler's formatter
+    """
+
+    def __init__(self, stream=None, maxsize=10000):
+        super().__init__(queue.Queue(maxsize))
+        self.target = logging.StreamHandler(stream or sys.stdout)
+        self.dropped = 0
+        self._start()
+        # Threads don't survive fork (gunicorn preloads the app in the
+        # master), so every worker needs a listener of its own
+        os.register_at_fork(after_in_child=self._restart)
+
+    def _start(self):
+        self.listener = logging.handlers.QueueListener(self.queue, self.target)
+        self.listener.start()
+        atexit.register(self.listener.stop)
+
+    def _restart(self):
+        atexit.unregister(self.listener.stop)
+        self.queue = queue.Queue(self.queue.maxsize)
+        self.dropped = 0
+        self._start()
+
+    def setFormatter(self, fmt):
+        # Records are formatted on the listener thread
+        super().setFormatter(fmt)
+        self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        # Only resolve the message now, in case its arguments change later;
+        # formatting (and any traceback) is left to the listener
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1 or self.dropped % 1000 == 0:
+                sys.stderr.write(f'Log queue full; {self.dropped} records dropped\n')
+
+
+class RequestIdMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _request_id_of(self, request):
+        request_id = request.headers.get('X-Request-ID', '')
+        if not _REQUEST_ID_RE.match(request_id):
+            request_id = uuid.uuid4().hex
+        request.request_id = request_id
+        return request_id
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request_id = self._request_id_of(request)
+        token = _request_id.set(request_id)
+        try:
+            response = self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        response['X-Request-ID'] = request_id
+        return response
+
+    async def __acall__(self, request):
+        request_id = self._request_id_of(request)
+        token = _request_id.set(request_id)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request_id.reset(token)
+        response['X-Request-ID'] = request_id
+        return response
@@ -0,0 +1,63 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from api.benchmarks import write_table
+
+
+class Command(BaseCommand):
+    help = (
+        'Load-test a running server at increasing concurrency. Start gunicorn with '
+        'WEB_CONCURRENCY=1 in each WEB_SERVER_MODE (wsgi, asgi) and compare how '
+        'many concurrent requests one worker sustains.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('url', help='Endpoint to load, e.g. http://127.0.0.1:8000/api/barbers/address_suggestions/')
+        parser.add_argument('--method', default='GET')
+        parser.add_argument('--data', help='JSON request body')
+        parser.add_argument('--token', help='API token sent as "Authorization: Token <token>"')
+        parser.add_argument('--concurrency', default='1,4,16,64', help='Comma-separated concurrency levels')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per concurrency level')
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        headers = {'Content-Type': 'application/json'}
+        if options['token']:
+            headers['Authorization'] = f"Token {options['token']}"
+        body = json.dumps(json.loads(options['data'])).encode() if options['data'] else None
+
+        def send(_):
+            request = urllib.request.Request(options['url'], data=body, headers=headers, method=options['method'])
+            start = time.perf_counter()
+            try:
+                with urllib.request.urlopen(request, timeout=options['timeout']) as response:
+                    response.read()
+                    ok = response.status < 400
+            except (urllib.error.URLError, TimeoutError):
+                ok = False
+            return time.perf_counter() - start, ok
+
+        rows = []
+        for concurrency in [int(level) for level in options['concurrency'].split(',')]:
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                results = list(pool.map(send, range(options['requests'])))
+            elapsed = time.perf_counter() - start
+
+            latencies = sorted(latency for latency, _ in results)
+            errors = sum(1 for _, ok in results if not ok)
+            rows.append([
+                concurrency,
+                f"{len(results) / elapsed:.1f}",
+                f"{statistics.median(latencies) * 1000:.0f}",
+                f"{latencies[int(len(latencies) * 0.95) - 1] * 1000:.0f}",
+                errors,
+            ])
+
+        write_table(self.stdout, ['concurrency', 'req/s', 'p50 ms', 'p95 ms', 'errors'], rows)
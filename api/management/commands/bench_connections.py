@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from api.benchmarks import measure, write_table
+
+SCENARIOS = [
+    # (name, CONN_MAX_AGE, CONN_HEALTH_CHECKS)
+    ('new connection per request', 0, False),
+    ('persistent', 600, False),
+    ('persistent + health checks', 600, True),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure per-request database connection overhead with and without '
+        'persistent connections, by replaying the request_started/request_finished '
+        'cycle around a trivial query'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help='Simulated requests per scenario')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database alias (e.g. one behind pgbouncer)')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        requests = options['requests']
+        saved = {key: connection.settings_dict[key] for key in ('CONN_MAX_AGE', 'CONN_HEALTH_CHECKS')}
+
+        results = []
+        try:
+            for name, max_age, health_checks in SCENARIOS:
+                connection.close()
+                connection.settings_dict.update(CONN_MAX_AGE=max_age, CONN_HEALTH_CHECKS=health_checks)
+                connects = 0
+                with measure() as cost:
+                    for _ in range(requests):
+                        request_started.send(sender=self.__class__)
+                        if connection.connection is None:
+                            connects += 1
+                        with connection.cursor() as cursor:
+                            cursor.execute('SELECT 1')
+                        request_finished.send(sender=self.__class__)
+                results.append((name, connects, cost['wall'] * 1000 / requests))
+        finally:
+            connection.close()
+            connection.settings_dict.update(saved)
+
+        baseline = results[1][2]
+        write_table(
+            self.stdout,
+            ['scenario', 'requests', 'connects', 'ms/request', 'overhead ms/request'],
+            [
+                [name, requests, connects, f'{per_request:.3f}', f'{per_request - baseline:+.3f}']
+                for name, connects, per_request in results
+            ],
+        )
@@ -0,0 +1,83 @@
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIRequestFactory
+
+from api.benchmarks import measure, rolled_back, write_table
+from api.throttling import LoginAccountThrottle, LoginIPThrottle
+from api.views import CustomAuthToken
+
+PASSWORD = 'bench-login-password'
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure /api/token/ throughput and CPU cost for normal logins versus a '
+        'credential-stuffing burst, with and without the login throttles'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--attempts', type=int, default=200, help='Login attempts per scenario')
+        parser.add_argument('--accounts', type=int, default=20, help='Number of seeded accounts')
+
+    def handle(self, *args, **options):
+        attempts = options['attempts']
+        accounts = [f'bench_login_{i}' for i in range(options['accounts'])]
+        factory = APIRequestFactory()
+
+        scenarios = [
+            # (name, password, client IP for attempt i, throttled)
+            ('normal', PASSWORD, lambda i: f'10.1.{i // 250}.{i % 250}', True),
+            ('attack, throttled', 'wrong-password', lambda i: '10.2.0.1', True),
+            ('attack, unthrottled', 'wrong-password', lambda i: '10.3.0.1', False),
+        ]
+
+        rows = []
+        with rolled_back():
+            password_hash = make_password(PASSWORD)
+            User.objects.bulk_create([User(username=name, password=password_hash) for name in accounts])
+
+            for name, password, ip_for, throttled in scenarios:
+                self.reset_throttles(accounts, {ip_for(i) for i in range(attempts)})
+                view = CustomAuthToken.as_view(
+                    throttle_classes=CustomAuthToken.throttle_classes if throttled else []
+                )
+
+                statuses = Counter()
+                with measure() as cost:
+                    for i in range(attempts):
+                        request = factory.post(
+                            '/api/token/',
+                            {'username': accounts[i % len(accounts)], 'password': password},
+                            format='json',
+                            REMOTE_ADDR=ip_for(i),
+                        )
+                        statuses[view(request).status_code] += 1
+
+                rows.append([
+                    name,
+                    attempts,
+                    ' '.join(f'{code}x{count}' for code, count in sorted(statuses.items())),
+                    f"{attempts / cost['wall']:.1f}",
+                    f"{cost['cpu']:.2f}",
+                    f"{cost['cpu'] * 1000 / attempts:.2f}",
+                ])
+
+        write_table(
+            self.stdout,
+            ['scenario', 'attempts', 'statuses', 'attempts/s', 'cpu s', 'cpu ms/attempt'],
+            rows,
+        )
+
+    def reset_throttles(self, accounts, ips):
+        keys = [
+            LoginAccountThrottle.cache_format % {'scope': LoginAccountThrottle.scope, 'ident': name}
+            for name in accounts
+        ] + [
+            LoginIPThrottle.cache_format % {'scope': LoginIPThrottle.scope, 'ident': ip}
+            for ip in ips
+        ]
+        cache.delete_many(keys)
@@ -0,0 +1,191 @@
+import gc
+import tracemalloc
+from datetime import time, timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import reset_queries
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.benchmarks import rolled_back, seed_barbers, traced_memory, write_table
+from api.models import Appointment, Barber, Review
+from api.serializers import AppointmentSerializer, BarberSerializer
+from api.views import AppointmentViewSet, BarberViewSet, search_barbers
+
+# Allocations made by the measuring itself
+SNAPSHOT_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<unknown>'),
+]
+
+WARM_UP_REQUESTS = 2
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure the Python memory (tracemalloc) of large list responses: peak and '
+        'retained bytes per endpoint and per serializer at several result sizes, '
+        'and growth across repeated requests in this process to catch leaks. '
+        'Memory allocated outside Python (GEOS, the database driver) is not counted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='50,200,500', help='Result sizes: matching barbers, and upcoming appointments of one barber')
+        parser.add_argument('--requests', type=int, default=20, help='Repeated requests per endpoint for the leak check')
+        parser.add_argument('--leak-threshold', type=float, default=4.0, help='KiB still held per repeated request that counts as a leak')
+        parser.add_argument('--top', type=int, default=10, help='Allocation sites to list for a suspected leak')
+        parser.add_argument('--fail-on-leak', action='store_true', help='Exit with an error when a leak is suspected')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = sorted({int(size) for size in options['sizes'].split(',')})
+        except ValueError:
+            raise CommandError('--sizes must be comma-separated numbers, e.g. 50,200,500')
+        if sizes[0] < 1:
+            raise CommandError('Sizes must be at least 1')
+
+        self.factory = APIRequestFactory()
+        tracemalloc.start()
+        try:
+            with rolled_back():
+                rows, leaks = self.run(sizes, options)
+        finally:
+            tracemalloc.stop()
+
+        self.stdout.write('Memory per response (Python allocations only)')
+        write_table(
+            self.stdout,
+            ['target', 'results', 'body KiB', 'peak KiB', 'retained KiB', 'peak bytes/result'],
+            rows,
+        )
+        self.stdout.write('')
+        self.stdout.write(
+            f"Leak check: {options['requests']} requests per endpoint at {sizes[-1]} results, "
+            f'after {WARM_UP_REQUESTS} warm-up requests'
+        )
+        write_table(
+            self.stdout,
+            ['endpoint', 'KiB held per request', 'verdict'],
+            [
+                [name, f'{growth / 1024:.2f}', 'LEAK?' if suspected else 'ok']
+                for name, growth, suspected, _ in leaks
+            ],
+        )
+
+        suspected = [(name, sites) for name, _, is_leak, sites in leaks if is_leak]
+        for name, sites in suspected:
+            self.stdout.write('')
+            self.stdout.write(f'Allocations still held after repeated {name}:')
+            for stat in sites:
+                self.stdout.write(f'  {stat}')
+        if suspected and options['fail_on_leak']:
+            raise CommandError('Possible leak in: ' + ', '.join(name for name, _ in suspected))
+
+    def run(self, sizes, options):
+        self.reviewer = User.objects.create(username='bench_reviewer', first_name='Bench', last_name='Reviewer')
+        barbers = []
+        rows = []
+        for size in sizes:
+            self.grow(barbers, size)
+            owner = barbers[0].user
+            for name, call in self.endpoints(owner).items():
+                call()  # Lazy imports and caches are not part of a response's cost
+                with traced_memory() as memory:
+                    body = call()
+                rows.append(self.row(name, size, memory, body))
+            for name, build in self.serializers(barbers[0]).items():
+                build()
+                with traced_memory() as memory:
+                    data = build()
+                    del data
+                rows.append(self.row(name, size, memory))
+
+        leaks = []
+        for name, call in self.endpoints(barbers[0].user).items():
+            growth, sites = self.leak_check(call, options['requests'], options['top'])
+            leaks.append((name, growth, growth > options['leak_threshold'] * 1024, sites))
+        return rows, leaks
+
+    def grow(self, barbers, size):
+        """Seed barbers (with reviews) and upcoming appointments of the first one, up to `size` each"""
+        new = seed_barbers(size - len(barbers), prefix=f'bench{size}')
+        Review.objects.bulk_create([
+            Review(customer=self.reviewer, barber=barber, rating=4 + i % 2, comment=f'Benchmark review {i}')
+            for barber in new
+            for i in range(2)
+        ])
+        start = len(barbers)
+        barbers.extend(new)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        Appointment.objects.bulk_create([
+            Appointment(
+                barber=barbers[0],
+                customer=f'Customer {i}',
+                service='bench service 0',
+                date=tomorrow + timedelta(days=i // 16),
+                start_time=time(9 + i % 16 // 2, 30 * (i % 2)),
+                end_time=time(9 + i % 16 // 2, 30 * (i % 2) + 29),
+                contact_number='555-0100',
+            )
+            for i in range(start, size)
+        ])
+
+    def request(self, view, path, params=None, user=None):
+        """Handle one GET like a worker would, returning the size of the rendered body"""
+        reset_queries()  # Done by request_started in a worker when DEBUG is on
+        request = self.factory.get(path, params)
+        if user is not None:
+            force_authenticate(request, user=user)
+        response = view(request)
+        if response.streaming:
+            return sum(len(chunk) for chunk in response.streaming_content)
+        return len(response.render().content)
+
+    def endpoints(self, owner):
+        nearby = BarberViewSet.as_view({'get': 'nearby'})
+        upcoming = AppointmentViewSet.as_view({'get': 'upcoming'})
+        return {
+            'GET barbers/search/': lambda: self.request(search_barbers, '/api/barbers/search/', {'query': 'Bench'}),
+            'GET barbers/nearby/': lambda: self.request(
+                nearby, '/api/barbers/nearby/', {'lat': 40.7, 'lng': -73.9, 'radius': 100}, owner,
+            ),
+            'GET appointments/upcoming/': lambda: self.request(upcoming, '/api/appointments/upcoming/', user=owner),
+        }
+
+    def serializers(self, barber):
+        """Building .data without rendering, from the eager-loaded querysets the views use"""
+        return {
+            'BarberSerializer': lambda: BarberSerializer(
+                BarberSerializer.setup_eager_loading(Barber.objects.filter(user__first_name='Bench')), many=True,
+            ).data,
+            'AppointmentSerializer': lambda: AppointmentSerializer(
+                BarberSerializer.setup_eager_loading(Appointment.objects.filter(barber=barber), prefix='barber__'),
+                many=True,
+            ).data,
+        }
+
+    def row(self, name, size, memory, body=None):
+        return [
+            name,
+            size,
+            f'{body / 1024:.1f}' if body is not None else '-',
+            f"{memory['peak'] / 1024:.1f}",
+            f"{memory['retained'] / 1024:.1f}",
+            f"{memory['peak'] / size:.0f}",
+        ]
+
+    def leak_check(self, call, requests, top):
+        """Bytes still held per request after `requests` more requests, and the sites holding them"""
+        for _ in range(WARM_UP_REQUESTS):
+            call()
+        gc.collect()
+        before = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        for _ in range(requests):
+            call()
+        gc.collect()
+        after = tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+        stats = after.compare_to(before, 'lineno')
+        growth = sum(stat.size_diff for stat in stats)
+        return growth / max(requests, 1), [stat for stat in stats if stat.size_diff > 0][:top]
@@ -0,0 +1,91 @@
+import io
+from datetime import time, timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.benchmarks import measure, rolled_back, seed_barbers, write_table
+from api.models import Appointment
+from api.renderers import MessagePackParser, MessagePackRenderer, ORJSONParser, ORJSONRenderer
+from api.views import AppointmentViewSet, search_barbers
+
+FORMATS = [
+    # (name, renderer, parser)
+    ('json (stdlib)', JSONRenderer(), JSONParser()),
+    ('json (orjson)', ORJSONRenderer(), ORJSONParser()),
+    ('msgpack', MessagePackRenderer(), MessagePackParser()),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare payload size and encode/decode time of the API formats on '
+        'search_barbers and appointments/upcoming responses'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--barbers', type=int, default=500, help='Barbers matching the search')
+        parser.add_argument('--appointments', type=int, default=200, help='Upcoming appointments of one barber')
+        parser.add_argument('--repeat', type=int, default=20, help='Encodes/decodes per format')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        with rolled_back():
+            barbers = seed_barbers(options['barbers'])
+            responses = {
+                'search_barbers': self.search_response(factory),
+                'upcoming': self.upcoming_response(factory, barbers[0], options['appointments']),
+            }
+
+        rows = []
+        for target, data in responses.items():
+            for name, renderer, parser in FORMATS:
+                rows.append([target, name, *self.run(data, renderer, parser, options['repeat'])])
+
+        write_table(
+            self.stdout,
+            ['response', 'format', 'size KiB', 'encode ms', 'encode MiB/s', 'decode ms', 'decode MiB/s'],
+            rows,
+        )
+
+    def search_response(self, factory):
+        # JSON search results are streamed; asking for msgpack gets the
+        # unrendered data, which is then encoded in every format below
+        request = factory.get('/api/barbers/search/', {'query': 'Bench'}, HTTP_ACCEPT=MessagePackRenderer.media_type)
+        return search_barbers(request).data
+
+    def upcoming_response(self, factory, barber, count):
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        Appointment.objects.bulk_create([
+            Appointment(
+                barber=barber,
+                customer=f'Customer {i}',
+                service='bench service 0',
+                date=tomorrow + timedelta(days=i // 16),
+                start_time=time(9 + i % 16 // 2, 30 * (i % 2)),
+                end_time=time(9 + i % 16 // 2, 30 * (i % 2) + 29),
+                contact_number='555-0100',
+            )
+            for i in range(count)
+        ])
+        request = factory.get('/api/appointments/upcoming/')
+        force_authenticate(request, user=barber.user)
+        return AppointmentViewSet.as_view({'get': 'upcoming'})(request).data
+
+    def run(self, data, renderer, parser, repeat):
+        with measure() as encode:
+            for _ in range(repeat):
+                body = renderer.render(data, renderer.media_type)
+        with measure() as decode:
+            for _ in range(repeat):
+                parser.parse(io.BytesIO(body), parser.media_type, {'encoding': 'utf-8'})
+        return [
+            f'{len(body) / 1024:.1f}',
+            f"{encode['wall'] * 1000 / repeat:.2f}",
+            f"{len(body) * repeat / encode['wall'] / 2 ** 20:.1f}",
+            f"{decode['wall'] * 1000 / repeat:.2f}",
+            f"{len(body) * repeat / decode['wall'] / 2 ** 20:.1f}",
+        ]
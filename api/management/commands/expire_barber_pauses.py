@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from api import clustering
+from api.cache import bump_barber_cache_version
+from api.models import Barber
+
+
+class Command(BaseCommand):
+    help = 'Unpause barbers whose pause end date has passed (run on a schedule)'
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        with transaction.atomic():
+            expired = list(
+                Barber.objects.pause_expired(now)
+                .select_for_update(skip_locked=True)
+                .values_list('id', 'location', 'category_id', 'is_available')
+            )
+            if not expired:
+                self.stdout.write('No expired pauses')
+                return
+
+            # One bulk UPDATE; save() and its signals are bypassed, so the
+            # caches they would invalidate are refreshed explicitly below
+            Barber.objects.filter(id__in=[row[0] for row in expired]).update(
+                is_paused=False,
+                pause_start_date=None,
+                pause_end_date=None,
+                pause_reason='',
+            )
+
+            cells = set()
+            for _, location, category_id, is_available in expired:
+                if location is not None and is_available:
+                    cells |= clustering.cells_for_state((location.x, location.y, category_id))
+            if cells:
+                transaction.on_commit(lambda: clustering.refresh_cells(cells))
+            for barber_id, *_ in expired:
+                transaction.on_commit(lambda barber_id=barber_id: bump_barber_cache_version(barber_id))
+
+        self.stdout.write(self.style.SUCCESS(f'Unpaused {len(expired)} barber(s)'))
@@ -0,0 +1,38 @@
+import json
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api import importers
+from api.models import Barber
+
+
+class Command(BaseCommand):
+    help = 'Import existing appointments for a barber from a CSV or JSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('barber_id', type=int)
+        parser.add_argument('path', help='CSV with a header row, or a JSON list of appointments')
+        parser.add_argument('--format', choices=['csv', 'json'], help='Defaults to the file extension')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without saving')
+
+    def handle(self, *args, **options):
+        barber = Barber.objects.filter(pk=options['barber_id']).first()
+        if barber is None:
+            raise CommandError(f"Barber {options['barber_id']} does not exist")
+
+        path = Path(options['path'])
+        fmt = options['format'] or path.suffix.lstrip('.').lower()
+        try:
+            rows = importers.read_rows(path.read_bytes(), fmt)
+        except (OSError, importers.ImportFormatError) as e:
+            raise CommandError(str(e))
+
+        result = importers.import_appointments(barber, rows, dry_run=options['dry_run'])
+        for error in result['errors']:
+            self.stderr.write(f"Row {error['row']}: {json.dumps(error['errors'])}")
+        if options['dry_run']:
+            summary = f"Would import {result['would_create']} appointment(s)"
+        else:
+            summary = f"Imported {result['created']} appointment(s)"
+        self.stdout.write(self.style.SUCCESS(f"{summary}; {len(result['errors'])} row(s) skipped"))
@@ -0,0 +1,127 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.benchmarks import write_table
+
+# Run in a fresh interpreter so nothing is imported yet: load the application
+# the way the web server does, import the URLconf (and with it every view) and
+# optionally run the gunicorn warm-up, then report the timings on stdout
+BOOT_SCRIPT = """
+import json, sys, time
+started = time.perf_counter()
+import importlib
+application = importlib.import_module(sys.argv[1]).application
+loaded = time.perf_counter()
+from django.urls import get_resolver
+get_resolver().url_patterns
+ready = time.perf_counter()
+if sys.argv[2] == '1':
+    from api.warmup import warm_up
+    warm_up()
+print(json.dumps({
+    'load': loaded - started,
+    'urls': ready - loaded,
+    'ready': ready - started,
+    'warm': time.perf_counter() - started,
+}))
+"""
+
+APPLICATIONS = {
+    'wsgi': 'backend.wsgi',
+    'asgi': 'backend.asgi',
+}
+
+
+def parse_importtime(output):
+    """
+    Parse the `-X importtime` report into (module, self_us, cumulative_us)
+    tuples, one per module, in import order
+    """
+    modules = []
+    for line in output.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|', 2)
+        modules.append((name.strip(), int(self_us), int(cumulative_us)))
+    return modules
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure how long a fresh worker takes to become ready: time to load the '
+        'WSGI/ASGI application and its URLconf, plus the import cost of every '
+        'module (python -X importtime) grouped by top-level package'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--app', choices=sorted(APPLICATIONS), default='wsgi', help='Application to load')
+        parser.add_argument('--runs', type=int, default=3, help='Boots to time; the import report is from the fastest')
+        parser.add_argument('--top', type=int, default=25, help='Slowest modules to list')
+        parser.add_argument('--warm-up', action='store_true', help='Also time the gunicorn warm-up (needs the database)')
+
+    def boot(self, app, warm_up):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT, APPLICATIONS[app], '1' if warm_up else '0'],
+            cwd=settings.BASE_DIR,
+            env=env,
+            capture_output=True,
+            text=True,
+        )
+        if result.returncode != 0:
+            errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+            raise CommandError('Loading the application failed:\n' + '\n'.join(errors[-20:]))
+        return json.loads(result.stdout.strip().splitlines()[-1]), parse_importtime(result.stderr)
+
+    def handle(self, *args, **options):
+        boots = [self.boot(options['app'], options['warm_up']) for _ in range(max(options['runs'], 1))]
+        timings, modules = min(boots, key=lambda boot: boot[0]['ready'])
+
+        packages = defaultdict(lambda: [0, 0])
+        for name, self_us, _ in modules:
+            package = packages[name.split('.')[0]]
+            package[0] += self_us
+            package[1] += 1
+        total_us = sum(self_us for _, self_us, _ in modules)
+
+        self.stdout.write(f"Slowest modules (cumulative import time, fastest of {len(boots)} boots)")
+        write_table(
+            self.stdout,
+            ['module', 'self ms', 'cumulative ms'],
+            [
+                [name, f'{self_us / 1000:.1f}', f'{cumulative_us / 1000:.1f}']
+                for name, self_us, cumulative_us in sorted(modules, key=lambda m: -m[2])[:options['top']]
+            ],
+        )
+        self.stdout.write('')
+        self.stdout.write('Import time by top-level package')
+        write_table(
+            self.stdout,
+            ['package', 'modules', 'ms', 'share'],
+            [
+                [name, count, f'{self_us / 1000:.1f}', f'{self_us * 100 / total_us:.0f}%']
+                for name, (self_us, count) in sorted(packages.items(), key=lambda p: -p[1][0])[:options['top']]
+            ],
+        )
+        self.stdout.write('')
+
+        ready = [boot[0]['ready'] for boot in boots]
+        rows = [
+            ['modules imported', len(modules)],
+            ['import time (ms)', f'{total_us / 1000:.0f}'],
+            [f"load {APPLICATIONS[options['app']]} (ms)", f"{timings['load'] * 1000:.0f}"],
+            ['import URLconf and views (ms)', f"{timings['urls'] * 1000:.0f}"],
+            ['time to ready, fastest (ms)', f'{min(ready) * 1000:.0f}'],
+            ['time to ready, median (ms)', f'{statistics.median(ready) * 1000:.0f}'],
+        ]
+        if options['warm_up']:
+            rows.append(['time to ready incl. warm-up (ms)', f"{timings['warm'] * 1000:.0f}"])
+        write_table(self.stdout, ['startup', 'value'], rows)
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.models import AppointmentEvent, SyncTombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete appointment events and sync tombstones older than their retention periods (run daily)'
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        cutoff = now - timedelta(days=settings.APPOINTMENT_EVENT_RETENTION_DAYS)
+        deleted, _ = AppointmentEvent.objects.filter(created_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} appointment event(s)'))
+
+        cutoff = now - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+        deleted, _ = SyncTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} sync tombstone(s)'))
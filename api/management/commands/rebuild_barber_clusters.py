@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from api import clustering
+
+
+class Command(BaseCommand):
+    help = 'Recompute the precomputed map clusters of barber locations'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--zoom',
+            type=int,
+            action='append',
+            help='Only rebuild this zoom level (can be repeated)',
+        )
+
+    def handle(self, *args, **options):
+        zooms = options['zoom'] or list(clustering.cluster_zooms())
+        clustering.rebuild_clusters(zooms)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rebuilt barber clusters for zoom levels {', '.join(map(str, zooms))}"
+        ))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from api import analytics
+from api.models import Barber
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the daily analytics rollups from the appointments (repairs drift, '
+        'and re-prices revenue estimates after service price changes)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--barber', type=int, action='append', dest='barbers', help='Only this barber (repeatable)')
+        parser.add_argument('--batch-days', type=int, default=90, help='Days recomputed per query')
+
+    def handle(self, *args, **options):
+        barbers = Barber.objects.order_by('id').values_list('id', flat=True)
+        if options['barbers']:
+            barbers = barbers.filter(id__in=options['barbers'])
+
+        count = 0
+        for barber_id in barbers.iterator():
+            analytics.rebuild(barber_id, batch_days=options['batch_days'])
+            count += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt analytics for {count} barber(s)'))
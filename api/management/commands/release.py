@@ -0,0 +1,73 @@
+import hashlib
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.staticfiles.finders import get_finders
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+# Key of the Postgres advisory lock held while migrating
+RELEASE_LOCK_ID = 0x50_4C_4F_52  # "SOLO"
+
+FINGERPRINT_FILE = '.static-fingerprint'
+
+
+class Command(BaseCommand):
+    help = (
+        'Release phase, run once per deploy before the web processes start: '
+        'migrate and rebuild the map clusters under an advisory lock, then collect static '
+        'files if the sources changed'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--skip-migrate', action='store_true', help='Only collect static files (e.g. at build time)')
+        parser.add_argument('--skip-static', action='store_true', help='Only migrate (and rebuild the map clusters)')
+
+    def handle(self, *args, **options):
+        if not options['skip_migrate']:
+            self.migrate(options['verbosity'])
+        if not options['skip_static']:
+            self.collect_static(options['verbosity'])
+
+    def migrate(self, verbosity):
+        # A session-level lock, so it needs a direct (unpooled) connection
+        connection = connections[settings.DIRECT_DATABASE]
+        started = time.perf_counter()
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_advisory_lock(%s)', [RELEASE_LOCK_ID])
+        waited = time.perf_counter() - started
+        if waited > 1:
+            self.stdout.write(f'Waited {waited:.1f} s for another release to finish migrating')
+        try:
+            call_command('migrate', interactive=False, verbosity=verbosity)
+            # Fills a new deploy's BarberCluster table, and follows changes to the grid settings
+            call_command('rebuild_barber_clusters', verbosity=verbosity)
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(%s)', [RELEASE_LOCK_ID])
+
+    def collect_static(self, verbosity):
+        fingerprint = self.static_fingerprint()
+        marker = Path(settings.STATIC_ROOT) / FINGERPRINT_FILE
+        if marker.exists() and marker.read_text() == fingerprint:
+            self.stdout.write('Static files unchanged; skipping collectstatic')
+            return
+        call_command('collectstatic', interactive=False, verbosity=verbosity)
+        marker.write_text(fingerprint)
+
+    def static_fingerprint(self):
+        """Hash of every static source file's path and contents, plus the storage settings"""
+        digest = hashlib.sha256()
+        digest.update(repr((settings.STATIC_URL, settings.STORAGES.get('staticfiles'))).encode())
+        files = []
+        for finder in get_finders():
+            for path, storage in finder.list([]):
+                files.append((getattr(storage, 'prefix', None) or '', path, storage))
+        for prefix, path, storage in sorted(files, key=lambda item: item[:2]):
+            digest.update(f'{prefix}/{path}\0'.encode())
+            with storage.open(path) as source:
+                for block in iter(lambda: source.read(1 << 16), b''):
+                    digest.update(block)
+        return digest.hexdigest()
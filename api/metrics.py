@@ -0,0 +1,166 @@
+"""
+Prometheus metrics, served at /metrics.
+
+Under gunicorn every worker writes its samples to files in
+PROMETHEUS_MULTIPROC_DIR (set up by gunicorn.conf.py) and /metrics adds up
+the files of all workers, so any worker can answer a scrape. Without that
+variable (runserver, management commands) the process serves its own
+samples.
+
+- http_request_duration_seconds: time to the response headers, per URL name
+  (e.g. barbers-list, search-barbers), method and status. A streamed body is
+  not included.
+- db_query_duration_seconds, db_queries_per_request and
+  db_time_per_request_seconds: every query, through an execute wrapper
+  installed on each connection.
+- cache_requests_total: hits and misses of the API's payload caches.
+- geocoder_request_duration_seconds and geocoder_failures_total: upstream
+  calls made for address suggestions.
+- booking_conflicts_total: bookings overlapping another scheduled or
+  confirmed appointment (rejected import rows, or API bookings).
+- gunicorn_*: worker boots, exits and timeouts, and the live worker count.
+"""
+import contextvars
+import os
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.db.backends.signals import connection_created
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time from receiving a request to returning its response',
+    ['view', 'method', 'status'],
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'Requests being handled', multiprocess_mode='livesum',
+)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'Database query execution time', ['database'],
+    buckets=(.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    'db_queries_per_request', 'Database queries run while handling a request', ['view'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 200, 500),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    'db_time_per_request_seconds', 'Time spent in database queries while handling a request', ['view'],
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests', 'Reads of cached API payloads', ['cache', 'result'],
+)
+GEOCODER_LATENCY = Histogram(
+    'geocoder_request_duration_seconds', 'Geocoding service response time', ['service'],
+)
+GEOCODER_FAILURES = Counter(
+    'geocoder_failures', 'Geocoding requests that failed or returned an error status', ['service', 'reason'],
+)
+BOOKING_CONFLICTS = Counter(
+    'booking_conflicts', 'Bookings overlapping another scheduled or confirmed appointment', ['source'],
+)
+WORKER_BOOTS = Counter('gunicorn_worker_boots', 'Gunicorn workers started')
+WORKER_EXITS = Counter('gunicorn_worker_exits', 'Gunicorn workers that exited')
+WORKER_TIMEOUTS = Counter('gunicorn_worker_timeouts', 'Gunicorn workers aborted for timing out')
+WORKERS = Gauge('gunicorn_workers', 'Live gunicorn workers', multiprocess_mode='livesum')
+
+# [queries, seconds] of the request being handled, shared with the threads
+# sync_to_async runs its queries in
+_request_queries = contextvars.ContextVar('metrics_request_queries', default=None)
+
+
+def record_cache(name, hit):
+    CACHE_REQUESTS.labels(cache=name, result='hit' if hit else 'miss').inc()
+
+
+def worker_started():
+    """Called in each gunicorn worker after the fork"""
+    WORKER_BOOTS.inc()
+    WORKERS.set(1)
+
+
+def worker_exited(pid):
+    """Called in the gunicorn master when a worker exits"""
+    WORKER_EXITS.inc()
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(pid)
+
+
+def render():
+    """The exposition text and its content type"""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+
+def query_metrics_wrapper(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        DB_QUERY_DURATION.labels(database=context['connection'].alias).observe(elapsed)
+        queries = _request_queries.get()
+        if queries is not None:
+            queries[0] += 1
+            queries[1] += elapsed
+
+
+def install_wrapper(sender, connection, **kwargs):
+    # connection_created fires again on every reconnect of the same wrapper
+    if query_metrics_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_metrics_wrapper)
+
+
+connection_created.connect(install_wrapper, dispatch_uid='query_metrics_wrapper')
+
+
+class MetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = [0, 0.0]
+        token = _request_queries.set(queries)
+        REQUESTS_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            _request_queries.reset(token)
+        self._observe(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = [0, 0.0]
+        token = _request_queries.set(queries)
+        REQUESTS_IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            REQUESTS_IN_PROGRESS.dec()
+            _request_queries.reset(token)
+        self._observe(request, response, time.perf_counter() - started, queries)
+        return response
+
+    def _observe(self, request, response, elapsed, queries):
+        match = getattr(request, 'resolver_match', None)
+        # Unmatched paths share one label, so scanners can't add series
+        view = match.view_name if match and match.view_name else 'unresolved'
+        if view != 'metrics':
+            REQUEST_LATENCY.labels(view=view, method=request.method, status=response.status_code).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(view=view).observe(queries[0])
+            DB_TIME_PER_REQUEST.labels(view=view).observe(queries[1])
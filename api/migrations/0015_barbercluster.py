@@ -0,0 +1,40 @@
+# Generated by Django 4.2.19 on 2026-10-19 09:12
+
+import django.contrib.gis.db.models.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0014_barber_is_paused_barber_pause_end_date_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BarberCluster",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("zoom", models.PositiveSmallIntegerField()),
+                ("cell_x", models.IntegerField()),
+                ("cell_y", models.IntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "centroid",
+                    django.contrib.gis.db.models.fields.PointField(srid=4326),
+                ),
+                ("category_counts", models.JSONField(default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                "unique_together": {("zoom", "cell_x", "cell_y")},
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.19 on 2026-10-19 10:03
+
+import django.contrib.postgres.indexes
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0015_barbercluster"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="barber",
+            index=django.contrib.postgres.indexes.GistIndex(
+                condition=models.Q(
+                    ("is_paused", False),
+                    ("is_available", True),
+                    ("location__isnull", False),
+                ),
+                fields=["location"],
+                name="barber_discoverable_loc_idx",
+            ),
+        ),
+    ]
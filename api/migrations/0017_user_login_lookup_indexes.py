@@ -0,0 +1,26 @@
+# Generated manually for case-insensitive login lookups
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('api', '0016_barber_discoverable_loc_idx'),
+    ]
+
+    operations = [
+        # username__iexact / email__iexact compile to UPPER("column"::text) = UPPER(%s),
+        # which can only use an index on the same expression
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS api_user_upper_username_idx ON auth_user (UPPER(username::text));',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS api_user_upper_username_idx;',
+        ),
+        migrations.RunSQL(
+            sql='CREATE INDEX CONCURRENTLY IF NOT EXISTS api_user_upper_email_idx ON auth_user (UPPER(email::text));',
+            reverse_sql='DROP INDEX CONCURRENTLY IF EXISTS api_user_upper_email_idx;',
+        ),
+    ]
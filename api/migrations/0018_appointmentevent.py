@@ -0,0 +1,59 @@
+# Generated by Django 4.2.19 on 2026-10-19 13:27
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0017_user_login_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AppointmentEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("appointment_id", models.BigIntegerField()),
+                (
+                    "event_type",
+                    models.CharField(
+                        choices=[
+                            ("created", "Created"),
+                            ("updated", "Updated"),
+                            ("status_changed", "Status changed"),
+                            ("cancelled", "Cancelled"),
+                            ("deleted", "Deleted"),
+                        ],
+                        max_length=20,
+                    ),
+                ),
+                ("payload", models.JSONField(default=dict)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "barber",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="appointment_events",
+                        to="api.barber",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["barber", "id"], name="appointment_event_feed_idx"
+                    )
+                ],
+            },
+        ),
+    ]
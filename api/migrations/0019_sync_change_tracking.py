@@ -0,0 +1,65 @@
+# Generated by Django 4.2.19 on 2026-10-19 14:41
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0018_appointmentevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="workinghours",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="barberportfolio",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now),
+            preserve_default=False,
+        ),
+        migrations.AddIndex(
+            model_name="appointment",
+            index=models.Index(
+                fields=["barber", "updated_at"], name="appointment_sync_idx"
+            ),
+        ),
+        migrations.CreateModel(
+            name="SyncTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("collection", models.CharField(max_length=30)),
+                ("object_id", models.BigIntegerField()),
+                ("deleted_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "barber",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="sync_tombstones",
+                        to="api.barber",
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["barber", "deleted_at"],
+                        name="sync_tombstone_barber_idx",
+                    )
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.19 on 2026-10-19 15:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0019_sync_change_tracking"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="barber",
+            name="calendar_token",
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 4.2.19 on 2026-10-19 16:02
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0020_barber_calendar_token"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BarberDailyStats",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("date", models.DateField()),
+                ("bookings", models.PositiveIntegerField(default=0)),
+                ("completed", models.PositiveIntegerField(default=0)),
+                ("cancelled", models.PositiveIntegerField(default=0)),
+                (
+                    "revenue_estimate",
+                    models.DecimalField(decimal_places=2, default=0, max_digits=10),
+                ),
+                ("hourly_bookings", models.JSONField(default=dict)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                (
+                    "barber",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="daily_stats",
+                        to="api.barber",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["date"],
+                "unique_together": {("barber", "date")},
+            },
+        ),
+    ]
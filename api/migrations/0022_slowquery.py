@@ -0,0 +1,38 @@
+# Generated by Django 4.2.19 on 2026-10-19 18:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0021_barberdailystats"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SlowQuery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("database", models.CharField(max_length=50)),
+                ("duration_ms", models.FloatField()),
+                ("sql", models.TextField()),
+                ("params_shape", models.CharField(blank=True, max_length=255)),
+                ("view", models.CharField(blank=True, max_length=255)),
+                ("stack", models.TextField(blank=True)),
+                ("plan", models.TextField(blank=True)),
+            ],
+            options={
+                "verbose_name_plural": "slow queries",
+                "ordering": ["-id"],
+            },
+        ),
+    ]
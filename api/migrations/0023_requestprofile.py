@@ -0,0 +1,28 @@
+# Generated by Django 4.2.19 on 2026-10-19 21:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("api", "0022_slowquery"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RequestProfile",
+            fields=[
+                (
+                    "id",
+                    models.CharField(max_length=32, primary_key=True, serialize=False),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True, db_index=True)),
+                ("mode", models.CharField(max_length=20)),
+                ("method", models.CharField(max_length=10)),
+                ("path", models.TextField()),
+                ("status", models.PositiveSmallIntegerField()),
+                ("seconds", models.FloatField()),
+                ("data", models.BinaryField()),
+            ],
+        ),
+    ]
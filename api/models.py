@@ -1,9 +1,16 @@
+import logging
+import secrets
+
 from django.db import models
+from django.db.models import Q
 from django.contrib.auth.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.contrib.gis.db import models as gis_models
 from django.contrib.gis.geos import Point
+from django.contrib.postgres.indexes import GistIndex
+
+logger = logging.getLogger(__name__)
 
 # Create your models here.
 
@@ -22,6 +29,24 @@ class ProfessionalCategory(models.Model):
     def __str__(self):
         return self.name
 
+class BarberQuerySet(models.QuerySet):
+    def active(self):
+        """Barbers that aren't paused and are taking bookings, with or without a location"""
+        return self.filter(is_paused=False, is_available=True)
+
+    def discoverable(self):
+        """
+        Active barbers that may appear in nearby, map and distance-ordered
+        search results. The filter matches the predicate of the
+        barber_discoverable_location_idx partial index, so the planner can use it.
+        """
+        return self.active().filter(location__isnull=False)
+
+    def pause_expired(self, now=None):
+        """Paused barbers whose pause end date has passed"""
+        return self.filter(is_paused=True, pause_end_date__lte=now or timezone.now())
+
+
 class Barber(models.Model):
     """Model representing a barber in the system"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='barber_profile')
@@ -40,6 +65,19 @@ class Barber(models.Model):
     pause_start_date = models.DateTimeField(null=True, blank=True)
     pause_end_date = models.DateTimeField(null=True, blank=True)
     pause_reason = models.TextField(blank=True, default='')
+    # Secret in the URL of the barber's .ics appointment feed
+    calendar_token = models.CharField(max_length=64, unique=True, null=True, blank=True)
+
+    objects = BarberQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            GistIndex(
+                fields=['location'],
+                name='barber_discoverable_loc_idx',
+                condition=Q(is_paused=False, is_available=True, location__isnull=False),
+            ),
+        ]
     
     def __init__(self, *args, **kwargs):
         # Extract latitude and longitude if provided in kwargs
@@ -52,10 +90,11 @@ class Barber(models.Model):
         if self._latitude is not None and self._longitude is not None:
             try:
                 self.location = Point(float(self._longitude), float(self._latitude))
-            except (TypeError, ValueError) as e:
-                print(f"Error creating Point: {str(e)}")
-                print(f"Longitude: {self._longitude} (type: {type(self._longitude)})")
-                print(f"Latitude: {self._latitude} (type: {type(self._latitude)})")
+            except (TypeError, ValueError):
+                logger.warning(
+                    'Invalid barber coordinates', exc_info=True,
+                    extra={'longitude': repr(self._longitude), 'latitude': repr(self._latitude)},
+                )
                 raise
         super().save(*args, **kwargs)
     
@@ -135,6 +174,12 @@ class Barber(models.Model):
         self.pause_reason = ''
         self.save()
 
+    def rotate_calendar_token(self):
+        """Issue a new calendar feed token, invalidating any subscribed URL"""
+        self.calendar_token = secrets.token_urlsafe(32)
+        self.save(update_fields=['calendar_token'])
+        return self.calendar_token
+
     def set_coordinates(self, latitude, longitude):
         """Helper method to set coordinates before saving"""
         self._latitude = latitude
@@ -203,6 +248,7 @@ class WorkingHours(models.Model):
     start_time = models.TimeField()
     end_time = models.TimeField()
     is_selected = models.BooleanField(default=True)
+    updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         unique_together = ('barber', 'day')
@@ -235,6 +281,9 @@ class Appointment(models.Model):
     
     class Meta:
         ordering = ['-date', 'start_time']
+        indexes = [
+            models.Index(fields=['barber', 'updated_at'], name='appointment_sync_idx'),
+        ]
     
     def __str__(self):
         return f"{self.customer} with {self.barber.full_name} on {self.date} at {self.start_time}"
@@ -247,6 +296,67 @@ class Appointment(models.Model):
         return appointment_datetime < timezone.now()
 
 
+class AppointmentEvent(models.Model):
+    """Append-only log of appointment changes, streamed to barbers as server-sent events"""
+    EVENT_TYPES = [
+        ('created', 'Created'),
+        ('updated', 'Updated'),
+        ('status_changed', 'Status changed'),
+        ('cancelled', 'Cancelled'),
+        ('deleted', 'Deleted'),
+    ]
+
+    barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='appointment_events')
+    appointment_id = models.BigIntegerField()  # Not a foreign key: deletions are logged too
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    payload = models.JSONField(default=dict)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['barber', 'id'], name='appointment_event_feed_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} appointment {self.appointment_id} (event {self.id})"
+
+
+class SyncTombstone(models.Model):
+    """Record of a deleted dashboard row, so delta sync can tell clients to drop it"""
+    barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='sync_tombstones')
+    collection = models.CharField(max_length=30)
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['barber', 'deleted_at'], name='sync_tombstone_barber_idx'),
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.collection} {self.object_id}"
+
+
+class BarberDailyStats(models.Model):
+    """Per-barber, per-day appointment rollup behind the analytics dashboard"""
+    barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='daily_stats')
+    date = models.DateField()
+    bookings = models.PositiveIntegerField(default=0)
+    completed = models.PositiveIntegerField(default=0)
+    cancelled = models.PositiveIntegerField(default=0)
+    revenue_estimate = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    hourly_bookings = models.JSONField(default=dict)  # start hour -> non-cancelled bookings
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('barber', 'date')
+        ordering = ['date']
+
+    def __str__(self):
+        return f"{self.barber_id} on {self.date}: {self.bookings} bookings"
+
+
 class Review(models.Model):
     """Model representing customer reviews for barbers"""
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reviews')
@@ -281,6 +391,7 @@ class BarberPortfolio(models.Model):
     image = models.ImageField(upload_to='portfolio/', null=True, blank=True)
     description = models.CharField(max_length=255, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     is_group = models.BooleanField(default=False)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, related_name='group_images', null=True, blank=True)
     
@@ -301,3 +412,54 @@ class BarberPortfolio(models.Model):
                 images.insert(0, self)
             return images
         return [self]
+
+
+class BarberCluster(models.Model):
+    """Precomputed grid cell of barber locations for one map zoom level"""
+    zoom = models.PositiveSmallIntegerField()
+    cell_x = models.IntegerField()
+    cell_y = models.IntegerField()
+    count = models.PositiveIntegerField(default=0)
+    centroid = gis_models.PointField(srid=4326)
+    category_counts = models.JSONField(default=dict)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('zoom', 'cell_x', 'cell_y')
+
+    def __str__(self):
+        return f"Zoom {self.zoom} cell ({self.cell_x}, {self.cell_y}): {self.count} barbers"
+
+
+class SlowQuery(models.Model):
+    """A query that took longer than SLOW_QUERY_THRESHOLD_MS (see api/slow_queries.py)"""
+    created_at = models.DateTimeField(auto_now_add=True)
+    database = models.CharField(max_length=50)
+    duration_ms = models.FloatField()
+    sql = models.TextField()
+    params_shape = models.CharField(max_length=255, blank=True)  # parameter types, never values
+    view = models.CharField(max_length=255, blank=True)
+    stack = models.TextField(blank=True)
+    plan = models.TextField(blank=True)  # EXPLAIN of sampled SELECTs, literals replaced by ?
+
+    class Meta:
+        ordering = ['-id']
+        verbose_name_plural = 'slow queries'
+
+    def __str__(self):
+        return f"{self.duration_ms:.0f} ms: {self.sql[:80]}"
+
+
+class RequestProfile(models.Model):
+    """A request profiled by RequestProfilingMiddleware (see api/profiling.py)"""
+    id = models.CharField(primary_key=True, max_length=32)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    mode = models.CharField(max_length=20)
+    method = models.CharField(max_length=10)
+    path = models.TextField()
+    status = models.PositiveSmallIntegerField()
+    seconds = models.FloatField()
+    data = models.BinaryField()  # collapsed stacks (UTF-8) or marshalled pstats
+
+    def __str__(self):
+        return f"{self.mode}: {self.method} {self.path}"
@@ -0,0 +1,234 @@
+"""
+On-demand profiling of single requests, for staff users.
+
+A request is profiled when it carries an `X-Profile` header or a `_profile`
+query parameter, set to one of:
+
+- `cprofile`: deterministic profile of every call (cProfile). Exact call
+  counts, but it slows the request down, noticeably so in ORM- and
+  serializer-heavy code.
+- `sample`: a background thread records the request thread's stack every
+  REQUEST_PROFILE_SAMPLE_INTERVAL seconds. Much lower overhead, and the
+  result is a collapsed-stack file that flamegraph.pl, speedscope or
+  inferno can render directly.
+
+The flag is only honoured for staff users, identified by the same token or
+session credentials the API accepts. Anyone else gets the normal response.
+The profile covers the view, serialization and rendering. It also covers
+iterating a (synchronous) streamed response, which is buffered for the
+purpose. It is stored as a RequestProfile row on the primary database, so any
+worker can serve the download, and kept for REQUEST_PROFILE_RETENTION_SECONDS.
+The response points at it with `X-Profile-Id` and `X-Profile-URL` headers.
+
+Requests without the flag only pay for a header and a query-string lookup.
+Under ASGI requests are not profiled: the response gets an `X-Profile-Error`
+header instead.
+REQUEST_PROFILING_ENABLED=False removes the middleware altogether.
+"""
+import cProfile
+import io
+import logging
+import marshal
+import pstats
+import secrets
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import exceptions
+from rest_framework.authentication import TokenAuthentication
+
+from .models import RequestProfile
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_PARAM = '_profile'
+MODES = ('cprofile', 'sample')
+
+# cProfile can't run twice at once in one process (Python 3.12+ refuses to)
+_cprofile_lock = threading.Lock()
+
+
+def _expired_before():
+    return timezone.now() - timedelta(seconds=settings.REQUEST_PROFILE_RETENTION_SECONDS)
+
+
+def get_profile(profile_id):
+    """A stored RequestProfile, or None once expired"""
+    # From the primary: a replica may not have the profile written a moment ago
+    return RequestProfile.objects.using(DEFAULT_DB_ALIAS).filter(
+        pk=profile_id, created_at__gte=_expired_before()
+    ).first()
+
+
+def _staff_user(request):
+    """The staff user behind the request's API token or session, or None"""
+    try:
+        authenticated = TokenAuthentication().authenticate(request)
+    except exceptions.AuthenticationFailed:
+        return None
+    user = authenticated[0] if authenticated else getattr(request, 'user', AnonymousUser())
+    return user if user.is_active and user.is_staff else None
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    module = frame.f_globals.get('__name__', code.co_filename)
+    return f'{module}:{code.co_name}:{frame.f_lineno}'
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's stack at a fixed interval, counting collapsed stacks"""
+
+    def __init__(self, thread_id, interval):
+        super().__init__(name='request-profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def collapsed(self):
+        """The samples in the collapsed-stack format read by flamegraph tools"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+class _StatsLoader:
+    """Lets pstats.Stats read marshalled stats from memory instead of a file"""
+
+    def __init__(self, data):
+        self.stats = marshal.loads(data)
+
+    def create_stats(self):
+        pass
+
+
+def render_profile(profile, text=False):
+    """
+    (content, content type, file name) for a stored profile. cProfile data is
+    a pstats file (snakeviz, `python -m pstats`) unless text is requested.
+    """
+    data = bytes(profile.data)
+    if profile.mode == 'sample':
+        return data, 'text/plain; charset=utf-8', f'{profile.id}.collapsed'
+    if text:
+        stats = pstats.Stats(_StatsLoader(data), stream=io.StringIO())
+        stats.sort_stats('cumulative').print_stats(100)
+        return stats.stream.getvalue(), 'text/plain; charset=utf-8', f'{profile.id}.txt'
+    return data, 'application/octet-stream', f'{profile.id}.prof'
+
+
+class RequestProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _requested_mode(self, request):
+        mode = request.META.get(HEADER) or request.GET.get(QUERY_PARAM)
+        return mode.lower() if mode and mode.lower() in MODES else None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        mode = self._requested_mode(request)
+        if mode is None or _staff_user(request) is None:
+            return self.get_response(request)
+        if mode == 'cprofile':
+            if not _cprofile_lock.acquire(blocking=False):
+                response = self.get_response(request)
+                response['X-Profile-Error'] = 'Another request is being profiled with cProfile in this worker'
+                return response
+            try:
+                return self._profile_cprofile(request)
+            finally:
+                _cprofile_lock.release()
+        return self._profile_sample(request)
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        # Under ASGI a request's work is spread over the event loop and worker
+        # threads, which neither profiler follows
+        if self._requested_mode(request) and await sync_to_async(_staff_user)(request) is not None:
+            response['X-Profile-Error'] = 'Requests served by ASGI workers are not profiled; use a WSGI worker'
+        return response
+
+    def _run(self, request):
+        response = self.get_response(request)
+        if response.streaming and not getattr(response, 'is_async', False):
+            response.streaming_content = list(response.streaming_content)
+        return response
+
+    def _profile_cprofile(self, request):
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self._run(request)
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - started
+        profiler.create_stats()
+        return self._store(request, response, 'cprofile', marshal.dumps(profiler.stats), elapsed)
+
+    def _profile_sample(self, request):
+        sampler = StackSampler(threading.get_ident(), settings.REQUEST_PROFILE_SAMPLE_INTERVAL)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            response = self._run(request)
+        finally:
+            sampler.stop()
+        elapsed = time.perf_counter() - started
+        return self._store(request, response, 'sample', sampler.collapsed().encode(), elapsed)
+
+    def _store(self, request, response, mode, data, elapsed):
+        profile_id = secrets.token_urlsafe(12)
+        profiles = RequestProfile.objects.using(DEFAULT_DB_ALIAS)
+        try:
+            profiles.create(
+                id=profile_id,
+                mode=mode,
+                method=request.method,
+                path=request.get_full_path(),
+                status=response.status_code,
+                seconds=elapsed,
+                data=data,
+            )
+            profiles.filter(created_at__lt=_expired_before()).delete()
+        except DatabaseError:
+            logger.warning('Could not store the profile of %s', request.get_full_path(), exc_info=True)
+            response['X-Profile-Error'] = 'The profile could not be stored'
+            return response
+        response['X-Profile-Id'] = profile_id
+        response['X-Profile-URL'] = request.build_absolute_uri(reverse('request-profile', args=[profile_id]))
+        response['X-Profile-Time'] = f'{elapsed * 1000:.1f}ms'
+        return response
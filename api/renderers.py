@@ -0,0 +1,95 @@
+"""
+orjson-backed JSON and MessagePack renderers and parsers for DRF.
+
+Values orjson can't encode natively, or encodes differently from DRF (Decimal,
+datetime, date, time, lazy translation strings, querysets...), go through
+DRF's own JSONEncoder.default, so a response parses to the same value as with
+rest_framework.renderers.JSONRenderer. The bytes are not always the same:
+floats may be spelled differently (1e16 rather than 1e+16), U+2028 and U+2029
+are not escaped, and NaN and infinities are written as null where
+JSONRenderer refuses them (STRICT_JSON). GEOS geometries returned directly by
+a view are encoded as GeoJSON.
+
+MessagePack uses the same conversions, so a msgpack body decodes to the value
+a client would get by parsing the JSON response, except that dict keys that
+aren't strings stay as they are (JSON turns {1: ...} into {"1": ...}) and NaN
+and infinities are kept. msgpack is only imported once a client asks for it,
+so it costs nothing at worker boot.
+"""
+import codecs
+import json
+
+import orjson
+from django.contrib.gis.geos import GEOSGeometry
+from rest_framework import renderers
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.utils.encoders import JSONEncoder
+
+_encoder = JSONEncoder()
+
+OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+def default(obj):
+    """Encode the values orjson leaves to us the way DRF's JSONEncoder does"""
+    if isinstance(obj, GEOSGeometry):
+        return json.loads(obj.geojson)
+    return _encoder.default(obj)
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """
+    Drop-in replacement for JSONRenderer. Indented output (the browsable API,
+    or an `indent` media type parameter) still goes through the stdlib encoder.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return orjson.dumps(data, default=default, option=OPTIONS)
+
+
+class ORJSONParser(JSONParser):
+    renderer_class = ORJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        try:
+            data = stream.read()
+            if codecs.lookup(encoding).name != 'utf-8':
+                data = data.decode(encoding)
+            return orjson.loads(data)
+        except (ValueError, LookupError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        import msgpack
+
+        if data is None:
+            return b''
+        # datetime=False hands datetimes to default() so they are encoded as
+        # the same strings as in JSON
+        return msgpack.packb(data, default=default, use_bin_type=True, datetime=False)
+
+
+class MessagePackParser(BaseParser):
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        import msgpack
+
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, strict_map_key=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
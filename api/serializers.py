@@ -1,5 +1,6 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
+from .cache import service_durations
 from .models import (
     Barber, Service, WorkingHours, 
     Appointment, Review, CustomerProfile, BarberPortfolio, BarberService, ProfessionalCategory
@@ -8,6 +9,14 @@ from rest_framework_gis.serializers import GeoFeatureModelSerializer
 from decimal import Decimal, InvalidOperation
 from django.contrib.gis.geos import Point
 from datetime import datetime, time, timedelta
+from django.db import IntegrityError, transaction
+from django.db.models import Prefetch
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Number of usernames tried when concurrent signups race for the same one
+USERNAME_CREATE_ATTEMPTS = 5
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -40,8 +49,8 @@ class WorkingHoursSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = WorkingHours
-        fields = ['id', 'barber', 'day', 'day_name', 'start_time', 'end_time', 'is_selected']
-        read_only_fields = ['id']
+        fields = ['id', 'barber', 'day', 'day_name', 'start_time', 'end_time', 'is_selected', 'updated_at']
+        read_only_fields = ['id', 'updated_at']
 
 
 class BarberPortfolioSerializer(serializers.ModelSerializer):
@@ -51,18 +60,18 @@ class BarberPortfolioSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = BarberPortfolio
-        fields = ['id', 'barber', 'image', 'description', 'created_at', 
+        fields = ['id', 'barber', 'image', 'description', 'created_at', 'updated_at',
                  'is_group', 'is_group_post', 'parent', 'images', 'group_images']
-        read_only_fields = ['id', 'created_at']
+        read_only_fields = ['id', 'created_at', 'updated_at']
 
     def get_is_group_post(self, obj):
-        return obj.is_group or obj.parent is not None
+        return obj.is_group or obj.parent_id is not None
     
     def get_images(self, obj):
         if obj.is_group:
             # If this is a group post, return all images in the group
             return [self.get_image_url(img) for img in obj.group_images.all()]
-        elif obj.parent:
+        elif obj.parent_id:
             # If this is part of a group, return empty list as it will be handled by the parent
             return []
         else:
@@ -141,6 +150,25 @@ class BarberSerializer(GeoFeatureModelSerializer):
                  'latitude', 'longitude', 'working_hours', 'category')
         read_only_fields = ('id', 'average_rating', 'total_reviews')
 
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=''):
+        """
+        Load everything the serializer reads along with the barbers: user and
+        category joined in, active services, reviews and working hours
+        prefetched. A list then costs the same number of queries however many
+        barbers it has. `prefix` is the path to the barber when serializing
+        another model, e.g. 'barber__' for appointments.
+        """
+        return queryset.select_related(f'{prefix}user', f'{prefix}category').prefetch_related(
+            Prefetch(
+                f'{prefix}services',
+                queryset=BarberService.objects.filter(is_active=True).select_related('service'),
+                to_attr='active_services',
+            ),
+            Prefetch(f'{prefix}reviews', queryset=Review.objects.select_related('customer'), to_attr='prefetched_reviews'),
+            Prefetch(f'{prefix}working_hours', queryset=WorkingHours.objects.all(), to_attr='prefetched_working_hours'),
+        )
+
     def get_user_details(self, obj):
         return {
             'first_name': obj.user.first_name,
@@ -149,11 +177,13 @@ class BarberSerializer(GeoFeatureModelSerializer):
         }
 
     def get_services(self, obj):
-        # Use select_related to reduce database queries
-        barber_services = BarberService.objects.filter(
-            barber=obj, 
-            is_active=True
-        ).select_related('service')
+        barber_services = getattr(obj, 'active_services', None)
+        if barber_services is None:
+            # Not loaded with setup_eager_loading()
+            barber_services = BarberService.objects.filter(
+                barber=obj, 
+                is_active=True
+            ).select_related('service')
         
         services_data = []
         for bs in barber_services:
@@ -167,16 +197,17 @@ class BarberSerializer(GeoFeatureModelSerializer):
                     'description': bs.description
                 }
                 services_data.append(service_data)
-            except Exception as e:
+            except Exception:
                 # Log error but don't raise to prevent complete failure
-                print(f"Error processing service {bs.id}: {str(e)}")
+                logger.exception('Error processing barber service', extra={'barber_service_id': bs.id})
                 continue
             
         return services_data
 
     def get_reviews(self, obj):
-        # Use select_related to reduce database queries
-        reviews = Review.objects.filter(barber=obj).select_related('customer')
+        reviews = getattr(obj, 'prefetched_reviews', None)
+        if reviews is None:
+            reviews = Review.objects.filter(barber=obj).select_related('customer')
         return [
             {
                 'id': review.id,
@@ -190,7 +221,9 @@ class BarberSerializer(GeoFeatureModelSerializer):
 
     def get_working_hours(self, obj):
         """Get working hours for the barber"""
-        working_hours = WorkingHours.objects.filter(barber=obj)
+        working_hours = getattr(obj, 'prefetched_working_hours', None)
+        if working_hours is None:
+            working_hours = WorkingHours.objects.filter(barber=obj)
         return [
             {
                 'day': hours.day,
@@ -228,11 +261,8 @@ class AppointmentSerializer(serializers.ModelSerializer):
                 barber_service = BarberService.objects.select_related('service').get(barber=barber, service__name=service_name)
                 duration_minutes = barber_service.duration
             except BarberService.DoesNotExist:
-                try:
-                    service = Service.objects.get(name=service_name)
-                    duration_minutes = service.duration_minutes
-                except Service.DoesNotExist:
-                    pass  # Use default
+                # Fall back to the service template, or keep the default
+                duration_minutes = service_durations().get(service_name, duration_minutes)
 
         # Calculate end_time
         if start_time and duration_minutes:
@@ -243,6 +273,34 @@ class AppointmentSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 
+class AppointmentSyncSerializer(serializers.ModelSerializer):
+    """Appointment fields for the barber's own dashboard, without the barber nested in each row"""
+    is_past_appointment = serializers.BooleanField(source='is_past', read_only=True)
+
+    class Meta:
+        model = Appointment
+        fields = ['id', 'customer', 'barber', 'service', 'date', 'start_time', 'end_time',
+                  'status', 'contact_number', 'notes', 'created_at', 'updated_at', 'is_past_appointment']
+        read_only_fields = fields
+
+
+class AppointmentImportRowSerializer(serializers.Serializer):
+    """One row of a bulk appointment import; end_time defaults to the service duration"""
+    customer = serializers.CharField(max_length=255)
+    date = serializers.DateField()
+    start_time = serializers.TimeField()
+    end_time = serializers.TimeField(required=False, allow_null=True)
+    service = serializers.CharField(max_length=255)
+    status = serializers.ChoiceField(choices=Appointment.STATUS_CHOICES, default='scheduled')
+    contact_number = serializers.CharField(max_length=15, required=False, allow_blank=True, default='')
+    notes = serializers.CharField(required=False, allow_blank=True, default='')
+
+    def validate(self, attrs):
+        if attrs.get('end_time') and attrs['end_time'] <= attrs['start_time']:
+            raise serializers.ValidationError({'end_time': 'End time must be after the start time.'})
+        return attrs
+
+
 class BarberRegistrationSerializer(serializers.ModelSerializer):
     email = serializers.EmailField()
     password = serializers.CharField(write_only=True)
@@ -260,40 +318,56 @@ class BarberRegistrationSerializer(serializers.ModelSerializer):
         base_username = f"{first_name.lower()}{last_name.lower()}"
         # Remove special characters
         base_username = ''.join(e for e in base_username if e.isalnum())
-        
-        # Try the base username first
-        if not User.objects.filter(username=base_username).exists():
+        # Names with no letters or digits left would otherwise match every username
+        base_username = base_username or 'user'
+
+        # Fetch every taken "<base>" / "<base><number>" username in one query
+        # (a LIKE 'base%' lookup served by the username index)
+        taken_suffixes = set()
+        for username in User.objects.filter(username__startswith=base_username).values_list('username', flat=True):
+            suffix = username[len(base_username):]
+            if not suffix:
+                taken_suffixes.add(0)
+            elif suffix.isascii() and suffix.isdigit():  # Not e.g. '²'
+                taken_suffixes.add(int(suffix))
+
+        # Try the base username first, otherwise continue after the highest number
+        if 0 not in taken_suffixes:
             return base_username
-            
-        # If username exists, add a number until we find an available one
-        counter = 1
-        while User.objects.filter(username=f"{base_username}{counter}").exists():
-            counter += 1
-        return f"{base_username}{counter}"
+        return f"{base_username}{max(taken_suffixes) + 1}"
 
     def create(self, validated_data):
         # Extract professional category
         professional_category_id = validated_data.pop('professional_category')
         
+        # Get professional category
+        try:
+            professional_category = ProfessionalCategory.objects.get(id=professional_category_id)
+        except ProfessionalCategory.DoesNotExist:
+            raise serializers.ValidationError(f"Professional category with ID {professional_category_id} does not exist")
+        
         # Generate username from first and last name
         first_name = validated_data.get('first_name', '')
         last_name = validated_data.get('last_name', '')
-        username = self.generate_username(first_name, last_name)
         
-        # Create user
-        user = User.objects.create_user(
-            username=username,
-            email=validated_data['email'],
-            password=validated_data['password'],
+        # Create user, hashing the password only once. A concurrent signup can take
+        # the generated username between the lookup and the insert; the unique
+        # constraint catches that and we retry with a fresh suffix
+        user = User(
+            email=User.objects.normalize_email(validated_data['email']),
             first_name=first_name,
             last_name=last_name
         )
-        
-        # Get professional category
-        try:
-            professional_category = ProfessionalCategory.objects.get(id=professional_category_id)
-        except ProfessionalCategory.DoesNotExist:
-            raise serializers.ValidationError(f"Professional category with ID {professional_category_id} does not exist")
+        user.set_password(validated_data['password'])
+        for attempt in range(USERNAME_CREATE_ATTEMPTS):
+            user.username = self.generate_username(first_name, last_name)
+            try:
+                with transaction.atomic():
+                    user.save()
+                break
+            except IntegrityError:
+                if attempt == USERNAME_CREATE_ATTEMPTS - 1:
+                    raise serializers.ValidationError("Could not generate a unique username. Please try again.")
         
         # Create barber profile with category
         Barber.objects.create(
@@ -401,8 +475,7 @@ class BarberProfileSerializer(serializers.ModelSerializer):
 
     def validate_working_hours(self, working_hours):
         """Validate the working hours data"""
-        print("\n=== Validating Working Hours ===")
-        print(f"Input data: {working_hours}")
+        logger.debug('Validating working hours', extra={'working_hours': working_hours})
         
         if not isinstance(working_hours, list):
             raise serializers.ValidationError("Working hours must be a list")
@@ -414,13 +487,10 @@ class BarberProfileSerializer(serializers.ModelSerializer):
         valid_days = [day[0] for day in WorkingHours.DAYS_OF_WEEK]  # Get valid day values
         
         for hours in working_hours:
-            print(f"\nProcessing hours entry: {hours}")
-            
             if not isinstance(hours, dict):
                 raise serializers.ValidationError("Each working hours entry must be an object")
                 
             if not hours.get('is_selected', True):
-                print("Skipping unselected day")
                 continue
                 
             day = str(hours.get('day', '')).lower()
@@ -429,8 +499,6 @@ class BarberProfileSerializer(serializers.ModelSerializer):
             start = hours.get('start') or hours.get('start_time')
             end = hours.get('end') or hours.get('end_time')
             
-            print(f"Day: {day}, Start: {start}, End: {end}")
-            
             if not all([day, start, end]):
                 raise serializers.ValidationError(
                     f"Day, start time, and end time are required for working hours. Got day={day}, start={start}, end={end}"
@@ -449,13 +517,9 @@ class BarberProfileSerializer(serializers.ModelSerializer):
             else:
                 # Validate and convert time format
                 try:
-                    print(f"Converting times: start={start}, end={end}")
                     start_time = datetime.strptime(str(start), '%H:%M').time()
                     end_time = datetime.strptime(str(end), '%H:%M').time()
-                    
-                    print(f"Converted times: start_time={start_time}, end_time={end_time}")
                 except ValueError as e:
-                    print(f"Time conversion error: {str(e)}")
                     raise serializers.ValidationError(
                         f"Invalid time format for {day}. Use HH:MM format. Error: {str(e)}"
                     )
@@ -472,7 +536,7 @@ class BarberProfileSerializer(serializers.ModelSerializer):
                 'is_selected': True
             })
             
-        print(f"\nValidated hours: {valid_hours}")
+        logger.debug('Validated working hours', extra={'working_hours': valid_hours})
         return valid_hours
 
     def validate_address(self, value):
@@ -535,7 +599,7 @@ class BarberProfileSerializer(serializers.ModelSerializer):
                 instance.address = address
             # Always set the location field if latitude and longitude are provided
                 if latitude is not None and longitude is not None:
-                    print(f"\nSetting coordinates: lat={latitude}, lon={longitude}")
+                    logger.debug('Setting barber coordinates', extra={'latitude': latitude, 'longitude': longitude})
                 instance.location = Point(float(longitude), float(latitude))
 
             # Initialize price range with decimal values
@@ -544,11 +608,7 @@ class BarberProfileSerializer(serializers.ModelSerializer):
 
             # Save the instance before creating related objects
             instance.save()
-            
-            print(f"\nAfter save in serializer:")
-            print(f"Location: {instance.location}")
-            print(f"Latitude: {instance.latitude}")
-            print(f"Longitude: {instance.longitude}")
+            logger.debug('Saved barber profile', extra={'barber_id': instance.pk, 'location': instance.location})
 
             # Delete existing working hours and services
             WorkingHours.objects.filter(barber=instance).delete()
@@ -608,6 +668,5 @@ class BarberProfileSerializer(serializers.ModelSerializer):
 
             return instance
         except Exception as e:
-            print(f"Error in update method: {str(e)}")
-            print(f"Error type: {type(e)}")
+            logger.warning('Barber profile update failed', exc_info=True, extra={'barber_id': instance.pk})
             raise serializers.ValidationError(str(e)) 
\ No newline at end of file
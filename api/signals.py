@@ -0,0 +1,136 @@
+from django.contrib.auth import get_user_model
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import analytics, clustering, events, sync
+from .cache import bump_barber_cache_version, invalidate_catalog
+from .models import (
+    Appointment, Barber, BarberPortfolio, BarberService, ProfessionalCategory, Review, Service, SyncTombstone,
+    WorkingHours,
+)
+
+
+@receiver(post_init, sender=Barber)
+def remember_barber_cluster_state(sender, instance, **kwargs):
+    """Keep the loaded location/category so saves can tell which cluster cells moved"""
+    instance._cluster_state = clustering.cluster_state(instance)
+
+
+@receiver(post_save, sender=Barber)
+def refresh_barber_clusters(sender, instance, **kwargs):
+    """Recompute the cluster cells a barber left and entered"""
+    old_state = getattr(instance, '_cluster_state', None)
+    new_state = clustering.cluster_state(instance)
+    if old_state == new_state:
+        return
+
+    cells = clustering.cells_for_state(old_state) | clustering.cells_for_state(new_state)
+    instance._cluster_state = new_state
+    transaction.on_commit(lambda: clustering.refresh_cells(cells))
+
+
+@receiver(post_delete, sender=Barber)
+def remove_barber_from_clusters(sender, instance, **kwargs):
+    cells = clustering.cells_for_state(getattr(instance, '_cluster_state', None))
+    if cells:
+        transaction.on_commit(lambda: clustering.refresh_cells(cells))
+
+
+@receiver(post_init, sender=Appointment)
+def remember_appointment_status(sender, instance, **kwargs):
+    instance._loaded_status = instance.__dict__.get('status')
+    instance._loaded_date = instance.__dict__.get('date')
+
+
+@receiver(post_save, sender=Appointment)
+def record_appointment_change(sender, instance, created, **kwargs):
+    """Log the change for the barber's event feed, inside the same transaction"""
+    if created:
+        event_type = 'created'
+    elif instance.status != instance._loaded_status:
+        event_type = 'cancelled' if instance.status == 'cancelled' else 'status_changed'
+    else:
+        event_type = 'updated'
+    instance._loaded_status = instance.status
+    events.record_event(instance, event_type)
+
+
+def _deleted_with_barber(origin):
+    """Whether a delete started from the barber or their user account"""
+    model = origin.__class__ if isinstance(origin, models.Model) else getattr(origin, 'model', None)
+    return model is not None and (issubclass(model, Barber) or model is get_user_model())
+
+
+@receiver(post_delete, sender=Appointment)
+def record_appointment_deletion(sender, instance, origin=None, **kwargs):
+    # Appointments removed by deleting their barber cascade away with the
+    # barber's event log, so there is nobody to notify
+    if isinstance(origin, Appointment) or getattr(origin, 'model', None) is Appointment:
+        events.record_event(instance, 'deleted')
+
+
+@receiver(post_save, sender=BarberPortfolio)
+def touch_portfolio_group(sender, instance, **kwargs):
+    """Images of a group post sync through the parent, so mark it changed too"""
+    if instance.parent_id:
+        BarberPortfolio.objects.filter(pk=instance.parent_id).update(updated_at=timezone.now())
+
+
+def record_sync_tombstone(sender, instance, origin=None, **kwargs):
+    """Remember deleted dashboard rows so delta sync can report them"""
+    if _deleted_with_barber(origin):
+        return
+    if isinstance(instance, BarberPortfolio) and instance.parent_id:
+        # Only top-level posts are synced; the group lost an image
+        touch_portfolio_group(sender, instance)
+        return
+    SyncTombstone.objects.create(
+        barber_id=instance.barber_id,
+        collection=sync.collection_for(sender),
+        object_id=instance.pk,
+    )
+
+
+for _model, _, _ in sync.COLLECTIONS.values():
+    post_delete.connect(record_sync_tombstone, sender=_model, dispatch_uid=f'sync_tombstone_{_model.__name__}')
+
+
+
+def invalidate_barber_cache(sender, instance, **kwargs):
+    """Drop the barber's cached payloads once the change is committed"""
+    barber_id = instance.pk if isinstance(instance, Barber) else instance.barber_id
+    transaction.on_commit(lambda: bump_barber_cache_version(barber_id))
+
+
+for _model in (Barber, BarberService, WorkingHours, BarberPortfolio, Review, Appointment):
+    post_save.connect(invalidate_barber_cache, sender=_model, dispatch_uid=f'barber_cache_save_{_model.__name__}')
+    post_delete.connect(invalidate_barber_cache, sender=_model, dispatch_uid=f'barber_cache_delete_{_model.__name__}')
+
+
+@receiver(post_save, sender=Appointment)
+def refresh_appointment_stats(sender, instance, **kwargs):
+    """Recompute the daily rollups of the days the appointment left and entered"""
+    barber_id = instance.barber_id
+    dates = {instance.date, instance._loaded_date} - {None}
+    instance._loaded_date = instance.date
+    transaction.on_commit(lambda: analytics.refresh_days(barber_id, dates))
+
+
+@receiver(post_delete, sender=Appointment)
+def refresh_deleted_appointment_stats(sender, instance, origin=None, **kwargs):
+    # The rollups of a deleted barber are deleted with them
+    if _deleted_with_barber(origin):
+        return
+    barber_id, date = instance.barber_id, instance.date
+    transaction.on_commit(lambda: analytics.refresh_days(barber_id, [date]))
+
+
+def invalidate_catalog_cache(sender, **kwargs):
+    transaction.on_commit(invalidate_catalog)
+
+
+for _model in (ProfessionalCategory, Service):
+    post_save.connect(invalidate_catalog_cache, sender=_model, dispatch_uid=f'catalog_cache_save_{_model.__name__}')
+    post_delete.connect(invalidate_catalog_cache, sender=_model, dispatch_uid=f'catalog_cache_delete_{_model.__name__}')
@@ -0,0 +1,238 @@
+"""
+Slow query log.
+
+While a request is handled, SlowQueryContextMiddleware installs an execute
+wrapper (connection.execute_wrapper) on every database connection that times
+its queries. Queries run outside a request, by management commands or while
+a streamed body is generated, are not timed. Queries slower than
+SLOW_QUERY_THRESHOLD_MS are stored as SlowQuery rows (viewable in the admin)
+with:
+
+- the SQL with its placeholders, and the types of its parameters (never
+  their values);
+- the request and URL name they ran for, and the project frames of the
+  stack that issued them;
+- for a SLOW_QUERY_EXPLAIN_SAMPLE_RATE share of slow SELECTs on Postgres,
+  the output of EXPLAIN (ANALYZE, BUFFERS). EXPLAIN ANALYZE runs the query a
+  second time, inside a savepoint, so it is sampled rather than run on
+  every slow query. It is only used for SELECTs that read a table: others,
+  such as SELECT pg_advisory_lock(...) or pg_notify(...), are called for
+  their side effects, so they get a plain EXPLAIN, which doesn't run them.
+  SELECTs with a locking clause (FOR UPDATE, FOR SHARE, ...) are never
+  explained. The plan shows the bound values as literals, so string and
+  number literals in its conditions are replaced with ? before it's stored.
+
+The table is a ring buffer of the newest SLOW_QUERY_LOG_SIZE rows. Rows are
+written outside the caller's transaction: queries recorded inside an atomic
+block are kept in memory until the next query outside one, or until the
+request finishes, so a rollback can't discard them and the log never adds
+writes to a transaction.
+
+A SLOW_QUERY_THRESHOLD_MS of 0 turns the log off.
+"""
+import contextvars
+import logging
+import random
+import re
+import threading
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+_current_request = contextvars.ContextVar('slow_query_request', default=None)
+
+# Per thread, like the connections the wrapper is installed on: the records
+# waiting to be written, and whether we're running our own queries
+_local = threading.local()
+
+_FROM = re.compile(r'\bFROM\b')
+_LOCKING_CLAUSE = re.compile(r'\bFOR\s+(?:UPDATE|NO\s+KEY\s+UPDATE|SHARE|KEY\s+SHARE)\b')
+
+# Plan lines holding expressions, whose constants are the query's parameters
+_PLAN_EXPRESSION = re.compile(
+    r'^(\s*(?:Filter|Join Filter|One-Time Filter|Index Cond|Recheck Cond|Hash Cond|Merge Cond|TID Cond|'
+    r'Order By|Sort Key|Presorted Key|Group Key|Cache Key|Run Condition|Output): )(.*)$'
+)
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'(?<![\w.$])-?\d+(?:\.\d+)?(?![\w.])')
+
+
+@contextmanager
+def _untimed():
+    """Queries run by the log itself are not timed"""
+    _local.active = True
+    try:
+        yield
+    finally:
+        _local.active = False
+
+
+def params_shape(params, many):
+    """The parameters' types, never their values, e.g. "(int, str, Point)" """
+    if params is None:
+        return ''
+    if many:
+        return f'{len(params)} parameter sets' if isinstance(params, (list, tuple)) else 'parameter sets'
+    if isinstance(params, dict):
+        shape = ', '.join(f'{key}: {type(value).__name__}' for key, value in params.items())
+        return '{' + shape + '}'
+    return '(' + ', '.join(type(value).__name__ for value in params) + ')'
+
+
+def _view():
+    request = _current_request.get()
+    if request is None:
+        return ''
+    match = getattr(request, 'resolver_match', None)
+    view = f'{request.method} {request.path}'
+    return f'{view} ({match.view_name})' if match and match.view_name else view
+
+
+def _stack():
+    """The project frames (no Django or site-packages) that led to the query"""
+    root = str(settings.BASE_DIR)
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(root) and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+    return ''.join(traceback.format_list(frames[-20:]))
+
+
+def redact_plan(plan):
+    """An EXPLAIN plan with the string literals, and the numbers in its expressions, replaced by ?"""
+    lines = []
+    for line in plan.splitlines():
+        line = _STRING_LITERAL.sub("'?'", line)
+        match = _PLAN_EXPRESSION.match(line)
+        if match:
+            line = match.group(1) + _NUMBER_LITERAL.sub('?', match.group(2))
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def _explain(connection, sql, params):
+    # Running a SELECT without a FROM again could repeat its side effects
+    analyze = bool(_FROM.search(sql.upper()))
+    explain = 'EXPLAIN (ANALYZE, BUFFERS) ' if analyze else 'EXPLAIN '
+    # A savepoint, so a failing EXPLAIN can't break the caller's transaction
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(explain + sql, params)
+                return redact_plan('\n'.join(row[0] for row in cursor.fetchall()))
+    except DatabaseError as exc:
+        # Error messages can quote the offending value too
+        return f'EXPLAIN failed: {redact_plan(str(exc))}'
+
+
+def _should_explain(connection, sql, many):
+    statement = sql.lstrip().upper()
+    return (
+        not many
+        and connection.vendor == 'postgresql'
+        and statement.startswith('SELECT')
+        and not _LOCKING_CLAUSE.search(statement)
+        and random.random() < settings.SLOW_QUERY_EXPLAIN_SAMPLE_RATE
+    )
+
+
+def flush():
+    """Write the queries recorded by this thread and trim the ring buffer"""
+    records = getattr(_local, 'pending', None)
+    if not records:
+        return
+    _local.pending = []
+    with _untimed():
+        try:
+            SlowQuery.objects.using(DEFAULT_DB_ALIAS).bulk_create(records)
+            newest = SlowQuery.objects.using(DEFAULT_DB_ALIAS).values_list('id', flat=True).first()
+            SlowQuery.objects.using(DEFAULT_DB_ALIAS).filter(
+                id__lte=newest - settings.SLOW_QUERY_LOG_SIZE
+            ).delete()
+        except DatabaseError:
+            logger.warning('Could not store %d slow queries', len(records), exc_info=True)
+
+
+def slow_query_wrapper(execute, sql, params, many, context):
+    if getattr(_local, 'active', False):
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration_ms = (time.perf_counter() - started) * 1000
+
+    if duration_ms >= settings.SLOW_QUERY_THRESHOLD_MS:
+        connection = context['connection']
+        with _untimed():
+            plan = _explain(connection, sql, params) if _should_explain(connection, sql, many) else ''
+        if not hasattr(_local, 'pending'):
+            _local.pending = []
+        _local.pending.append(SlowQuery(
+            database=connection.alias,
+            duration_ms=duration_ms,
+            sql=sql,
+            params_shape=params_shape(params, many)[:255],
+            view=_view()[:255],
+            stack=_stack(),
+            plan=plan,
+        ))
+
+    # The rows are written to the default database, outside both the
+    # transaction the query ran in and any open on the default database
+    if getattr(_local, 'pending', None) and not (
+        context['connection'].in_atomic_block or connections[DEFAULT_DB_ALIAS].in_atomic_block
+    ):
+        flush()
+    return result
+
+
+class SlowQueryContextMiddleware:
+    """Times the queries of each request, and flushes what was deferred"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.SLOW_QUERY_THRESHOLD_MS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _timed(self):
+        """Wraps the execution of every connection's queries until the block exits"""
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(slow_query_wrapper))
+        return stack
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _current_request.set(request)
+        try:
+            with self._timed():
+                return self.get_response(request)
+        finally:
+            _current_request.reset(token)
+            flush()
+
+    async def __acall__(self, request):
+        token = _current_request.set(request)
+        try:
+            with self._timed():
+                return await self.get_response(request)
+        finally:
+            _current_request.reset(token)
+            # In the request's sync thread, where its queries were recorded
+            await sync_to_async(flush)()
@@ -0,0 +1,75 @@
+"""
+Streaming JSON for list endpoints that return every row at once.
+
+Instead of serializing the whole queryset into one list and rendering it, the
+rows are read with QuerySet.iterator(chunk_size=STREAMING_CHUNK_SIZE) (a
+server-side cursor on Postgres), serialized one at a time and written to the
+client a chunk at a time, so worker memory stays flat however many rows match.
+The body is the same JSON the non-streaming response would have had.
+
+With DISABLE_SERVER_SIDE_CURSORS (behind pgbouncer) the driver still buffers
+the rows, but serialized output is never held in memory all at once.
+
+Only JSON responses stream; other formats (MessagePack, the browsable API) are
+rendered as before.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from rest_framework.response import Response
+from rest_framework_gis.serializers import GeoFeatureModelSerializer
+
+from .db_router import read_alias
+from .renderers import ORJSONRenderer
+
+_renderer = ORJSONRenderer()
+
+
+def _json_chunks(queryset, serializer_class, context, chunk_size):
+    geojson = issubclass(serializer_class, GeoFeatureModelSerializer)
+    # Same envelope as a many=True GeoFeatureModelSerializer
+    opening, closing = (b'{"type":"FeatureCollection","features":[', b']}') if geojson else (b'[', b']')
+
+    chunk = [opening]
+    separator = b''
+    for count, obj in enumerate(queryset.iterator(chunk_size=chunk_size), 1):
+        chunk.append(separator + _renderer.render(serializer_class(obj, context=context).data))
+        separator = b','
+        if count % chunk_size == 0:
+            yield b''.join(chunk)
+            chunk = []
+    chunk.append(closing)
+    yield b''.join(chunk)
+
+
+async def _async_chunks(chunks):
+    # Each chunk is produced in the sync thread, where the cursor lives
+    next_chunk = sync_to_async(next)
+    while True:
+        chunk = await next_chunk(chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+def list_response(request, queryset, serializer_class, context=None):
+    """
+    Response for an unpaginated list: streamed when the client gets JSON,
+    otherwise a regular DRF Response
+    """
+    context = context if context is not None else {'request': request}
+    if getattr(request, 'accepted_renderer', None) is None or request.accepted_renderer.format != 'json':
+        return Response(serializer_class(queryset, many=True, context=context).data)
+
+    # The rows are read after the view returns, outside the request's routing
+    chunks = _json_chunks(queryset.using(read_alias()), serializer_class, context, settings.STREAMING_CHUNK_SIZE)
+    return streaming_response(request, chunks, content_type='application/json')
+
+
+def streaming_response(request, chunks, **kwargs):
+    """StreamingHttpResponse over a sync generator of chunks that may query the database"""
+    if isinstance(getattr(request, '_request', request), ASGIRequest):
+        # Django's ASGI handler would read a sync iterator into memory first
+        chunks = _async_chunks(chunks)
+    return StreamingHttpResponse(chunks, **kwargs)
@@ -0,0 +1,96 @@
+"""
+Delta sync of the barber dashboard's data.
+
+A client sends back the token from its previous sync and gets only the
+appointments, services, working hours and portfolio posts changed since then,
+plus the ids of rows deleted since then (from SyncTombstone). Without a token,
+or with one older than the tombstone retention, it gets a full snapshot and
+replaces its local copy.
+
+Tokens are timestamps. Every delta reaches SYNC_OVERLAP_SECONDS further back
+than the token, so rows written by transactions that committed after a sync
+had already read the table are not missed. Clients apply changes as upserts,
+so seeing a row twice is harmless.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Appointment, BarberPortfolio, BarberService, SyncTombstone, WorkingHours
+from .serializers import (
+    AppointmentSyncSerializer, BarberPortfolioSerializer, BarberServiceSerializer, WorkingHoursSerializer,
+)
+
+
+def _appointments(barber):
+    return Appointment.objects.filter(barber=barber)
+
+
+def _services(barber):
+    return BarberService.objects.filter(barber=barber).select_related('service')
+
+
+def _working_hours(barber):
+    return WorkingHours.objects.filter(barber=barber)
+
+
+def _portfolio(barber):
+    # Images inside a group post are returned through their parent, which is
+    # touched whenever one of them changes
+    return BarberPortfolio.objects.filter(barber=barber, parent__isnull=True).prefetch_related('group_images')
+
+
+# Collection name -> (model, queryset for a barber, serializer)
+COLLECTIONS = {
+    'appointments': (Appointment, _appointments, AppointmentSyncSerializer),
+    'services': (BarberService, _services, BarberServiceSerializer),
+    'working_hours': (WorkingHours, _working_hours, WorkingHoursSerializer),
+    'portfolio': (BarberPortfolio, _portfolio, BarberPortfolioSerializer),
+}
+
+
+def collection_for(model):
+    for name, (collection_model, _, _) in COLLECTIONS.items():
+        if collection_model is model:
+            return name
+    return None
+
+
+def make_token(moment):
+    """Opaque, URL-safe sync token for a point in time"""
+    return str(int(moment.timestamp() * 1_000_000))
+
+
+def parse_token(token):
+    """The point in time a sync token stands for; ValueError if malformed"""
+    return datetime.fromtimestamp(int(token) / 1_000_000, tz=dt_timezone.utc)
+
+
+def changes(barber, since=None, context=None):
+    """
+    The barber's changes after `since` (a datetime, or None for everything) as
+    a response body, including the token for the next sync
+    """
+    now = timezone.now()
+    full = since is None or since < now - timedelta(days=settings.SYNC_TOMBSTONE_RETENTION_DAYS)
+    if not full:
+        since -= timedelta(seconds=settings.SYNC_OVERLAP_SECONDS)
+
+    deleted = {name: [] for name in COLLECTIONS}
+    if not full:
+        tombstones = SyncTombstone.objects.filter(barber=barber, deleted_at__gte=since)
+        for collection, object_id in tombstones.values_list('collection', 'object_id'):
+            if collection in deleted:
+                deleted[collection].append(object_id)
+
+    body = {'token': make_token(now), 'full': full, 'changes': {}}
+    for name, (_, queryset, serializer_class) in COLLECTIONS.items():
+        rows = queryset(barber)
+        if not full:
+            rows = rows.filter(updated_at__gte=since)
+        body['changes'][name] = {
+            'updated': serializer_class(rows, many=True, context=context or {}).data,
+            'deleted': deleted[name],
+        }
+    return body
@@ -1,3 +1,893 @@
-from django.test import TestCase
+import asyncio
+import json
+import re
+import uuid
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.gis.geos import Point
+from django.core import signing
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from django.utils.translation import gettext_lazy
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api import clustering, db_router, events, exports, importers, slow_queries, streaming, sync
+from api.benchmarks import seed_barbers
+from api.models import (
+    Appointment, BarberPortfolio, BarberService, ProfessionalCategory, Review, SyncTombstone, WorkingHours,
+)
+from api.renderers import MessagePackRenderer, ORJSONRenderer
+from api.serializers import BarberRegistrationSerializer, ProfessionalCategorySerializer
+from api.throttling import LoginAccountThrottle, LoginIPThrottle, TokenBucketThrottle
+
+LOCMEM_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(
+    DATABASE_REPLICAS=['replica_1'],
+    REPLICA_MAX_LAG_SECONDS=2,
+    REPLICA_STICKY_SECONDS=5,
+    CACHES=LOCMEM_CACHE,
+)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Routing decisions, with the replica lag measurement stubbed out"""
+
+    def setUp(self):
+        cache.clear()
+        self.factory = RequestFactory()
+        self.read_from = []
+        self.middleware = db_router.ReplicaRoutingMiddleware(self.view)
+        patcher = mock.patch.object(db_router, 'replica_lag', return_value=0.0)
+        self.replica_lag = patcher.start()
+        self.addCleanup(patcher.stop)
+        # Stands in for Redis: LocMemCache is only shared within this process
+        patcher = mock.patch.object(db_router, 'shared_cache', return_value=True)
+        self.shared_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def view(self, request):
+        self.read_from.append(db_router.ReplicaRouter().db_for_read(ProfessionalCategory))
+        return HttpResponse()
+
+    def request(self, method, path='/api/barbers/search/', **extra):
+        self.middleware(getattr(self.factory, method)(path, **extra))
+        return self.read_from[-1]
+
+    def test_api_get_reads_from_replica(self):
+        self.assertEqual(self.request('get'), 'replica_1')
+
+    def test_unsafe_methods_read_from_primary(self):
+        self.assertEqual(self.request('post'), 'default')
+
+    def test_per_process_cache_reads_from_primary(self):
+        self.shared_cache.return_value = False
+        self.assertEqual(self.request('get'), 'default')
+
+    def test_non_api_and_excluded_paths_read_from_primary(self):
+        self.assertEqual(self.request('get', '/admin/'), 'default')
+        self.assertEqual(self.request('get', '/api/appointments/events/'), 'default')
+
+    def test_reads_stick_to_primary_after_own_write(self):
+        self.request('post', '/api/appointments/', HTTP_AUTHORIZATION='Token writer')
+        self.assertEqual(self.request('get', HTTP_AUTHORIZATION='Token writer'), 'default')
+        self.assertEqual(self.request('get', HTTP_AUTHORIZATION='Token someone-else'), 'replica_1')
+
+    def test_anonymous_write_sticks_by_ip(self):
+        self.request('post', '/api/token/', REMOTE_ADDR='10.0.0.1')
+        self.assertEqual(self.request('get', HTTP_AUTHORIZATION='Token new', REMOTE_ADDR='10.0.0.1'), 'default')
+        self.assertEqual(self.request('get', REMOTE_ADDR='10.0.0.2'), 'replica_1')
+
+    def test_stickiness_expires(self):
+        self.request('post', '/api/appointments/', HTTP_AUTHORIZATION='Token writer')
+        cache.clear()
+        self.assertEqual(self.request('get', HTTP_AUTHORIZATION='Token writer'), 'replica_1')
+
+    def test_lagging_or_unreachable_replica_falls_back_to_primary(self):
+        self.replica_lag.return_value = 10.0
+        self.assertEqual(self.request('get'), 'default')
+        self.replica_lag.return_value = None
+        self.assertEqual(self.request('get'), 'default')
+
+    def test_streamed_list_reads_from_replica(self):
+        # The rows are read while the body is generated, after the view returned
+        read_from = []
+
+        def chunks(queryset, *args):
+            read_from.append(queryset.db)
+            yield b'[]'
+
+        def view(request):
+            request.accepted_renderer = ORJSONRenderer()
+            return streaming.list_response(request, ProfessionalCategory.objects.all(), ProfessionalCategorySerializer)
+
+        with mock.patch.object(streaming, '_json_chunks', chunks):
+            response = db_router.ReplicaRoutingMiddleware(view)(self.factory.get('/api/barbers/search/'))
+            b''.join(response.streaming_content)
+        self.assertEqual(read_from, ['replica_1'])
+
+    def test_reads_outside_requests_use_primary(self):
+        self.assertEqual(db_router.ReplicaRouter().db_for_read(ProfessionalCategory), 'default')
+
+    def test_writes_and_migrations_only_use_primary(self):
+        router = db_router.ReplicaRouter()
+        self.assertEqual(router.db_for_write(ProfessionalCategory), 'default')
+        self.assertTrue(router.allow_migrate('default', 'api'))
+        self.assertFalse(router.allow_migrate('replica_1', 'api'))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'set DATABASE_REPLICA_URLS (a second database or the primary again)')
+@override_settings(CACHES=LOCMEM_CACHE)
+class ReplicaReadYourWritesTests(TestCase):
+    """
+    Against configured replicas. With TEST MIRROR the replica aliases share the
+    test database; with a real second database the row written here is only
+    visible on the primary, so reading it proves the read was kept there.
+    """
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        cache.clear()
+        db_router._lag_cache.clear()
+        self.factory = RequestFactory()
+        patcher = mock.patch.object(db_router, 'shared_cache', return_value=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_write_then_read_sees_the_row(self):
+        def create(request):
+            ProfessionalCategory.objects.create(name='Stylist', slug='stylist', description='')
+            return HttpResponse()
+
+        def read(request):
+            return HttpResponse(str(ProfessionalCategory.objects.filter(slug='stylist').exists()))
+
+        credentials = {'HTTP_AUTHORIZATION': 'Token writer'}
+        db_router.ReplicaRoutingMiddleware(create)(self.factory.post('/api/professional-categories/', **credentials))
+        response = db_router.ReplicaRoutingMiddleware(read)(self.factory.get('/api/professional-categories/', **credentials))
+        self.assertEqual(response.content, b'True')
+
+    def test_replica_lag_is_measured(self):
+        for alias in settings.DATABASE_REPLICAS:
+            self.assertIsNotNone(db_router.replica_lag(alias))
+
+
+class ImportReadRowsTests(SimpleTestCase):
+    def test_utf8_csv_with_bom(self):
+        rows = importers.read_rows('\ufeffcustomer,service\nRenée,Cut\n'.encode('utf-8'), 'csv')
+        self.assertEqual(rows, [{'customer': 'Renée', 'service': 'Cut'}])
+
+    def test_non_utf8_csv_is_a_format_error(self):
+        with self.assertRaisesMessage(importers.ImportFormatError, 'File must be UTF-8 encoded CSV'):
+            importers.read_rows('customer,service\nRenée,Cut\n'.encode('cp1252'), 'csv')
+
+
+@override_settings(
+    CACHES=LOCMEM_CACHE, DATABASE_REPLICAS=[], BARBER_CLUSTER_POINT_THRESHOLD=3, BARBER_CLUSTER_MAX_POINTS=4,
+)
+class BarberClusterTests(TestCase):
+    def setUp(self):
+        self.barbers = seed_barbers(6, prefix='cluster')
+        self.other = seed_barbers(1, prefix='cluster_other')[0]  # In a category of its own
+        clustering.rebuild_clusters()
+
+    def get(self, zoom, **params):
+        return self.client.get('/api/barbers/clusters/', {'bbox': '-75,39,-72,42', 'zoom': zoom, **params})
+
+    def total(self, data):
+        return sum(feature['properties']['count'] for feature in data['features'])
+
+    def test_zoomed_out_box_is_clustered(self):
+        data = self.get(5).data
+        self.assertTrue(data['clustered'])
+        self.assertEqual(self.total(data), 7)
+
+    def test_category_filter_counts_only_that_category(self):
+        category = self.barbers[0].category_id
+        data = self.get(5, category=category).data
+        self.assertTrue(data['clustered'])
+        self.assertEqual(self.total(data), 6)
+        for feature in data['features']:
+            self.assertEqual(feature['properties']['categories'], {str(category): feature['properties']['count']})
+
+    def test_few_barbers_are_returned_individually(self):
+        data = self.get(5, category=self.other.category_id).data
+        self.assertFalse(data['clustered'])
+        self.assertEqual([feature['properties']['id'] for feature in data['features']], [self.other.pk])
+
+    def test_individual_barbers_past_the_clustered_zooms_are_capped(self):
+        data = self.get(settings.BARBER_CLUSTER_MAX_ZOOM + 1).data
+        self.assertFalse(data['clustered'])
+        self.assertTrue(data['truncated'])
+        self.assertEqual(len(data['features']), 4)
+
+    def test_invalid_category_is_rejected(self):
+        self.assertEqual(self.get(5, category='abc').status_code, 400)
+
+    def test_moving_a_barber_refreshes_its_cells(self):
+        barber = self.barbers[0]
+        barber.location = Point(2.35, 48.85, srid=4326)
+        with self.captureOnCommitCallbacks(execute=True):
+            barber.save()
+        self.assertEqual(self.total(self.get(5).data), 6)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, DATABASE_REPLICAS=[])
+class UsernameGenerationTests(TestCase):
+    def setUp(self):
+        self.serializer = BarberRegistrationSerializer()
+
+    def take(self, *usernames):
+        User.objects.bulk_create([User(username=username) for username in usernames])
+
+    def test_free_base_username_is_used(self):
+        self.take('janedoe3')
+        self.assertEqual(self.serializer.generate_username('Jane', 'Doe'), 'janedoe')
+
+    def test_continues_after_the_highest_number(self):
+        self.take('janedoe', 'janedoe2', 'janedoe7', 'janedoex', 'janedoe_9')
+        self.assertEqual(self.serializer.generate_username('Jane', 'Doe'), 'janedoe8')
+
+    def test_non_ascii_digit_suffixes_are_ignored(self):
+        self.take('janedoe', 'janedoe\u00b2', 'janedoe\u0663')
+        self.assertEqual(self.serializer.generate_username('Jane', 'Doe'), 'janedoe1')
+
+    def test_names_without_letters_fall_back_to_user(self):
+        self.take('bob')
+        self.assertEqual(self.serializer.generate_username('!!', '-'), 'user')
+        self.take('user')
+        self.assertEqual(self.serializer.generate_username('!!', '-'), 'user1')
+
+    def register(self):
+        category = ProfessionalCategory.objects.create(name='Barber', slug='barber')
+        serializer = BarberRegistrationSerializer(data={
+            'email': 'jane@example.com', 'password': 'x' * 12,
+            'first_name': 'Jane', 'last_name': 'Doe', 'professional_category': category.pk,
+        })
+        serializer.is_valid(raise_exception=True)
+        return serializer.save()
+
+    def test_retries_when_a_concurrent_signup_takes_the_username(self):
+        real_save = User.save
+
+        def save(user, *args, **kwargs):
+            if not User.objects.filter(username='janedoe').exists():
+                # Another signup inserts the same username between the lookup and our insert
+                self.take(user.username)
+            return real_save(user, *args, **kwargs)
+
+        with mock.patch.object(User, 'save', autospec=True, side_effect=save) as patched:
+            user = self.register()
+        self.assertEqual(patched.call_count, 2)
+        self.assertEqual(user.username, 'janedoe1')
+        self.assertEqual(user.barber_profile.category.slug, 'barber')
+
+    def test_gives_up_after_repeated_collisions(self):
+        with mock.patch.object(User, 'save', autospec=True, side_effect=IntegrityError):
+            with self.assertRaises(ValidationError):
+                self.register()
+        self.assertFalse(User.objects.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHE, DATABASE_REPLICAS=[], SYNC_OVERLAP_SECONDS=5, SYNC_TOMBSTONE_RETENTION_DAYS=30)
+class DeltaSyncTests(TestCase):
+    def setUp(self):
+        self.barber = seed_barbers(1, prefix='sync')[0]
+        self.client = APIClient()
+        self.client.force_authenticate(self.barber.user)
+
+    def sync(self, since=None):
+        response = self.client.get('/api/sync/', {'since': since} if since else {})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def age(self):
+        """Mark every synced row of the barber as last changed an hour ago"""
+        an_hour_ago = timezone.now() - timedelta(hours=1)
+        for model, _, _ in sync.COLLECTIONS.values():
+            model.objects.filter(barber=self.barber).update(updated_at=an_hour_ago)
+
+    def ids(self, data, collection, kind='updated'):
+        rows = data['changes'][collection][kind]
+        return sorted(row['id'] for row in rows) if kind == 'updated' else sorted(rows)
+
+    def book(self):
+        return Appointment.objects.create(
+            barber=self.barber, customer='Sync Customer', service='sync service 0',
+            date=timezone.localdate() + timedelta(days=1), start_time=time(10), end_time=time(10, 30),
+        )
+
+    def test_token_round_trips(self):
+        moment = timezone.now()
+        token = sync.make_token(moment)
+        self.assertTrue(token.isdigit())
+        self.assertAlmostEqual(sync.parse_token(token), moment, delta=timedelta(microseconds=1))
+
+    def test_invalid_token_is_rejected(self):
+        for token in ('abc', '1.5', str(10 ** 30)):
+            response = self.client.get('/api/sync/', {'since': token})
+            self.assertEqual(response.status_code, 400, token)
+
+    def test_without_token_returns_everything(self):
+        data = self.sync()
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['changes']['services']['updated']), 3)
+        self.assertEqual(len(data['changes']['working_hours']['updated']), 7)
+        self.assertEqual({collection: body['deleted'] for collection, body in data['changes'].items()},
+                         {collection: [] for collection in sync.COLLECTIONS})
+
+    def test_stale_token_gets_a_full_snapshot(self):
+        self.book().delete()
+        data = self.sync(sync.make_token(timezone.now() - timedelta(days=31)))
+        self.assertTrue(data['full'])
+        self.assertEqual(len(data['changes']['services']['updated']), 3)
+        self.assertEqual(data['changes']['appointments']['deleted'], [])
+
+    def test_delta_reaches_back_by_the_overlap(self):
+        self.age()
+        synced_at = timezone.now()
+        inside, outside, _ = BarberService.objects.filter(barber=self.barber).order_by('id')
+        BarberService.objects.filter(pk=inside.pk).update(updated_at=synced_at - timedelta(seconds=3))
+        BarberService.objects.filter(pk=outside.pk).update(updated_at=synced_at - timedelta(seconds=10))
+
+        data = self.sync(sync.make_token(synced_at))
+        self.assertFalse(data['full'])
+        self.assertEqual(self.ids(data, 'services'), [inside.pk])
+        self.assertEqual(self.ids(data, 'working_hours'), [])
+
+    def test_round_trip_reports_changes_and_deletions(self):
+        cancelled = self.book()
+        service = BarberService.objects.filter(barber=self.barber).first()
+        self.age()
+        token = self.sync()['token']
+
+        booked = self.book()
+        cancelled.delete()
+        service.delete()
+
+        data = self.sync(token)
+        self.assertFalse(data['full'])
+        self.assertEqual(self.ids(data, 'appointments'), [booked.pk])
+        self.assertEqual(self.ids(data, 'appointments', 'deleted'), [cancelled.pk])
+        self.assertEqual(self.ids(data, 'services', 'deleted'), [service.pk])
+        self.assertEqual(self.ids(data, 'working_hours'), [])
+
+    def test_group_image_changes_touch_the_parent(self):
+        group = BarberPortfolio.objects.create(barber=self.barber, is_group=True, description='Group')
+        image = BarberPortfolio.objects.create(barber=self.barber, parent=group, description='Image')
+        self.age()
+        token = sync.make_token(timezone.now())
+
+        image.description = 'Edited'
+        image.save()
+        self.assertEqual(self.ids(self.sync(token), 'portfolio'), [group.pk])
+
+        self.age()
+        image.delete()
+        data = self.sync(token)
+        self.assertEqual(self.ids(data, 'portfolio'), [group.pk])
+        self.assertEqual(self.ids(data, 'portfolio', 'deleted'), [])
+        self.assertFalse(SyncTombstone.objects.filter(collection='portfolio').exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHE, DATABASE_REPLICAS=[], IMPORT_BATCH_SIZE=2)
+class ImportAppointmentsTests(TestCase):
+    def setUp(self):
+        self.barber = seed_barbers(1, prefix='import')[0]
+        day = str(timezone.localdate() + timedelta(days=1))
+        self.rows = [
+            {'customer': f'Customer {i}', 'date': day, 'start_time': f'{9 + i}:00', 'service': 'import service 0'}
+            for i in range(3)
+        ]
+
+    def test_dry_run_creates_nothing(self):
+        result = importers.import_appointments(self.barber, self.rows, dry_run=True)
+        self.assertEqual((result['created'], result['would_create']), (0, 3))
+        self.assertFalse(Appointment.objects.filter(barber=self.barber).exists())
+
+    def test_import_in_batches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            result = importers.import_appointments(self.barber, self.rows)
+        self.assertEqual(result, {'created': 3, 'errors': []})
+        self.assertEqual(Appointment.objects.filter(barber=self.barber).count(), 3)
+
+
+class CsvExportTests(SimpleTestCase):
+    def test_customer_text_is_not_a_formula(self):
+        queryset = mock.Mock()
+        queryset.values_list.return_value.iterator.return_value = [
+            (1, '2026-01-05', '09:00', '09:30', '=HYPERLINK("http://x")', 'Cut', 'scheduled', '+1 555 0100',
+             '@SUM(A1)', '2026-01-01', '2026-01-01'),
+        ]
+        body = ''.join(exports.csv_chunks(queryset))
+        self.assertIn('"\'=HYPERLINK(""http://x"")"', body)
+        self.assertIn("'@SUM(A1)", body)
+        self.assertIn(',+1 555 0100,', body)  # Not customer text
+
+
+@override_settings(SLOW_QUERY_EXPLAIN_SAMPLE_RATE=1.0)
+class SlowQueryPlanTests(SimpleTestCase):
+    def test_plan_literals_are_redacted(self):
+        plan = slow_queries.redact_plan(
+            'Index Scan using auth_user_email on auth_user  (cost=0.29..8.31 rows=1 width=4)\n'
+            "  Index Cond: ((email)::text = 'x@y.com'::text)\n"
+            '  Filter: ((id > 42) AND (t1.rating >= 4.5))\n'
+            '  Rows Removed by Filter: 5'
+        )
+        self.assertNotIn('x@y.com', plan)
+        self.assertIn("Index Cond: ((email)::text = '?'::text)", plan)
+        self.assertIn('Filter: ((id > ?) AND (t1.rating >= ?))', plan)
+        self.assertIn('(cost=0.29..8.31 rows=1 width=4)', plan)
+        self.assertIn('Rows Removed by Filter: 5', plan)
+
+    def test_locking_selects_are_not_explained(self):
+        connection = mock.Mock(vendor='postgresql')
+        self.assertTrue(slow_queries._should_explain(connection, 'SELECT id FROM api_barber', False))
+        for clause in ('FOR UPDATE', 'FOR NO KEY UPDATE', 'FOR SHARE', 'FOR KEY SHARE'):
+            with self.subTest(clause):
+                self.assertFalse(slow_queries._should_explain(connection, f'SELECT id FROM api_barber {clause}', False))
+
+
+class RendererTests(SimpleTestCase):
+    """The orjson and MessagePack renderers against DRF's JSONRenderer"""
+
+    data = {
+        'price': Decimal('12.50'),
+        'at': datetime(2024, 5, 1, 9, 30, 15, 123456, tzinfo=dt_timezone.utc),
+        'date': date(2024, 5, 1),
+        'start_time': time(9, 30),
+        'id': uuid.UUID(int=1),
+        'label': gettext_lazy('Barber'),
+        'large': 1e16,
+        'text': 'line\u2028separator',
+        'rows': [{'notes': None, 'is_selected': True}],
+    }
+
+    def test_orjson_parses_to_the_same_value(self):
+        expected = json.loads(JSONRenderer().render(self.data))
+        self.assertEqual(json.loads(ORJSONRenderer().render(self.data)), expected)
+
+    def test_msgpack_decodes_to_the_same_value(self):
+        import msgpack
+
+        expected = json.loads(JSONRenderer().render(self.data))
+        self.assertEqual(msgpack.unpackb(MessagePackRenderer().render(self.data)), expected)
+
+    def test_documented_differences(self):
+        import msgpack
+
+        with self.assertRaises(ValueError):
+            JSONRenderer().render({'value': float('nan')})
+        self.assertEqual(ORJSONRenderer().render({'value': float('nan')}), b'{"value":null}')
+        self.assertNotEqual(ORJSONRenderer().render(self.data), JSONRenderer().render(self.data))
+        self.assertEqual(json.loads(ORJSONRenderer().render({1: 'a'})), {'1': 'a'})
+        self.assertEqual(msgpack.unpackb(MessagePackRenderer().render({1: 'a'}), strict_map_key=False), {1: 'a'})
+
+
+class StreamTokenTests(SimpleTestCase):
+    def test_round_trip(self):
+        self.assertEqual(events.read_stream_token(events.make_stream_token(42)), 42)
+
+    def test_expired_token_is_rejected(self):
+        token = events.make_stream_token(42)
+        with override_settings(APPOINTMENT_EVENTS_TOKEN_SECONDS=-1):
+            with self.assertRaises(signing.SignatureExpired):
+                events.read_stream_token(token)
+
+    def test_other_signed_values_are_rejected(self):
+        with self.assertRaises(signing.BadSignature):
+            events.read_stream_token(signing.dumps(42))
+
+
+@override_settings(CACHES=LOCMEM_CACHE)
+class LoginThrottleTests(SimpleTestCase):
+    """Token buckets at 3/min (a token every 20s), on a clock the tests move"""
+
+    def setUp(self):
+        cache.clear()
+        self.now = 1000.0
+        self.factory = APIRequestFactory()
+        rates = {'login_ip': '3/min', 'login_account': '3/min'}
+        patcher = mock.patch.object(TokenBucketThrottle, 'THROTTLE_RATES', rates)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def attempt(self, throttle_class=LoginIPThrottle, ip='10.0.0.1', username='alice'):
+        throttle = throttle_class()
+        throttle.timer = lambda: self.now
+        request = self.factory.post('/api/auth/login/', {'username': username}, format='json', REMOTE_ADDR=ip)
+        return throttle.allow_request(Request(request, parsers=[JSONParser()]), None), throttle
+
+    def test_burst_up_to_capacity_then_rejects(self):
+        self.assertEqual([self.attempt()[0] for _ in range(3)], [True, True, True])
+        allowed, throttle = self.attempt()
+        self.assertFalse(allowed)
+        self.assertEqual(throttle.wait(), 20.0)
+
+    def test_rejected_attempts_give_their_token_back(self):
+        for _ in range(3):
+            self.attempt()
+        # Retrying while empty doesn't push the next token further away
+        self.assertEqual([self.attempt()[1].wait() for _ in range(3)], [20.0, 20.0, 20.0])
+
+    def test_refills_one_token_per_interval(self):
+        for _ in range(4):
+            self.attempt()
+        self.now += 20
+        self.assertTrue(self.attempt()[0])
+        allowed, throttle = self.attempt()
+        self.assertFalse(allowed)
+        self.assertEqual(throttle.wait(), 20.0)
+        self.now += 60
+        self.assertEqual([self.attempt()[0] for _ in range(4)], [True, True, True, False])
+
+    def test_buckets_are_separate_per_scope_and_ident(self):
+        for _ in range(3):
+            self.attempt()
+        self.assertFalse(self.attempt()[0])
+        self.assertTrue(self.attempt(ip='10.0.0.2')[0])
+        self.assertTrue(self.attempt(LoginAccountThrottle)[0])
+        # Account identifiers are compared case-insensitively
+        for _ in range(2):
+            self.attempt(LoginAccountThrottle, username=' Alice')
+        self.assertFalse(self.attempt(LoginAccountThrottle, username='ALICE')[0])
+        self.assertTrue(self.attempt(LoginAccountThrottle, username='bob')[0])
+
+    def test_bucket_key_expires_once_full(self):
+        with mock.patch('time.time', lambda: self.now):
+            _, throttle = self.attempt()
+            _, throttle = self.attempt()
+            self.now += 39
+            self.assertIsNotNone(cache.get(throttle.key))
+            self.now += 1
+            self.assertIsNone(cache.get(throttle.key))
+            # The next attempt starts a full bucket
+            self.assertEqual([self.attempt()[0] for _ in range(4)], [True, True, True, False])
+
+
+@override_settings(CACHES=LOCMEM_CACHE, DATABASE_REPLICAS=[])
+class AsyncMiddlewareTests(TestCase):
+    """Under ASGI, one sync-only middleware would run every request in a thread"""
+
+    def test_every_middleware_is_async_capable(self):
+        for path in settings.MIDDLEWARE:
+            with self.subTest(path):
+                self.assertTrue(getattr(import_string(path), 'async_capable', False))
+
+    async def test_async_view_runs_on_the_server_event_loop(self):
+        user = await User.objects.acreate(username='async_user')
+        token = await Token.objects.acreate(user=user)
+        server_loop = asyncio.get_running_loop()
+        view_loops = []
+
+        async def address_suggestions(*args, **kwargs):
+            view_loops.append(asyncio.get_running_loop())
+            return []
+
+        with mock.patch('api.views.geocoding.address_suggestions', address_suggestions):
+            response = await self.async_client.post(
+                '/api/barbers/address_suggestions/', {'query': 'Main St'},
+                content_type='application/json', headers={'Authorization': f'Token {token.key}'},
+            )
+        self.assertEqual(response.status_code, 200)
+        # A thread hop would have run the view in async_to_sync's own loop
+        self.assertEqual(view_loops, [server_loop])
+
+
+# The feed closes its connection between reads, which TestCase's transaction
+# doesn't survive
+@override_settings(CACHES=LOCMEM_CACHE, DATABASE_REPLICAS=[])
+class AppointmentEventFeedTests(TransactionTestCase):
+    def setUp(self):
+        self.barber = seed_barbers(1, prefix='feed')[0]
+
+    def poll(self, **extra):
+        """The body of one WSGI (answer and close) request to the feed"""
+        token = events.make_stream_token(self.barber.pk)
+        response = self.client.get('/api/appointments/events/', {'token': token}, **extra)
+        self.assertEqual(response.status_code, 200)
+        return response.content.decode()
+
+    def book(self):
+        return Appointment.objects.create(
+            barber=self.barber, customer='Feed Customer', service='feed service 0',
+            date=timezone.localdate() + timedelta(days=1), start_time=time(10), end_time=time(10, 30),
+        )
+
+    def test_first_response_sets_the_last_event_id(self):
+        self.book()
+        self.assertRegex(self.poll(), r'(?m)^id: \d+$')
+
+    def test_reconnect_delivers_events_booked_in_between(self):
+        last_event_id = re.search(r'(?m)^id: (\d+)$', self.poll()).group(1)
+        appointment = self.book()
+        body = self.poll(HTTP_LAST_EVENT_ID=last_event_id)
+        self.assertIn('event: created', body)
+        self.assertIn(f'"appointment_id": {appointment.pk}', body)
+
+    def test_invalid_stream_token_is_rejected(self):
+        response = self.client.get('/api/appointments/events/', {'token': 'forged'})
+        self.assertEqual(response.status_code, 401)
+
+
+@override_settings(CACHES=LOCMEM_CACHE, DATABASE_REPLICAS=[], SLOW_QUERY_THRESHOLD_MS=60000)
+class QueryBudgetTests(TestCase):
+    """
+    Every route in api/urls.py within an explicit number of queries (and list
+    responses within a size), against barbers with services, hours, reviews,
+    appointments and portfolio groups. List endpoints are called again after
+    the data grows and must not cost a single query more, so an N+1 in a
+    serializer fails here.
+
+    Budgets are ceilings: lowering one after an optimisation is welcome,
+    raising one needs a reason.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.barbers = seed_barbers(2, prefix='budget')
+        self.barber = self.barbers[0]
+        self.owner = self.barber.user
+        self.customer = User.objects.create(username='budget_customer')
+        self.staff = User.objects.create(username='budget_staff', is_staff=True)
+        self.add_activity(self.barbers, 3)
+        self.barber.rotate_calendar_token()
+        self.appointment = Appointment.objects.filter(barber=self.barber).first()
+        self.group = BarberPortfolio.objects.filter(barber=self.barber, is_group=True).first()
+
+    def add_activity(self, barbers, count):
+        """`count` reviews, upcoming appointments, single posts and group images per barber"""
+        today = timezone.localdate()
+        Review.objects.bulk_create([
+            Review(customer=self.customer, barber=barber, rating=4, comment=f'Review {i}')
+            for barber in barbers
+            for i in range(count)
+        ])
+        Appointment.objects.bulk_create([
+            Appointment(
+                customer=f'Customer {i}', barber=barber, date=today + timedelta(days=1 + i // 8),
+                start_time=time(9 + i % 8), end_time=time(9 + i % 8, 45), service='budget service 0',
+            )
+            for barber in barbers
+            for i in range(count)
+        ])
+        groups = BarberPortfolio.objects.bulk_create([
+            BarberPortfolio(barber=barber, description='Group', is_group=True) for barber in barbers
+        ])
+        BarberPortfolio.objects.bulk_create([
+            BarberPortfolio(barber=group.barber, parent=group, description=f'Image {i}')
+            for group in groups
+            for i in range(count)
+        ] + [
+            BarberPortfolio(barber=barber, description=f'Post {i}')
+            for barber in barbers
+            for i in range(count)
+        ])
+
+    def call(self, method, path, user=None, data=None, **extra):
+        """(response, body, queries) of one request, a streamed body included"""
+        client = APIClient()
+        if user is not None:
+            # A fresh instance, so nothing is cached on it between requests
+            client.force_authenticate(User.objects.get(pk=user.pk))
+        with CaptureQueriesContext(connection) as queries:
+            if method == 'get':
+                response = client.get(path, data, **extra)
+            else:
+                response = getattr(client, method)(path, data, format='json', **extra)
+            body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body, len(queries)
+
+    def assertQueryBudget(self, budget, method, path, user=None, data=None, status=200, max_bytes=None, **extra):
+        response, body, queries = self.call(method, path, user, data, **extra)
+        self.assertEqual(response.status_code, status, f'{method.upper()} {path}: {body[:500]!r}')
+        self.assertLessEqual(queries, budget, f'{method.upper()} {path} ran {queries} queries')
+        if max_bytes is not None:
+            self.assertLessEqual(len(body), max_bytes, f'{method.upper()} {path} returned {len(body)} bytes')
+        return response
+
+    def list_calls(self):
+        barber, owner = self.barber, self.owner
+        return [
+            ('/api/users/', owner),
+            ('/api/barbers/', owner),
+            ('/api/barbers/nearby/?lat=40.7&lng=-73.9&radius=200', owner),
+            ('/api/barbers/search/?query=budget', None),
+            ('/api/barbers/clusters/?bbox=-75,39,-72,42&zoom=20', None),
+            ('/api/working-hours/', owner),
+            ('/api/barber-services/', owner),
+            ('/api/appointments/', owner),
+            ('/api/appointments/upcoming/', owner),
+            (f'/api/reviews/?barber={barber.pk}', owner),
+            (f'/api/barbers/{barber.pk}/portfolio/', owner),
+            (f'/api/barbers/{barber.pk}/profile/', owner),
+            (f'/api/barbers/{barber.pk}/booking/', None),
+            ('/api/sync/', owner),
+            ('/api/appointments/export.csv', owner),
+            (f'/api/calendar/{barber.calendar_token}.ics', None),
+        ]
+
+    def test_list_queries_do_not_grow_with_rows(self):
+        before = {}
+        for path, user in self.list_calls():
+            cache.clear()
+            before[path] = self.call('get', path, user)[2]
+
+        more = seed_barbers(8, prefix='budget_more')
+        self.add_activity(self.barbers + more, 5)
+
+        for path, user in self.list_calls():
+            cache.clear()
+            self.assertEqual(self.call('get', path, user)[2], before[path], f'GET {path} grew with the data')
+
+    def test_users(self):
+        self.assertQueryBudget(2, 'get', '/api/users/', self.owner)
+        self.assertQueryBudget(1, 'get', f'/api/users/{self.customer.pk}/', self.owner)
+        self.assertQueryBudget(0, 'get', '/api/users/me/', self.owner)
+        self.assertQueryBudget(1, 'patch', '/api/users/update_me/', self.owner, {'first_name': 'Budget'})
+
+    def test_barbers(self):
+        barber, owner = self.barber, self.owner
+        self.assertQueryBudget(5, 'get', '/api/barbers/', owner, max_bytes=40000)
+        self.assertQueryBudget(4, 'get', f'/api/barbers/{barber.pk}/', owner, max_bytes=6000)
+        self.assertQueryBudget(7, 'patch', f'/api/barbers/{barber.pk}/', owner, {'bio': 'Updated bio'}, max_bytes=6000)
+        self.assertQueryBudget(5, 'get', '/api/barbers/user/', owner, max_bytes=6000)
+        self.assertQueryBudget(4, 'get', '/api/barbers/nearby/?lat=40.7&lng=-73.9&radius=200', owner, max_bytes=40000)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        self.assertQueryBudget(3, 'get', f'/api/barbers/{barber.pk}/availability/?date={tomorrow}', owner)
+        self.assertQueryBudget(2, 'get', '/api/barbers/analytics/', owner)
+        self.assertQueryBudget(2, 'get', '/api/barbers/calendar_feed/', owner)
+        self.assertQueryBudget(8, 'get', f'/api/barbers/{barber.pk}/profile/', owner, max_bytes=30000)
+
+    def test_booking_page(self):
+        path = f'/api/barbers/{self.barber.pk}/booking/'
+        self.assertQueryBudget(7, 'get', path, max_bytes=20000)
+        self.assertQueryBudget(7, 'get', path)  # Not cached in a per-process cache
+        with mock.patch('api.booking.shared_cache', return_value=True):
+            self.assertQueryBudget(7, 'get', path)
+            self.assertQueryBudget(0, 'get', path)
+
+    def test_search_and_map(self):
+        self.assertQueryBudget(4, 'get', '/api/barbers/search/?query=budget', max_bytes=40000)
+        self.assertQueryBudget(2, 'get', '/api/barbers/clusters/?bbox=-75,39,-72,42&zoom=20', max_bytes=5000)
+        token = Token.objects.create(user=self.owner)
+        with mock.patch('api.views.geocoding.address_suggestions', mock.AsyncMock(return_value=[])):
+            self.assertQueryBudget(
+                1, 'post', '/api/barbers/address_suggestions/', data={'query': 'Main St'},
+                HTTP_AUTHORIZATION=f'Token {token.key}',
+            )
+        # appointments/events/ is left out: it closes its connection between
+        # reads, which TestCase's transaction doesn't survive
+
+    def test_register(self):
+        self.assertQueryBudget(10, 'post', '/api/barbers/register/', data={
+            'email': 'new@example.com',
+            'password': 'budget-password',
+            'first_name': 'New',
+            'last_name': 'Barber',
+            'professional_category': self.barber.category_id,
+        }, status=201)
+
+    def test_complete_profile(self):
+        # Replacing the 3 services and 7 days seeded, which are tombstoned for sync
+        self.assertQueryBudget(30, 'post', '/api/barbers/complete_profile/', self.owner, {
+            'address': '1 Budget Street',
+            'latitude': 40.7,
+            'longitude': -73.9,
+            'years_of_experience': 5,
+            'services': [
+                {'name': 'budget service 0', 'price_adjustment': '25.00'},
+                {'name': 'budget service 1', 'price_adjustment': '30.00'},
+            ],
+            'working_hours': [
+                {'day': 'monday', 'start': '09:00', 'end': '17:00'},
+                {'day': 'tuesday', 'start': '09:00', 'end': '17:00'},
+            ],
+        }, max_bytes=6000)
+
+    def test_account_lifecycle(self):
+        owner = self.owner
+        self.assertQueryBudget(2, 'post', '/api/barbers/pause_account/', owner, {'duration': 7})
+        self.assertQueryBudget(2, 'post', '/api/barbers/unpause_account/', owner)
+        self.assertQueryBudget(2, 'post', '/api/barbers/calendar_feed/', owner)
+        # Cascades through every table that references the barber or user
+        self.assertQueryBudget(40, 'post', '/api/barbers/delete_account/', owner)
+
+    def test_working_hours(self):
+        owner = self.owner
+        hours = WorkingHours.objects.filter(barber=self.barber).first()
+        self.assertQueryBudget(2, 'get', '/api/working-hours/', owner)
+        self.assertQueryBudget(1, 'get', f'/api/working-hours/{hours.pk}/', owner)
+        self.assertQueryBudget(16, 'put', '/api/working-hours/bulk_update/', owner, {'working_hours': [
+            {'day': 'monday', 'start_time': '09:00', 'end_time': '17:00'},
+            {'day': 'tuesday', 'start_time': '09:00', 'end_time': '17:00'},
+        ]})
+        self.assertQueryBudget(10, 'delete', '/api/working-hours/delete_all/', owner)
+
+    def test_barber_services(self):
+        owner = self.owner
+        self.assertQueryBudget(2, 'get', '/api/barber-services/', owner)
+        service = self.barber.services.first()
+        self.assertQueryBudget(1, 'get', f'/api/barber-services/{service.pk}/', owner)
+        self.assertQueryBudget(10, 'put', '/api/barber-services/bulk_update/', owner, {'services': [
+            {'name': 'budget service 0', 'price_adjustment': '25.00'},
+            {'name': 'budget service 1', 'price_adjustment': '30.00'},
+        ]})
+        self.assertQueryBudget(6, 'delete', '/api/barber-services/delete_all/', owner)
+
+    def test_appointments(self):
+        owner, appointment = self.owner, self.appointment
+        self.assertQueryBudget(6, 'get', '/api/appointments/', owner, max_bytes=40000)
+        self.assertQueryBudget(5, 'get', '/api/appointments/upcoming/', owner, max_bytes=40000)
+        self.assertQueryBudget(5, 'get', f'/api/appointments/{appointment.pk}/', owner, max_bytes=6000)
+        # Validation, duration lookup, insert, event + NOTIFY, overlap check, nested barber
+        self.assertQueryBudget(11, 'post', '/api/appointments/', owner, {
+            'customer': 'Walk-in', 'barber': self.barber.pk, 'service': 'budget service 0',
+            'date': str(timezone.localdate() + timedelta(days=30)), 'start_time': '11:00',
+        }, status=201, max_bytes=6000)
+        self.assertQueryBudget(8, 'post', f'/api/appointments/{appointment.pk}/cancel/', owner)
+        tomorrow = timezone.localdate() + timedelta(days=1)
+        rows = [
+            {'customer': f'Imported {i}', 'date': str(tomorrow + timedelta(days=7 + i)),
+             'start_time': '10:00', 'end_time': '10:30', 'service': 'budget service 0'}
+            for i in range(20)
+        ]
+        self.assertQueryBudget(9, 'post', '/api/appointments/bulk_import/', owner, rows, status=201)
+        self.assertQueryBudget(2, 'get', '/api/appointments/export.csv', owner)
+
+    def test_reviews(self):
+        self.assertQueryBudget(2, 'get', '/api/reviews/', self.owner)
+        self.assertQueryBudget(2, 'get', f'/api/reviews/?barber={self.barber.pk}', self.customer)
+        review = Review.objects.filter(barber=self.barber).first()
+        self.assertQueryBudget(1, 'get', f'/api/reviews/{review.pk}/', self.owner)
+        self.assertQueryBudget(4, 'post', '/api/reviews/', self.customer, {
+            'barber': self.barber.pk, 'rating': 5, 'comment': 'Great',
+        }, status=201)
+
+    def test_portfolio(self):
+        barber, owner = self.barber, self.owner
+        self.assertQueryBudget(3, 'get', f'/api/barbers/{barber.pk}/portfolio/', owner, max_bytes=10000)
+        self.assertQueryBudget(2, 'get', f'/api/barbers/{barber.pk}/portfolio/{self.group.pk}/', owner)
+        self.assertQueryBudget(2, 'get', '/api/portfolio/', owner)
+        # Posts are only listed and retrieved under barbers/<id>/portfolio/
+        self.assertQueryBudget(1, 'get', f'/api/portfolio/{self.group.pk}/', owner, status=404)
+        self.assertQueryBudget(3, 'post', f'/api/barbers/{barber.pk}/portfolio/', owner, {
+            'barber': barber.pk, 'description': 'New post',
+        }, status=201)
+
+    def test_categories(self):
+        category = self.barber.category_id
+        self.assertQueryBudget(2, 'get', '/api/professional-categories/')
+        self.assertQueryBudget(1, 'get', f'/api/professional-categories/{category}/')
+        self.assertQueryBudget(1, 'get', '/api/professional-categories/all/')
+        self.assertQueryBudget(0, 'get', '/api/professional-categories/all/')
+
+    def test_browsable_api_login(self):
+        self.assertQueryBudget(0, 'get', '/api/auth/login/')
+        # POSTs to auth/login/ and auth/logout/ are left out: they are Django's
+        # session LoginView and LogoutView for the browsable API, so their
+        # queries are the session and auth backends', not this app's. Apps
+        # sign in through api/token/ instead
+
+    def test_dashboard(self):
+        barber, owner = self.barber, self.owner
+        self.assertQueryBudget(1, 'post', '/api/appointments/events/token/', owner)
+        self.assertQueryBudget(1, 'post', '/api/appointments/events/token/', self.customer, status=403)
+        self.assertQueryBudget(6, 'get', '/api/sync/', owner, max_bytes=20000)
+        token = self.call('get', '/api/sync/', owner)[0].data['token']
+        self.assertQueryBudget(7, 'get', f'/api/sync/?since={token}', owner)
+        self.assertQueryBudget(4, 'get', f'/api/calendar/{barber.calendar_token}.ics')
+        self.assertQueryBudget(1, 'get', '/api/profiles/unknown/', self.staff, status=404)
@@ -0,0 +1,86 @@
+"""
+Token-bucket throttles for the login endpoint, stored in the Django cache.
+
+Each bucket holds up to N tokens for a rate of 'N/period' and refills
+continuously at N per period. Every attempt takes a token; an empty bucket
+rejects the request in DRF's check_throttles(), before the view runs and
+before any password is hashed.
+
+A bucket is stored as the time (in ms) at which it will be full again, so
+taking a token is a single cache.incr and concurrent attempts from several
+workers can't both spend the last token. The key expires when the bucket is
+full, and the next attempt starts a new one with cache.add.
+"""
+import math
+
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """Token bucket variant of SimpleRateThrottle, keeping the time each bucket is full again"""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        self.now = self.timer()
+        now_ms = int(self.now * 1000)
+        interval = self.duration * 1000 // self.num_requests  # ms to refill one token
+        capacity = interval * self.num_requests
+
+        full_at = now_ms + interval
+        if not self.cache.add(self.key, full_at, self.expires_in(full_at, now_ms)):
+            try:
+                full_at = self.cache.incr(self.key, interval)
+            except ValueError:
+                # The bucket expired (became full) since the add
+                self.cache.set(self.key, full_at, self.expires_in(full_at, now_ms))
+
+        if full_at - now_ms > capacity:
+            # Empty: give the token back
+            try:
+                self.cache.decr(self.key, interval)
+            except ValueError:
+                pass
+            self.wait_time = (full_at - capacity - now_ms) / 1000
+            return False
+
+        self.cache.touch(self.key, self.expires_in(full_at, now_ms))
+        return True
+
+    def expires_in(self, full_at, now_ms):
+        """Cache timeout (whole seconds, as Redis keeps them) for a bucket full again at full_at"""
+        return max(1, math.ceil((full_at - now_ms) / 1000))
+
+    def wait(self):
+        return getattr(self, 'wait_time', None)
+
+
+class LoginIPThrottle(TokenBucketThrottle):
+    """Limits login attempts per client IP"""
+    scope = 'login_ip'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': self.get_ident(request)
+        }
+
+
+class LoginAccountThrottle(TokenBucketThrottle):
+    """Limits login attempts per account identifier, whichever IPs they come from"""
+    scope = 'login_account'
+
+    def get_cache_key(self, request, view):
+        # A JSON body may also be a list or a string
+        identifier = request.data.get('username') if isinstance(request.data, dict) else None
+        if not identifier:
+            return None
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': str(identifier).strip().lower()
+        }
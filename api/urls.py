@@ -15,8 +15,17 @@ router.register(r'professional-categories', views.ProfessionalCategoryViewSet, b
 
 urlpatterns = [
     path('barbers/search/', views.search_barbers, name='search-barbers'),
+    path('barbers/clusters/', views.barber_clusters, name='barber-clusters'),
+    path('barbers/address_suggestions/', views.address_suggestions, name='address-suggestions'),
+    path('appointments/events/token/', views.appointment_events_token, name='appointment-events-token'),
+    path('appointments/events/', views.appointment_events, name='appointment-events'),
+    path('appointments/export.csv', views.export_appointments_csv, name='appointment-export-csv'),
+    path('calendar/<str:token>.ics', views.appointment_calendar, name='appointment-calendar'),
+    path('sync/', views.sync_changes, name='sync'),
+    path('profiles/<str:profile_id>/', views.request_profile, name='request-profile'),
     path('', include(router.urls)),
     path('auth/', include('rest_framework.urls')),
     path('barbers/complete_profile/', views.BarberViewSet.as_view({'post': 'complete_profile'}), name='complete-profile'),
     path('barbers/<int:barber_id>/profile/', views.get_barber_profile, name='barber-profile'),
+    path('barbers/<int:barber_id>/booking/', views.barber_booking_page, name='barber-booking-page'),
 ] 
\ No newline at end of file
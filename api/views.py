@@ -1,7 +1,6 @@
-from django.shortcuts import render
 from django.contrib.auth.models import User
 from django.db.models import Q
-from rest_framework import viewsets, permissions, status, filters
+from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.authtoken.models import Token
@@ -9,19 +8,35 @@ from rest_framework.authtoken.views import ObtainAuthToken
 from rest_framework.views import APIView
 from datetime import datetime, timedelta
 from django.utils import timezone
-from django.contrib.auth import authenticate, get_user_model
-from django.core.exceptions import ObjectDoesNotExist
 import json
-from django.contrib.gis.geos import Point
+from django.contrib.gis.geos import Point, Polygon
 from django.contrib.gis.measure import D
 from django.contrib.gis.db.models.functions import Distance
-from rest_framework.authtoken.serializers import AuthTokenSerializer
 from django.shortcuts import get_object_or_404
 from rest_framework.permissions import IsAuthenticated, AllowAny
-import requests
-import math
 from django.conf import settings
-
+from django.core import signing
+from django.core.handlers.asgi import ASGIRequest
+from django.db import connection
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+import asyncio
+import hmac
+import logging
+from asgiref.sync import sync_to_async
+from rest_framework import exceptions
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from . import (
+    analytics, booking, clustering, db_router, events, exports, geocoding, importers, metrics, profiling, streaming, sync,
+)
+from .authentication import get_login_user
+from .cache import active_categories
+from .throttling import LoginAccountThrottle, LoginIPThrottle
 from .models import (
     Barber, WorkingHours, Appointment, Review, BarberPortfolio, BarberService, ProfessionalCategory, Service
 )
@@ -38,6 +53,9 @@ from .serializers import (
     ProfessionalCategorySerializer
 )
 
+logger = logging.getLogger(__name__)
+
+
 # Custom permissions
 class IsOwnerOrReadOnly(permissions.BasePermission):
     """
@@ -75,6 +93,9 @@ class IsBarberOrReadOnly(permissions.BasePermission):
 
 # Authentication views
 class CustomAuthToken(ObtainAuthToken):
+    # Rejected attempts are turned away before the password hash is checked
+    throttle_classes = [LoginIPThrottle, LoginAccountThrottle]
+
     def post(self, request, *args, **kwargs):
         username = request.data.get('username')
         password = request.data.get('password')
@@ -84,13 +105,10 @@ class CustomAuthToken(ObtainAuthToken):
                 'error': 'Both email/username and password are required.'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # First check if the user exists
-        UserModel = get_user_model()
-        try:
-            user = UserModel.objects.get(
-                Q(username__iexact=username) | Q(email__iexact=username)
-            )
-        except UserModel.DoesNotExist:
+        # First check if the user exists (same lookup as the authentication backend,
+        # so the profile data below comes from this single query)
+        user = get_login_user(username)
+        if user is None:
             return Response({
                 'error': 'Account not found. Please check your email/username or create a new account.'
             }, status=status.HTTP_404_NOT_FOUND)
@@ -288,12 +306,14 @@ class BarberViewSet(viewsets.ModelViewSet):
             user_location = Point(float(lng), float(lat), srid=4326)
             
             # Filter barbers within radius and order by distance
-            queryset = queryset.filter(
+            queryset = queryset.discoverable().filter(
                 location__distance_lte=(user_location, D(km=float(radius)))
             ).annotate(
                 distance=Distance('location', user_location)
             ).order_by('distance')
 
+        if self.action in ('list', 'retrieve'):
+            queryset = BarberSerializer.setup_eager_loading(queryset)
         return queryset
 
     @action(detail=False, methods=['GET'])
@@ -311,14 +331,16 @@ class BarberViewSet(viewsets.ModelViewSet):
         try:
             user_location = Point(float(lng), float(lat), srid=4326)
             
-            barbers = Barber.objects.filter(
+            barbers = Barber.objects.discoverable().filter(
                 location__distance_lte=(user_location, D(km=float(radius)))
             ).annotate(
                 distance=Distance('location', user_location)
             ).order_by('distance')
+            barbers = BarberSerializer.setup_eager_loading(barbers)
 
-            serializer = self.get_serializer(barbers, many=True)
-            return Response(serializer.data)
+            return streaming.list_response(
+                request, barbers, self.get_serializer_class(), self.get_serializer_context()
+            )
 
         except ValueError:
             return Response(
@@ -431,9 +453,8 @@ class BarberViewSet(viewsets.ModelViewSet):
                     result = serializer.save()
                     
                     # Get the updated barber with all related data
-                    barber_with_services = Barber.objects.prefetch_related(
-                        'services__service',
-                        'working_hours'
+                    barber_with_services = BarberSerializer.setup_eager_loading(
+                        Barber.objects.all()
                     ).get(id=barber.id)
                     
                     # Return the complete barber data
@@ -456,155 +477,6 @@ class BarberViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-    @action(detail=False, methods=['post'])
-    def address_suggestions(self, request):
-        """
-        Proxies a request to a geocoding API to get address suggestions with location bias.
-        """
-        query = request.data.get('query')
-        lat = request.data.get('lat')
-        lon = request.data.get('lon')
-        
-        if not query:
-            return Response({'error': 'Query parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
-
-        # Try multiple geocoding services for better reliability
-        services = [
-            {
-                'name': 'Nominatim',
-                'url': f"https://nominatim.openstreetmap.org/search",
-                'params': {
-                    'q': query,
-                    'format': 'json',
-                    'limit': 5,
-                    'addressdetails': 1
-                },
-                'headers': {
-                    'User-Agent': 'SoloApp/1.0 (https://github.com/your-repo)'
-                }
-            },
-            {
-                'name': 'Photon',
-                'url': f"https://photon.komoot.io/api/",
-                'params': {
-                    'q': query,
-                    'limit': 5
-                },
-                'headers': {}
-            }
-        ]
-
-        # Add location bias if coordinates are provided
-        if lat and lon:
-            # Add location bias to Nominatim (using viewbox instead of lat/lon for better results)
-            # Calculate a bounding box around the user's location (50km radius)
-            radius_km = 50
-            lat_delta = radius_km / 111.32  # Approximate km per degree latitude
-            lon_delta = radius_km / (111.32 * math.cos(math.radians(float(lat))))
-            
-            viewbox = [
-                float(lon) - lon_delta,  # min_lon
-                float(lat) - lat_delta,  # min_lat
-                float(lon) + lon_delta,  # max_lon
-                float(lat) + lat_delta   # max_lat
-            ]
-            
-            services[0]['params']['viewbox'] = ','.join(map(str, viewbox))
-            services[0]['params']['bounded'] = 1
-            
-            # Add location bias to Photon
-            services[1]['params']['lat'] = lat
-            services[1]['params']['lon'] = lon
-            services[1]['params']['radius'] = 50000  # 50km radius
-
-        for service in services:
-            try:
-                response = requests.get(
-                    service['url'], 
-                    params=service['params'],
-                    headers=service['headers'],
-                    timeout=5
-                )
-                
-                if response.status_code == 200:
-                    data = response.json()
-                    
-                    # Transform data based on service
-                    if service['name'] == 'Nominatim':
-                        suggestions = []
-                        for item in data:
-                            address = item.get('address', {})
-                            
-                            # Build clean address components
-                            street_number = address.get('house_number', '')
-                            street_name = address.get('road', '')
-                            city = address.get('city', address.get('town', ''))
-                            state = address.get('state', '')
-                            zip_code = address.get('postcode', '')
-                            
-                            # Create clean display name
-                            clean_address = []
-                            
-                            # Add street address if available
-                            if street_number and street_name:
-                                clean_address.append(f"{street_number} {street_name}")
-                            elif street_name:
-                                clean_address.append(street_name)
-                            
-                            # Add city if available
-                            if city:
-                                clean_address.append(city)
-                            
-                            # Add state if available
-                            if state:
-                                clean_address.append(state)
-                            
-                            # Add zip code if available
-                            if zip_code:
-                                clean_address.append(zip_code)
-                            
-                            # If we have a meaningful address, add it
-                            if len(clean_address) >= 2:  # At least city and state
-                                display_name = ', '.join(clean_address)
-                                suggestions.append({
-                                    'place_id': item.get('place_id'),
-                                    'display_name': display_name,
-                                    'lat': float(item.get('lat', 0)),
-                                    'lon': float(item.get('lon', 0))
-                                })
-                            # If it's just a city/place name, include it too
-                            elif city and state:
-                                display_name = f"{city}, {state}"
-                                if zip_code:
-                                    display_name += f", {zip_code}"
-                                suggestions.append({
-                                    'place_id': item.get('place_id'),
-                                    'display_name': display_name,
-                                    'lat': float(item.get('lat', 0)),
-                                    'lon': float(item.get('lon', 0))
-                                })
-                    
-                    elif service['name'] == 'Photon':
-                        suggestions = data.get('features', [])
-                        # Transform Photon format to match Nominatim
-                        suggestions = [
-                            {
-                                'place_id': f"photon_{i}",
-                                'display_name': feature.get('properties', {}).get('name', ''),
-                                'lat': feature.get('geometry', {}).get('coordinates', [0, 0])[1],
-                                'lon': feature.get('geometry', {}).get('coordinates', [0, 0])[0]
-                            }
-                            for i, feature in enumerate(suggestions)
-                        ]
-                    
-                    return Response(suggestions)
-                    
-            except requests.exceptions.RequestException as e:
-                continue  # Try next service
-        
-        # If all services fail, return empty results
-        return Response([], status=status.HTTP_200_OK)
-
     @action(detail=False, methods=['post'])
     def pause_account(self, request):
         """
@@ -669,6 +541,45 @@ class BarberViewSet(viewsets.ModelViewSet):
                 'error': 'Failed to unpause account'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @action(detail=False, methods=['get'])
+    def analytics(self, request):
+        """
+        Bookings per day, estimated revenue, cancellation rate and busiest hours
+        of the current barber over ?start=&end= (default: the last 30 days)
+        """
+        barber = Barber.objects.filter(user=request.user).first()
+        if barber is None:
+            return Response({'error': 'Barber profile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        try:
+            start, end = exports.parse_date_range(request.query_params)
+        except ValueError:
+            return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+        end = end or timezone.localdate()
+        start = start or end - timedelta(days=29)
+        if start > end or (end - start).days >= settings.ANALYTICS_MAX_DAYS:
+            return Response({
+                'error': f'The range must be between 1 and {settings.ANALYTICS_MAX_DAYS} days.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        return Response(analytics.summary(barber.id, start, end))
+
+    @action(detail=False, methods=['get', 'post'])
+    def calendar_feed(self, request):
+        """
+        URL of the current barber's .ics appointment feed. POST issues a new
+        URL, after which the old one stops working.
+        """
+        barber = Barber.objects.filter(user=request.user).first()
+        if barber is None:
+            return Response({'error': 'Barber profile not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        if request.method == 'POST' or not barber.calendar_token:
+            barber.rotate_calendar_token()
+        return Response({
+            'url': request.build_absolute_uri(reverse('appointment-calendar', args=[barber.calendar_token]))
+        })
+
     @action(detail=False, methods=['post'])
     def delete_account(self, request):
         """Delete the current user's barber account"""
@@ -682,7 +593,7 @@ class BarberViewSet(viewsets.ModelViewSet):
             # Store the deletion reason (optional - for analytics)
             if reason:
                 # You could store this in a separate model for analytics
-                print(f"Account deletion reason: {reason}")
+                logger.info('Barber account deleted', extra={'user_id': user.pk, 'reason': reason})
             
             # Delete the barber profile first (this will cascade to related data)
             barber.delete()
@@ -713,45 +624,21 @@ class BarberViewSet(viewsets.ModelViewSet):
         except ValueError:
             return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Get day of week (0 = Monday, 6 = Sunday)
-        day_of_week = date.weekday()
-        
         # Check if barber works on this day
-        try:
-            working_hours = WorkingHours.objects.get(barber=barber, day_of_week=day_of_week, is_working=True)
-        except WorkingHours.DoesNotExist:
+        working_hours = booking.working_hours_for(date, WorkingHours.objects.filter(barber=barber))
+        if working_hours is None:
             return Response({"available": False, "message": "Barber does not work on this day"})
         
-        # Get all appointments for this barber on this date
+        # Generate available 30-minute time slots around the day's appointments
         appointments = Appointment.objects.filter(
             barber=barber,
             date=date,
-            status__in=['scheduled', 'confirmed']
-        ).order_by('start_time')
-        
-        # Generate available time slots
-        available_slots = []
-        current_time = working_hours.start_time
-        
-        while current_time < working_hours.end_time:
-            # Check if this time slot overlaps with any appointment
-            is_available = True
-            slot_end_time = (datetime.combine(date, current_time) + timedelta(minutes=30)).time()
-            
-            for appointment in appointments:
-                if (current_time < appointment.end_time and 
-                    slot_end_time > appointment.start_time):
-                    is_available = False
-                    break
-            
-            if is_available:
-                available_slots.append({
-                    "start_time": current_time.strftime('%H:%M'),
-                    "end_time": slot_end_time.strftime('%H:%M')
-                })
-            
-            # Move to next 30-minute slot
-            current_time = slot_end_time
+            status__in=booking.BLOCKING_STATUSES
+        ).values_list('start_time', 'end_time')
+        available_slots = [
+            {"start_time": start.strftime('%H:%M'), "end_time": end.strftime('%H:%M')}
+            for start, end in booking.available_slots(date, working_hours, list(appointments))
+        ]
         
         return Response({
             "available": True,
@@ -832,7 +719,7 @@ class BarberServiceViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return BarberService.objects.filter(barber__user=self.request.user)
+        return BarberService.objects.filter(barber__user=self.request.user).select_related('service')
 
     @action(detail=False, methods=['PUT'])
     def bulk_update(self, request):
@@ -933,7 +820,9 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         date = self.request.query_params.get('date', None)
         if date:
             queryset = queryset.filter(date=date)
-        
+
+        if self.action in ('list', 'retrieve', 'upcoming', 'cancel'):
+            queryset = BarberSerializer.setup_eager_loading(queryset, prefix='barber__')
         return queryset.order_by('date', 'start_time')
     
     @action(detail=False, methods=['get'])
@@ -951,6 +840,50 @@ class AppointmentViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer(upcoming_appointments, many=True)
         return Response(serializer.data)
     
+    @action(detail=False, methods=['post'])
+    def bulk_import(self, request):
+        """
+        Import existing appointments for the current barber from an uploaded
+        CSV or JSON file (`file`), or a JSON list in the body. Valid rows are
+        created; the rest are reported with their row number.
+        """
+        barber = Barber.objects.filter(user=request.user).first()
+        if barber is None:
+            return Response({
+                'error': 'You must be a barber to import appointments.'
+            }, status=status.HTTP_403_FORBIDDEN)
+
+        upload = request.FILES.get('file')
+        try:
+            if upload is not None:
+                fmt = request.data.get('format') or upload.name.rsplit('.', 1)[-1].lower()
+                rows = importers.read_rows(upload.read(), fmt)
+            else:
+                rows = importers.rows_from_data(request.data)
+        except importers.ImportFormatError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        if len(rows) > settings.IMPORT_MAX_ROWS:
+            return Response({
+                'error': f'Imports are limited to {settings.IMPORT_MAX_ROWS} rows; split the file.'
+            }, status=status.HTTP_400_BAD_REQUEST)
+
+        dry_run = str(request.query_params.get('dry_run', '')).lower() in ('1', 'true')
+        result = importers.import_appointments(barber, rows, dry_run=dry_run)
+        return Response(result, status=status.HTTP_200_OK if dry_run else status.HTTP_201_CREATED)
+
+    def perform_create(self, serializer):
+        appointment = serializer.save()
+        if appointment.status in booking.BLOCKING_STATUSES and Appointment.objects.filter(
+            barber_id=appointment.barber_id,
+            date=appointment.date,
+            status__in=booking.BLOCKING_STATUSES,
+            start_time__lt=appointment.end_time,
+            end_time__gt=appointment.start_time,
+        ).exclude(pk=appointment.pk).exists():
+            # Overlapping bookings are still accepted; they're only counted
+            metrics.BOOKING_CONFLICTS.labels(source='api').inc()
+
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
         appointment = self.get_object()
@@ -977,12 +910,12 @@ class ReviewViewSet(viewsets.ModelViewSet):
         # 3. All reviews for the current user if they are a barber
         barber_id = self.request.query_params.get('barber', None)
         if barber_id:
-            return Review.objects.filter(barber_id=barber_id)
+            return Review.objects.filter(barber_id=barber_id).select_related('customer')
         
         return Review.objects.filter(
             Q(customer=self.request.user) | 
             Q(barber__user=self.request.user)
-        )
+        ).select_related('customer')
     
     def create(self, request, *args, **kwargs):
         # Check if user is a barber
@@ -1080,14 +1013,13 @@ class BarberPortfolioViewSet(viewsets.ModelViewSet):
 def get_barber_profile(request, barber_id):
     try:
         barber = Barber.objects.select_related('user').prefetch_related(
-            'appointments',
-            'services'
+            'services__service'
         ).get(id=barber_id)
 
         # Get upcoming appointments
-        upcoming_appointments = Appointment.objects.filter(
-            barber=barber,
-            date__gte=timezone.now()
+        upcoming_appointments = BarberSerializer.setup_eager_loading(
+            Appointment.objects.filter(barber=barber, date__gte=timezone.now()),
+            prefix='barber__',
         ).order_by('date')
 
         # Get user's location from query params if provided
@@ -1165,6 +1097,20 @@ def get_barber_profile(request, barber_id):
         )
 
 
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def barber_booking_page(request, barber_id):
+    """
+    Everything a customer's booking page needs in one response: profile,
+    active services, weekly hours, first portfolio page, rating summary and
+    the open slots of the coming days
+    """
+    page = booking.booking_page(barber_id, request)
+    if page is None:
+        return Response({"error": "Barber not found"}, status=status.HTTP_404_NOT_FOUND)
+    return Response(page)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def search_barbers(request):
@@ -1191,8 +1137,9 @@ def search_barbers(request):
     barbers_by_location = Barber.objects.filter(
         Q(address__icontains=query)
     )
-    # Combine and deduplicate
-    barbers = (barbers_by_name | barbers_by_service | barbers_by_location).distinct()
+    # Combine and deduplicate, hiding paused and unavailable barbers. Barbers
+    # without coordinates still match a text search.
+    barbers = (barbers_by_name | barbers_by_service | barbers_by_location).distinct().active()
 
     # Filter by category if provided
     if category_id:
@@ -1201,14 +1148,367 @@ def search_barbers(request):
     # If lat/lng provided, filter and sort by distance
     if lat and lng:
         user_location = Point(float(lng), float(lat), srid=4326)
-        barbers = barbers.filter(
+        barbers = barbers.discoverable().filter(
             location__distance_lte=(user_location, D(km=radius))
         ).annotate(
             distance=Distance('location', user_location)
         ).order_by('distance')
 
-    serializer = BarberSerializer(barbers, many=True, context={'request': request})
-    return Response(serializer.data)
+    return streaming.list_response(request, BarberSerializer.setup_eager_loading(barbers), BarberSerializer)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def barber_clusters(request):
+    """
+    Map markers for a bounding box. Zoomed-out views get precomputed grid
+    clusters; once the box holds few enough barbers (or the zoom is past the
+    clustered levels) the individual barbers are returned instead, at most
+    BARBER_CLUSTER_MAX_POINTS of them ('truncated' tells the client when
+    there were more).
+    """
+    try:
+        min_lng, min_lat, max_lng, max_lat = [float(v) for v in request.GET.get('bbox', '').split(',')]
+        zoom = int(request.GET.get('zoom', ''))
+    except ValueError:
+        return Response(
+            {'error': 'bbox (min_lng,min_lat,max_lng,max_lat) and zoom are required.'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    try:
+        category_id = int(request.GET['category']) if request.GET.get('category') else None
+    except ValueError:
+        return Response({'error': 'category must be a category id.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    if zoom <= settings.BARBER_CLUSTER_MAX_ZOOM:
+        zoom = max(zoom, settings.BARBER_CLUSTER_MIN_ZOOM)
+        clusters = []
+        for cluster in clustering.clusters_in_bbox(zoom, min_lng, min_lat, max_lng, max_lat):
+            count = cluster.category_counts.get(str(category_id), 0) if category_id else cluster.count
+            if count:
+                clusters.append((cluster, count))
+
+        if sum(count for _, count in clusters) > settings.BARBER_CLUSTER_POINT_THRESHOLD:
+            return Response({
+                'type': 'FeatureCollection',
+                'zoom': zoom,
+                'clustered': True,
+                'features': [
+                    {
+                        'type': 'Feature',
+                        'geometry': {
+                            'type': 'Point',
+                            'coordinates': [cluster.centroid.x, cluster.centroid.y]
+                        },
+                        'properties': {
+                            'cluster': True,
+                            'count': count,
+                            # Only the filtered category, so the counts add up
+                            'categories': {str(category_id): count} if category_id else cluster.category_counts
+                        }
+                    }
+                    for cluster, count in clusters
+                ]
+            })
+
+    barbers = Barber.objects.discoverable().filter(
+        location__intersects=Polygon.from_bbox((min_lng, min_lat, max_lng, max_lat))
+    ).select_related('user', 'category')
+    if category_id:
+        barbers = barbers.filter(category_id=category_id)
+    # Past the clustered zooms the box can be as large as the client asks for
+    limit = settings.BARBER_CLUSTER_MAX_POINTS
+    barbers = list(barbers.order_by('id')[:limit + 1])
+
+    return Response({
+        'type': 'FeatureCollection',
+        'zoom': zoom,
+        'clustered': False,
+        'truncated': len(barbers) > limit,
+        'features': [
+            {
+                'type': 'Feature',
+                'geometry': {
+                    'type': 'Point',
+                    'coordinates': [barber.location.x, barber.location.y]
+                },
+                'properties': {
+                    'cluster': False,
+                    'id': barber.id,
+                    'name': barber.full_name,
+                    'category': barber.category.slug if barber.category else None,
+                    'address': barber.address,
+                    'average_rating': barber.average_rating
+                }
+            }
+            for barber in barbers[:limit]
+        ]
+    })
+
+
+@api_view(['GET'])
+def sync_changes(request):
+    """
+    Delta sync for the barber dashboard.
+
+    Pass ?since=<token> from the previous response to get only the rows
+    created, updated or deleted after it; omit it for a full snapshot.
+    """
+    barber = Barber.objects.filter(user=request.user).first()
+    if barber is None:
+        return Response({
+            'error': 'You must be a barber to sync dashboard data.'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    since = request.query_params.get('since')
+    if since:
+        try:
+            since = sync.parse_token(since)
+        except (ValueError, OverflowError, OSError):
+            return Response({'error': 'Invalid sync token.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    return Response(sync.changes(barber, since or None, context={'request': request}))
+
+
+@api_view(['GET'])
+def export_appointments_csv(request):
+    """The current barber's appointments as CSV, optionally limited with ?start=&end="""
+    barber = Barber.objects.filter(user=request.user).first()
+    if barber is None:
+        return Response({
+            'error': 'You must be a barber to export appointments.'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    try:
+        start, end = exports.parse_date_range(request.query_params)
+    except ValueError:
+        return Response({"error": "Invalid date format. Use YYYY-MM-DD"}, status=status.HTTP_400_BAD_REQUEST)
+
+    appointments = exports.appointments_for_export(barber, start, end).using(db_router.read_alias())
+    response = streaming.streaming_response(request, exports.csv_chunks(appointments), content_type='text/csv')
+    response['Content-Disposition'] = 'attachment; filename="appointments.csv"'
+    return response
+
+
+@require_safe
+def appointment_calendar(request, token):
+    """
+    iCalendar feed of a barber's appointments for calendar app subscriptions.
+    The secret token in the URL replaces authentication.
+    """
+    barber = Barber.objects.select_related('user').filter(calendar_token=token).first()
+    if barber is None:
+        return HttpResponse(status=status.HTTP_404_NOT_FOUND)
+
+    try:
+        start, end = exports.parse_date_range(request.GET)
+    except ValueError:
+        return HttpResponse('Invalid date format. Use YYYY-MM-DD', status=status.HTTP_400_BAD_REQUEST)
+
+    appointments = exports.appointments_for_export(barber, start, end).using(db_router.read_alias())
+    etag, last_modified = exports.feed_validators(barber, appointments)
+    last_modified = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = streaming.streaming_response(
+            request,
+            exports.ics_chunks(barber, appointments, request.get_host()),
+            content_type='text/calendar; charset=utf-8',
+        )
+    response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+@require_safe
+def metrics_view(request):
+    """Prometheus scrape endpoint; requires `Authorization: Bearer <METRICS_TOKEN>` when that is set"""
+    if settings.METRICS_TOKEN and not hmac.compare_digest(
+        request.headers.get('Authorization', '').encode(), f'Bearer {settings.METRICS_TOKEN}'.encode()
+    ):
+        return HttpResponse(status=status.HTTP_401_UNAUTHORIZED)
+    content, content_type = metrics.render()
+    return HttpResponse(content, content_type=content_type)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAdminUser])
+def request_profile(request, profile_id):
+    """
+    Download a profile recorded by RequestProfilingMiddleware: collapsed stacks
+    for sampled requests, a pstats file for cProfile ones (?format=text for a
+    readable summary).
+    """
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        return Response({'error': 'Profile not found or expired.'}, status=status.HTTP_404_NOT_FOUND)
+
+    content, content_type, filename = profiling.render_profile(profile, text=request.GET.get('format') == 'text')
+    response = HttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['X-Profiled-Request'] = f'{profile.method} {profile.path} -> {profile.status}'
+    return response
+
+
+def _api_request(request):
+    """
+    Wrap a plain Django request in a DRF Request, running the configured
+    authentication (including the CSRF check for session auth) and parsing the
+    body. Used by async views, which DRF's view classes don't support yet.
+    """
+    drf_request = Request(
+        request,
+        parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES],
+        authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    )
+    if not drf_request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    drf_request.data  # Parse the body while still in a sync context
+    return drf_request
+
+
+async def address_suggestions(request):
+    """
+    Proxies a request to a geocoding API to get address suggestions with location bias.
+    Async so that under ASGI the worker isn't blocked on the outbound HTTP calls.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    try:
+        drf_request = await sync_to_async(_api_request)(request)
+    except exceptions.APIException as exc:
+        return JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+
+    query = drf_request.data.get('query')
+    lat = drf_request.data.get('lat')
+    lon = drf_request.data.get('lon')
+
+    if not query:
+        return JsonResponse({'error': 'Query parameter is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    suggestions = await geocoding.address_suggestions(query, lat, lon)
+    return JsonResponse(suggestions, safe=False)
+
+
+# csrf_exempt() would wrap the coroutine in a sync function, so mark it directly.
+# Like the DRF views, CSRF is only enforced for session authentication.
+address_suggestions.csrf_exempt = True
+
+
+@api_view(['POST'])
+def appointment_events_token(request):
+    """Short-lived token for opening the appointment event feed with EventSource"""
+    barber = Barber.objects.filter(user=request.user).first()
+    if not barber:
+        return Response({
+            'error': 'You must be a barber to view appointments.'
+        }, status=status.HTTP_403_FORBIDDEN)
+    return Response({
+        'token': events.make_stream_token(barber.id),
+        'expires_in': settings.APPOINTMENT_EVENTS_TOKEN_SECONDS,
+    })
+
+
+async def appointment_events(request):
+    """
+    Server-sent events feed of the current barber's appointment changes.
+
+    EventSource can't set headers, so browsers pass a stream token from
+    appointment_events_token as ?token= instead of their API token, which
+    would be written to access logs. Other clients may send the usual
+    Authorization header. Clients resume with the Last-Event-ID header (sent automatically on
+    reconnect) or ?last_event_id=. Under ASGI the stream stays open and is
+    woken by Postgres notifications; under WSGI it returns the pending events
+    and asks the client to reconnect later, so it never ties up a worker.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'detail': f'Method "{request.method}" not allowed.'}, status=status.HTTP_405_METHOD_NOT_ALLOWED)
+
+    token = request.GET.get('token')
+
+    def get_barber():
+        if token:
+            try:
+                barber_id = events.read_stream_token(token)
+            except signing.BadSignature:
+                raise exceptions.AuthenticationFailed('Invalid or expired stream token.')
+            return Barber.objects.filter(pk=barber_id).first()
+        drf_request = _api_request(request)
+        return Barber.objects.filter(user=drf_request.user).first()
+
+    try:
+        barber = await sync_to_async(get_barber)()
+    except exceptions.APIException as exc:
+        return JsonResponse({'detail': str(exc.detail)}, status=exc.status_code)
+    if barber is None:
+        return JsonResponse({
+            'error': 'You must be a barber to view appointments.'
+        }, status=status.HTTP_403_FORBIDDEN)
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid last event id.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    def read_events(after_id):
+        # Close the connection afterwards so idle streams don't each hold one
+        try:
+            return events.events_since(barber.id, after_id)
+        finally:
+            connection.close()
+
+    def starting_point():
+        try:
+            if last_event_id is None:
+                return events.latest_event_id(), False
+            return last_event_id, events.history_pruned_after(last_event_id)
+        finally:
+            connection.close()
+
+    after_id, pruned = await sync_to_async(starting_point)()
+    streaming = isinstance(request, ASGIRequest)
+
+    async def stream():
+        nonlocal after_id
+        retry_ms = settings.APPOINTMENT_EVENTS_RETRY_MS if streaming else settings.APPOINTMENT_EVENTS_POLL_RETRY_MS
+        # The id sets the browser's lastEventId before any event arrives, so a
+        # reconnect resumes from here instead of starting over at the latest
+        yield f'retry: {retry_ms}\nid: {after_id}\n\n'
+        if pruned:
+            # Part of the history is gone: tell the client to reload the list
+            yield 'event: reset\ndata: {}\n\n'
+
+        wake = events.listener.subscribe(barber.id) if streaming else None
+        try:
+            while True:
+                batch = await sync_to_async(read_events)(after_id)
+                for event in batch:
+                    yield events.format_event(event)
+                    after_id = event.id
+                if len(batch) == events.BATCH_SIZE:
+                    continue
+                if not streaming:
+                    return
+                try:
+                    await asyncio.wait_for(wake.wait(), timeout=settings.APPOINTMENT_EVENTS_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ': keepalive\n\n'
+                wake.clear()
+        finally:
+            if wake is not None:
+                events.listener.unsubscribe(barber.id, wake)
+
+    if streaming:
+        response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    else:
+        response = HttpResponse(''.join([chunk async for chunk in stream()]), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
 
 class ProfessionalCategoryViewSet(viewsets.ReadOnlyModelViewSet):
@@ -1220,6 +1520,4 @@ class ProfessionalCategoryViewSet(viewsets.ReadOnlyModelViewSet):
     @action(detail=False, methods=['get'])
     def all(self, request):
         """Get all active professional categories"""
-        categories = ProfessionalCategory.objects.filter(is_active=True)
-        serializer = self.get_serializer(categories, many=True)
-        return Response(serializer.data)
+        return Response(active_categories())
@@ -0,0 +1,60 @@
+"""
+Worker warm-up and boot timing.
+
+gunicorn loads the application in its master process (preload_app) and calls
+warm_up() from its when_ready hook, before any worker is forked. The URLconf,
+and with it the views, serializers and renderers, is imported once, and the
+shared catalogue caches are primed. Workers then start from a copy of that
+process and serve their first request without paying for either.
+
+Every process logs how long after process start (and after its fork, under
+gunicorn) it served its first request.
+"""
+import logging
+import os
+import time
+
+from django.core.cache import caches
+from django.core.signals import request_finished
+from django.db import connections
+from django.urls import get_resolver
+
+from .cache import active_categories, service_durations
+
+logger = logging.getLogger(__name__)
+
+# gunicorn.conf.py sets these in the master and in each forked worker
+PROCESS_STARTED_AT = float(os.environ.get('PROCESS_STARTED_AT', time.time()))
+
+
+def warm_up():
+    started = time.perf_counter()
+    get_resolver().url_patterns  # imports the views, serializers and renderers
+    try:
+        active_categories()
+        service_durations()
+    except Exception:
+        # A cold cache only costs the first requests a query; don't block boot
+        logger.exception('Priming the catalogue caches failed')
+    finally:
+        # Forked workers must not share the master's sockets
+        connections.close_all()
+        for cache in caches.all():
+            cache.close()
+    logger.info('Warm-up finished in %.0f ms', (time.perf_counter() - started) * 1000)
+
+
+def log_first_request(sender, **kwargs):
+    request_finished.disconnect(log_first_request)
+    now = time.time()
+    worker_started_at = os.environ.get('WORKER_STARTED_AT')
+    if worker_started_at:
+        logger.info(
+            'First request served %.2f s after process start (%.2f s after worker fork)',
+            now - PROCESS_STARTED_AT, now - float(worker_started_at),
+        )
+    else:
+        logger.info('First request served %.2f s after process start', now - PROCESS_STARTED_AT)
+
+
+request_finished.connect(log_first_request)
@@ -13,6 +13,8 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -52,11 +54,16 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',  # Must be first
+    'api.logs.RequestIdMiddleware',
+    'api.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
+    'api.slow_queries.SlowQueryContextMiddleware',
+    'api.db_router.ReplicaRoutingMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'api.profiling.RequestProfilingMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -129,6 +136,66 @@ else:
         }
     }
 
+# Read replicas (see api/db_router.py): comma-separated database URLs. Safe
+# API reads go to a replica unless the client wrote in the last few seconds
+# or the replica lags. Tests mirror the replicas onto the test database.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+DATABASE_REPLICAS = []
+if DATABASE_REPLICA_URLS:
+    import dj_database_url
+
+    for index, url in enumerate(DATABASE_REPLICA_URLS, 1):
+        alias = f'replica_{index}'
+        DATABASES[alias] = {
+            **dj_database_url.parse(url),
+            'ENGINE': DATABASES['default']['ENGINE'],
+            'TEST': {'MIRROR': 'default'},
+        }
+        DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['api.db_router.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '5'))
+# Keep below SYNC_OVERLAP_SECONDS so delta sync never skips rows on a replica
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '2'))
+REPLICA_LAG_CHECK_SECONDS = 2
+# Read from the primary: the event feed is woken by notifications from the primary
+REPLICA_EXCLUDED_PATHS = ['/api/appointments/events/']
+
+# Direct (unpooled) connection to the primary, for the session features a
+# transaction-mode pooler can't provide: the LISTEN behind the appointment
+# event feed and the release command's advisory lock. Defaults to 'default'.
+DATABASE_DIRECT_URL = os.environ.get('DATABASE_DIRECT_URL')
+DIRECT_DATABASE = 'default'
+if DATABASE_DIRECT_URL:
+    import dj_database_url
+
+    DATABASES['direct'] = {
+        **dj_database_url.parse(DATABASE_DIRECT_URL),
+        'ENGINE': DATABASES['default']['ENGINE'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DIRECT_DATABASE = 'direct'
+
+# Connection lifecycle, applied to every alias above.
+# - DB_CONN_MAX_AGE: seconds a worker keeps its connection between requests
+#   (0 closes it after every request). Connections are health-checked before
+#   their first use in a request, so a dropped one is replaced instead of
+#   failing the request. Under ASGI each request may run in a different
+#   thread, so the default there is 0.
+# - DB_PGBOUNCER=transaction: behind pgbouncer in transaction mode, where
+#   server-side cursors don't survive between transactions. Set
+#   DATABASE_DIRECT_URL as well.
+DB_CONN_MAX_AGE = int(os.environ.get(
+    'DB_CONN_MAX_AGE', '0' if os.environ.get('WEB_SERVER_MODE', 'wsgi').lower() == 'asgi' else '60'
+))
+DB_PGBOUNCER = os.environ.get('DB_PGBOUNCER', '').lower() == 'transaction'
+
+for alias, database in DATABASES.items():
+    database['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+    database['CONN_HEALTH_CHECKS'] = DB_CONN_MAX_AGE > 0
+    if DB_PGBOUNCER and alias != 'direct':
+        database['DISABLE_SERVER_SIDE_CURSORS'] = True
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -181,10 +248,102 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # orjson-backed JSON (see api/renderers.py); output matches DRF's JSONRenderer.
+    # Mobile clients may ask for MessagePack with Accept: application/msgpack.
+    'DEFAULT_RENDERER_CLASSES': [
+        'api.renderers.ORJSONRenderer',
+        'api.renderers.MessagePackRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'api.renderers.ORJSONParser',
+        'api.renderers.MessagePackParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # Token buckets for /api/token/ (see api/throttling.py): N attempts of burst,
+    # refilled at N per period
+    'DEFAULT_THROTTLE_RATES': {
+        'login_ip': os.environ.get('LOGIN_IP_THROTTLE_RATE', '30/min'),
+        'login_account': os.environ.get('LOGIN_ACCOUNT_THROTTLE_RATE', '10/min'),
+    },
+    # Number of reverse proxies in front of gunicorn, used to find the client IP
+    'NUM_PROXIES': int(os.environ['NUM_PROXIES']) if os.environ.get('NUM_PROXIES') else None,
 }
 
+# Appointment event feed (see api/events.py)
+APPOINTMENT_EVENTS_HEARTBEAT_SECONDS = 15
+# Reconnect delay sent to EventSource clients when streaming (ASGI) and when
+# each response only carries the pending events (WSGI). The WSGI delay matches
+# the dashboard's 5-minute list refresh so polling costs no more than it did.
+APPOINTMENT_EVENTS_RETRY_MS = 3000
+APPOINTMENT_EVENTS_POLL_RETRY_MS = 300000
+# Lifetime of the stream tokens browsers open the feed with
+APPOINTMENT_EVENTS_TOKEN_SECONDS = 600
+APPOINTMENT_EVENT_RETENTION_DAYS = 7
+
+# Dashboard delta sync (see api/sync.py). Clients whose token is older than the
+# tombstone retention get a full snapshot.
+SYNC_TOMBSTONE_RETENTION_DAYS = 30
+SYNC_OVERLAP_SECONDS = 5
+
+# Rows per database fetch and per written chunk of streamed list responses
+# (see api/streaming.py)
+STREAMING_CHUNK_SIZE = 200
+
+# Bulk appointment import (see api/importers.py)
+IMPORT_BATCH_SIZE = 500
+IMPORT_MAX_ROWS = 20000
+
+# Longest range served by the barber analytics endpoint (see api/analytics.py)
+ANALYTICS_MAX_DAYS = 366
+
+# Categories and service templates cached for every worker (see api/cache.py)
+CATALOG_CACHE_SECONDS = 3600
+
+# Prometheus scrapes /metrics (see api/metrics.py); when METRICS_TOKEN is set
+# the scraper must send it as a bearer token. Production requires one, so the
+# metrics are never public there.
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+if IS_PRODUCTION and not METRICS_TOKEN:
+    raise ImproperlyConfigured('METRICS_TOKEN must be set in production')
+
+# Slow query log, kept in the admin (see api/slow_queries.py). A threshold of
+# 0 turns it off.
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get('SLOW_QUERY_THRESHOLD_MS', '200'))
+SLOW_QUERY_EXPLAIN_SAMPLE_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_SAMPLE_RATE', '0.1'))
+SLOW_QUERY_LOG_SIZE = 1000
+
+# Staff-only per-request profiling with ?_profile= or X-Profile (see
+# api/profiling.py)
+REQUEST_PROFILING_ENABLED = os.environ.get('REQUEST_PROFILING_ENABLED', 'True').lower() == 'true'
+REQUEST_PROFILE_SAMPLE_INTERVAL = 0.001
+REQUEST_PROFILE_RETENTION_SECONDS = 3600
+
+# Customer booking page (see api/booking.py)
+BOOKING_PAGE_DAYS = 14
+BOOKING_PAGE_CACHE_SECONDS = 300
+
+# Cache
+# Throttle buckets and cached data are shared by all workers when REDIS_URL is
+# set; otherwise every process keeps its own in-memory cache.
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 # Media files settings
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
@@ -202,6 +361,18 @@ LEAFLET_CONFIG = {
     'ATTRIBUTION_PREFIX': 'Barber App Locations'
 }
 
+# Map clustering (see api/clustering.py)
+# Zoom levels up to BARBER_CLUSTER_MAX_ZOOM have precomputed grid clusters;
+# a bounding box with at most BARBER_CLUSTER_POINT_THRESHOLD barbers is
+# returned as individual barbers instead.
+BARBER_CLUSTER_MIN_ZOOM = LEAFLET_CONFIG['MIN_ZOOM']
+BARBER_CLUSTER_MAX_ZOOM = 14
+BARBER_CLUSTER_CELLS_PER_TILE = 4
+BARBER_CLUSTER_POINT_THRESHOLD = int(os.environ.get('BARBER_CLUSTER_POINT_THRESHOLD', 200))
+# Most individual barbers returned for one bounding box past the clustered
+# zoom levels, however large the box
+BARBER_CLUSTER_MAX_POINTS = int(os.environ.get('BARBER_CLUSTER_MAX_POINTS', 500))
+
 # GeoDjango settings
 if os.name == 'posix':
     GDAL_LIBRARY_PATH = '/opt/homebrew/lib/libgdal.dylib'
@@ -212,25 +383,47 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
-# Debug logging
+# Logging (see api/logs.py)
+# Records are written as JSON lines (LOG_FORMAT=json, the production default)
+# or plain text by a background thread. LOG_LEVELS overrides single loggers,
+# e.g. "api=DEBUG,django.db.backends=DEBUG"; DEBUG records are sampled at
+# LOG_DEBUG_SAMPLE_RATE per request.
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json' if IS_PRODUCTION else 'plain')
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_DEBUG_SAMPLE_RATE = float(os.environ.get('LOG_DEBUG_SAMPLE_RATE', '1' if not IS_PRODUCTION else '0.01'))
+LOG_LEVELS = {
+    'api': 'INFO' if IS_PRODUCTION else 'DEBUG',
+    'corsheaders': 'WARNING',
+    'django': 'INFO',
+    'django.db.backends': 'WARNING',
+}
+LOG_LEVELS.update(
+    entry.strip().split('=', 1) for entry in os.environ.get('LOG_LEVELS', '').split(',') if '=' in entry
+)
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'api.logs.RequestIdFilter'},
+        'sample_debug': {'()': 'api.logs.SamplingFilter', 'rate': LOG_DEBUG_SAMPLE_RATE},
+    },
+    'formatters': {
+        'json': {'()': 'api.logs.JsonFormatter'},
+        'plain': {'format': '%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s'},
+    },
     'handlers': {
         'console': {
-            'class': 'logging.StreamHandler',
+            'class': 'api.logs.QueueHandler',
+            'formatter': LOG_FORMAT,
+            'filters': ['request_id', 'sample_debug'],
         },
     },
-    'loggers': {
-        'corsheaders': {
-            'handlers': ['console'],
-            'level': 'DEBUG' if not IS_PRODUCTION else 'WARNING',
-        },
-        'django': {
-            'handlers': ['console'],
-            'level': 'INFO' if IS_PRODUCTION else 'DEBUG',
-        },
+    'root': {
+        'handlers': ['console'],
+        'level': LOG_LEVEL,
     },
+    'loggers': {name: {'level': level} for name, level in LOG_LEVELS.items()},
 }
 
 # Production-specific settings
@@ -245,6 +438,10 @@ if IS_PRODUCTION:
     # SESSION_COOKIE_SECURE = True
     # CSRF_COOKIE_SECURE = True
     
-    # Static files
+    # Static files, with content-hashed names from the collectstatic manifest
     STATIC_ROOT = BASE_DIR / 'staticfiles'
+    STORAGES = {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.ManifestStaticFilesStorage'},
+    }
     MEDIA_ROOT = BASE_DIR / 'mediafiles'
@@ -11,6 +11,7 @@ import { usePortfolio } from '../contexts/PortfolioContext';
 import { extractProfileData, formatDistance, getLocationInfo } from '../utils/geoUtils';
 import useSWR from 'swr';
 import { parse, format } from 'date-fns';
+import { API_BASE_URL } from '../config/config';
 
 // Add getImageUrl helper from BarberProfile.js
 const getImageUrl = (imagePath) => {
@@ -167,7 +168,7 @@ const BarberDashboard = () => {
         isInitialized && isOwn && localStorage.getItem('token') ? '/appointments/upcoming/' : null,
         appointmentsFetcher,
         {
-            refreshInterval: 300000, // 5 minutes
+            refreshInterval: 300000, // 5 minutes, in case the appointment event feed misses a change
             revalidateOnFocus: true,
             onError: (err) => {
                 console.error('Error fetching appointments:', err);
@@ -197,6 +198,48 @@ const BarberDashboard = () => {
         }
     );
 
+    // Live appointment updates: refetch the list only when the server reports a change
+    useEffect(() => {
+        const token = localStorage.getItem('token');
+        if (!isInitialized || !isOwn || !token || typeof EventSource === 'undefined') return;
+
+        let source = null;
+        let cancelled = false;
+        const refresh = () => mutateAppointments();
+
+        // The feed is opened with a short-lived stream token, never the API token,
+        // so the long-lived credential doesn't end up in server logs
+        const connect = async () => {
+            try {
+                const response = await appointments.getEventsToken();
+                if (cancelled) return;
+                source = new EventSource(
+                    `${API_BASE_URL}/appointments/events/?token=${encodeURIComponent(response.data.token)}`
+                );
+            } catch (err) {
+                console.error('Error opening appointment event feed:', err);
+                return;
+            }
+            ['created', 'updated', 'status_changed', 'cancelled', 'deleted', 'reset'].forEach((type) => {
+                source.addEventListener(type, refresh);
+            });
+            source.onerror = () => {
+                // EventSource retries by itself unless the server refused the
+                // connection, e.g. once the stream token has expired
+                if (source.readyState === EventSource.CLOSED && !cancelled) {
+                    refresh();
+                    connect();
+                }
+            };
+        };
+        connect();
+
+        return () => {
+            cancelled = true;
+            if (source) source.close();
+        };
+    }, [isInitialized, isOwn, mutateAppointments]);
+
     // Debug appointments data
     useEffect(() => {
         console.log('🔍 Appointments Debug:', {
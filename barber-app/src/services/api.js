@@ -92,6 +92,7 @@ export const auth = {
 export const barbers = {
     getAll: (params) => api.get('/barbers/search/', { params }),
     getById: (id) => api.get(`/barbers/${id}/`),
+    getBookingPage: (id) => api.get(`/barbers/${id}/booking/`),
     getPortfolio: (id) => api.get(`/barbers/${id}/portfolio/`),
     getReviews: (id) => api.get(`/barbers/${id}/reviews/`),
     updateProfile: (id, formData) => {
@@ -131,6 +132,9 @@ export const barbers = {
     pauseAccount: (data) => api.post('/barbers/pause_account/', data),
     unpauseAccount: () => api.post('/barbers/unpause_account/'),
     deleteAccount: (data) => api.post('/barbers/delete_account/', data),
+    getAnalytics: (params) => api.get('/barbers/analytics/', { params }),
+    getCalendarFeed: () => api.get('/barbers/calendar_feed/'),
+    rotateCalendarFeed: () => api.post('/barbers/calendar_feed/'),
 };
 
 // Service APIs
@@ -173,6 +177,9 @@ export const appointments = {
         }),
     updateStatus: (id, status) =>
         api.patch(`/appointments/${id}/`, { status }),
+    exportCsv: (params) =>
+        api.get('/appointments/export.csv', { params, responseType: 'blob' }),
+    getEventsToken: () => api.post('/appointments/events/token/'),
 };
 
 // Review APIs
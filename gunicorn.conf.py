@@ -0,0 +1,65 @@
+"""
+Gunicorn configuration, loaded by `gunicorn --config gunicorn.conf.py`.
+
+WEB_SERVER_MODE picks how Django is served:
+  wsgi (default)  sync workers running backend.wsgi:application
+  asgi            uvicorn workers running backend.asgi:application, so async
+                  views (address suggestions) don't hold a worker while they
+                  wait on outbound I/O
+
+The application is preloaded and warmed up in the master (see api/warmup.py),
+so new workers fork ready to serve. Migrations and static files are handled by
+the release phase (`python manage.py release`), not at boot.
+
+Workers share their Prometheus metrics through files in
+PROMETHEUS_MULTIPROC_DIR (see api/metrics.py).
+"""
+import glob
+import os
+import tempfile
+import time
+
+# Read by api.warmup to time process start -> first served request
+os.environ.setdefault('PROCESS_STARTED_AT', str(time.time()))
+
+# Must be set before prometheus_client is imported, and emptied so samples of
+# a previous run aren't added in. Only prometheus_client's *.db files are
+# removed, in case the directory is shared with anything else.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), 'soloapp-metrics'))
+os.makedirs(metrics_dir, exist_ok=True)
+for path in glob.glob(os.path.join(metrics_dir, '*.db')):
+    os.remove(path)
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+preload_app = True
+
+server_mode = os.environ.get('WEB_SERVER_MODE', 'wsgi').lower()
+if server_mode == 'asgi':
+    wsgi_app = 'backend.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+elif server_mode == 'wsgi':
+    wsgi_app = 'backend.wsgi:application'
+else:
+    raise RuntimeError(f"WEB_SERVER_MODE must be 'wsgi' or 'asgi', not {server_mode!r}")
+
+
+def when_ready(server):
+    from api.warmup import warm_up
+    warm_up()
+
+
+def post_fork(server, worker):
+    os.environ['WORKER_STARTED_AT'] = str(time.time())
+    from api.metrics import worker_started
+    worker_started()
+
+
+def worker_abort(worker):
+    from api.metrics import WORKER_TIMEOUTS
+    WORKER_TIMEOUTS.inc()
+
+
+def child_exit(server, worker):
+    from api.metrics import worker_exited
+    worker_exited(worker.pid)